@@ -1,10 +1,35 @@
 import os
 import re
 import time
-from typing import Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage
 from langchain_core.runnables import RunnableConfig
+from blob_store import get_blob_store
+from tool_output import limit_output
+
+# 设计结果只需要告诉模型文件名、访问地址和质量检查结果
+DESIGNER_OUTPUT_BUDGET = 200
+
+# 最近生成的网页（文件名 -> 内容哈希和大小），供调用方直接使用内存中的结果，无需重新读盘
+_RECENT_DESIGNS_LIMIT = 16
+_recent_designs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_recent_designs_lock = threading.Lock()
+
+def _remember_generated_blob(filename: str, blob_info: Dict[str, Any]):
+    """记录最近生成的网页内容信息"""
+    with _recent_designs_lock:
+        _recent_designs[filename] = blob_info
+        _recent_designs.move_to_end(filename)
+        while len(_recent_designs) > _RECENT_DESIGNS_LIMIT:
+            _recent_designs.popitem(last=False)
+
+def pop_generated_blob(filename: str) -> Optional[Dict[str, Any]]:
+    """取出指定文件名最近生成网页的内容哈希和大小，不存在时返回None"""
+    with _recent_designs_lock:
+        return _recent_designs.pop(filename, None)
 
 # 需要导入AI模型来进行深度设计
 def get_agent_model():
@@ -61,6 +86,7 @@ def validate_html_completeness(html_content: str) -> tuple[bool, str]:
     return True, "HTML内容完整"
 
 @tool
+@limit_output(DESIGNER_OUTPUT_BUDGET)
 def ai_webpage_designer(description: str) -> str:
     """AI网页设计师 - 让AI模型深度重新设计整个网页模板
     
@@ -167,43 +193,24 @@ def ai_webpage_designer(description: str) -> str:
                 else:
                     print("❌ 已达到最大重试次数，将保存当前结果")
             
-            # 保存生成的网页
+            # 保存生成的网页（按内容哈希压缩存储，相同内容只保存一份）
             output_filename = f"ai_designed_webpage_{hash(description) % 10000}.html"
-            output_path = os.path.join(os.path.dirname(__file__), 'generated_pages', output_filename)
-            
-            # 确保输出目录存在
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(cleaned_html)
+            blob_info = get_blob_store().put_named(output_filename, cleaned_html)
+            _remember_generated_blob(output_filename, blob_info)
             
             # 根据验证结果显示不同的成功信息
             if is_complete:
                 print(f"✅ AI深度设计完成: {output_filename} (通过完整性验证)")
-                quality_status = "✅ 质量检查通过"
+                quality_status = "质量检查: 通过"
             else:
                 print(f"⚠️ AI设计完成但可能不完整: {output_filename} ({validation_msg})")
-                quality_status = f"⚠️ 质量检查: {validation_msg}"
+                quality_status = f"质量检查: {validation_msg}"
             
-            return f"""🎨 AI网页设计师作品完成！
-
-📄 文件名: {output_filename}
-📁 保存路径: generated_pages/{output_filename}
-🌐 访问地址: http://localhost:8080/generated/{output_filename}
-{quality_status}
-
-🤖 AI设计特色:
-- 基于您的需求进行深度重新设计
-- 不是简单的样式修改，而是结构性的创新
-- 充分体现了"{description[:50]}..."的设计理念
-- 保持了所有7个功能区域的完整性
-- 经过 {retry_count + 1} 次生成优化
-
-包含功能:
-🌤️ 天气查询 | 📰 今日新闻 | 🌐 网页浏览 | 🔬 问题研究
-🧮 智能计算 | ⏰ 时间信息 | 📁 文件管理
-
-🎉 这是AI真正的创造性设计作品！"""
+            return f"""AI网页设计完成
+文件名: {output_filename}
+访问地址: http://localhost:8080/generated/{output_filename}
+内容: {blob_info['content_size']} 字节（压缩后 {blob_info['stored_size']} 字节）
+{quality_status}（生成 {retry_count + 1} 次）"""
             
         except Exception as e:
             print(f"❌ 生成失败 (尝试 {retry_count + 1}): {str(e)}")
@@ -217,7 +224,7 @@ def ai_webpage_designer(description: str) -> str:
                 print(f"❌ {error_msg}")
                 return error_msg
     
-    return "❌ 生成失败：已达到最大重试次数"
+    return "生成失败：已达到最大重试次数"
 
 def clean_and_validate_html(html_content: str, description: str) -> str:
     """清理和验证AI生成的HTML代码"""
@@ -2,8 +2,9 @@ import os
 import json
 from datetime import datetime
 from typing import Optional, Dict, Any
-from supabase import create_client, Client
 from dotenv import load_dotenv
+from supabase_pool import get_supabase_pool
+from local_storage import get_storage_backend_name
 
 # 加载环境变量
 load_dotenv()
@@ -12,14 +13,8 @@ class AuthManager:
     """用户认证管理器"""
     
     def __init__(self):
-        """初始化Supabase客户端"""
-        self.supabase_url = os.getenv("SUPABASE_URL")
-        self.supabase_key = os.getenv("SUPABASE_ANON_KEY")
-        
-        if not self.supabase_url or not self.supabase_key:
-            raise ValueError("请在.env文件中配置SUPABASE_URL和SUPABASE_ANON_KEY")
-        
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        """初始化Supabase客户端连接池"""
+        self.pool = get_supabase_pool()
         
         # 初始化数据库表
         self._init_database()
@@ -36,16 +31,17 @@ class AuthManager:
     def register(self, email: str, password: str, username: Optional[str] = None) -> Dict[str, Any]:
         """用户注册"""
         try:
-            # 使用Supabase Auth进行注册
-            response = self.supabase.auth.sign_up({
-                "email": email,
-                "password": password,
-                "options": {
-                    "data": {
-                        "username": username or email.split("@")[0]
+            # 使用Supabase Auth进行注册（注册可能在客户端内保存会话，用完即丢弃）
+            with self.pool.client(discard=True) as client:
+                response = client.auth.sign_up({
+                    "email": email,
+                    "password": password,
+                    "options": {
+                        "data": {
+                            "username": username or email.split("@")[0]
+                        }
                     }
-                }
-            })
+                })
             
             if response.user and response.user.id and response.user.email:
                 return {
@@ -72,10 +68,12 @@ class AuthManager:
     def login(self, email: str, password: str) -> Dict[str, Any]:
         """用户登录"""
         try:
-            response = self.supabase.auth.sign_in_with_password({
-                "email": email,
-                "password": password
-            })
+            # 登录会在客户端内保存用户会话，用完即丢弃，避免影响其他请求
+            with self.pool.client(discard=True) as client:
+                response = client.auth.sign_in_with_password({
+                    "email": email,
+                    "password": password
+                })
             
             if (response.user and response.session and 
                 response.user.id and response.user.email and 
@@ -105,10 +103,12 @@ class AuthManager:
                 "message": f"登录失败: {str(e)}"
             }
     
-    def logout(self) -> Dict[str, Any]:
-        """用户登出"""
+    def logout(self, access_token: Optional[str] = None) -> Dict[str, Any]:
+        """用户登出（按访问令牌注销对应会话）"""
         try:
-            self.supabase.auth.sign_out()
+            if access_token:
+                with self.pool.client() as client:
+                    client.auth.admin.sign_out(access_token)
             return {
                 "success": True,
                 "message": "登出成功"
@@ -122,11 +122,9 @@ class AuthManager:
     def get_current_user(self, access_token: str) -> Optional[Dict[str, Any]]:
         """获取当前用户信息"""
         try:
-            # 设置访问令牌
-            self.supabase.postgrest.auth(access_token)
-            
-            # 获取用户信息
-            response = self.supabase.auth.get_user(access_token)
+            # 获取用户信息（令牌直接随请求传递，不修改共享状态）
+            with self.pool.client() as client:
+                response = client.auth.get_user(access_token)
             
             if (response.user and response.user.id and 
                 response.user.email and response.user.created_at):
@@ -147,7 +145,8 @@ class AuthManager:
     def refresh_session(self, refresh_token: str) -> Dict[str, Any]:
         """刷新用户会话"""
         try:
-            response = self.supabase.auth.refresh_session(refresh_token)
+            with self.pool.client(discard=True) as client:
+                response = client.auth.refresh_session(refresh_token)
             
             if response.session:
                 return {
@@ -172,9 +171,13 @@ class AuthManager:
 # 全局认证管理器实例
 auth_manager = None
 
-def get_auth_manager() -> AuthManager:
-    """获取认证管理器实例"""
+def get_auth_manager():
+    """获取认证管理器实例（STORAGE_BACKEND=sqlite 时使用本地认证）"""
     global auth_manager
     if auth_manager is None:
-        auth_manager = AuthManager()
+        if get_storage_backend_name() == "sqlite":
+            from local_auth import LocalAuthManager
+            auth_manager = LocalAuthManager()
+        else:
+            auth_manager = AuthManager()
     return auth_manager 
\ No newline at end of file
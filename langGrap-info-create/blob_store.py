@@ -0,0 +1,169 @@
+import os
+import re
+import zlib
+import hashlib
+import tempfile
+import threading
+from typing import Optional, Dict, Any, Iterator
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# 生成网页的文件名只允许字母、数字、下划线、连字符和点
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+# 当前使用的压缩格式
+COMPRESSION_ENCODING = 'zstd' if ZSTD_AVAILABLE else 'gzip'
+
+
+def compress_bytes(data: bytes, level: int = 10) -> bytes:
+    """按 COMPRESSION_ENCODING 压缩数据"""
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress_bytes(data: bytes, encoding: str) -> bytes:
+    """解压 compress_bytes 生成的数据"""
+    if encoding == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ValueError("解压zstd数据需要安装zstandard")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if encoding == 'gzip':
+        return zlib.decompress(data, 31)
+    raise ValueError(f"不支持的压缩格式: {encoding}")
+
+
+class BlobStore:
+    """内容寻址的压缩存储
+
+    内容按SHA-256哈希保存为 blobs/<前两位>/<哈希>.zst（未安装zstandard时为.gz），
+    相同内容只保存一份。对外的文件名通过 refs/<文件名> 中记录的哈希指向具体内容。
+    """
+
+    def __init__(self, root_dir: Optional[str] = None, level: int = 10):
+        self.root_dir = root_dir or os.path.join(os.path.dirname(__file__), 'generated_pages')
+        self.blob_dir = os.path.join(self.root_dir, 'blobs')
+        self.ref_dir = os.path.join(self.root_dir, 'refs')
+        self.level = level
+
+        self.encoding = COMPRESSION_ENCODING
+        self.suffix = '.zst' if ZSTD_AVAILABLE else '.gz'
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.ref_dir, exist_ok=True)
+
+    def _compress(self, data: bytes) -> bytes:
+        """压缩数据"""
+        return compress_bytes(data, self.level)
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        """先写临时文件再替换，避免读到写了一半的文件"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _check_name(filename: str):
+        """校验文件名，防止路径穿越"""
+        if not filename or not _SAFE_NAME.match(filename) or filename.startswith('.'):
+            raise ValueError(f"非法文件名: {filename}")
+
+    def blob_path(self, content_hash: str) -> str:
+        """内容哈希对应的压缩文件路径"""
+        return os.path.join(self.blob_dir, content_hash[:2], content_hash + self.suffix)
+
+    def put(self, data: bytes) -> Dict[str, Any]:
+        """保存内容，已存在相同内容时直接复用"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._atomic_write(path, self._compress(data))
+        return {
+            "content_hash": content_hash,
+            "content_size": len(data),
+            "stored_size": os.path.getsize(path)
+        }
+
+    def put_named(self, filename: str, text: str) -> Dict[str, Any]:
+        """保存文本内容并让文件名指向它"""
+        self._check_name(filename)
+        info = self.put(text.encode('utf-8'))
+        ref = f"{info['content_hash']} {info['content_size']}"
+        self._atomic_write(os.path.join(self.ref_dir, filename), ref.encode('ascii'))
+        return info
+
+    def resolve(self, filename: str) -> Optional[Dict[str, Any]]:
+        """根据文件名查找内容哈希和原始大小，不存在时返回None"""
+        try:
+            self._check_name(filename)
+            with open(os.path.join(self.ref_dir, filename), 'r', encoding='ascii') as f:
+                content_hash, content_size = f.read().split()
+        except (ValueError, OSError):
+            return None
+        if not os.path.exists(self.blob_path(content_hash)):
+            return None
+        return {"content_hash": content_hash, "content_size": int(content_size)}
+
+    def iter_decompressed(self, content_hash: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """流式读取解压后的内容"""
+        with open(self.blob_path(content_hash), 'rb') as f:
+            if ZSTD_AVAILABLE:
+                reader = zstandard.ZstdDecompressor().stream_reader(f)
+                while True:
+                    chunk = reader.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            else:
+                decompressor = zlib.decompressobj(31)
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    data = decompressor.decompress(chunk)
+                    if data:
+                        yield data
+                tail = decompressor.flush()
+                if tail:
+                    yield tail
+
+    def read_text(self, filename: str) -> Optional[str]:
+        """读取文件名对应的完整文本"""
+        ref = self.resolve(filename)
+        if not ref:
+            return None
+        return self.read_blob_text(ref["content_hash"])
+
+    def read_blob_text(self, content_hash: str) -> Optional[str]:
+        """按内容哈希读取完整文本，内容不存在时返回None"""
+        if not content_hash or not re.match(r'^[0-9a-f]{64}$', content_hash):
+            return None
+        if not os.path.exists(self.blob_path(content_hash)):
+            return None
+        return b''.join(self.iter_decompressed(content_hash)).decode('utf-8')
+
+
+# 全局存储实例
+blob_store = None
+_blob_store_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    """获取网页内容存储实例"""
+    global blob_store
+    with _blob_store_lock:
+        if blob_store is None:
+            blob_store = BlobStore()
+    return blob_store
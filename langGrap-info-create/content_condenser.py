@@ -0,0 +1,160 @@
+import re
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+from text_utils import tokenize, estimate_tokens, bm25_scores
+
+# 导航、页脚、订阅提示等常见的样板文字
+_BOILERPLATE_RE = re.compile(
+    r'(cookie|privacy policy|terms of (use|service)|all rights reserved|subscribe|sign in|sign up|'
+    r'log in|newsletter|advertisement|share this|follow us|skip to (main )?content|'
+    r'版权所有|隐私政策|用户协议|免责声明|登录|注册|订阅|分享到|关注我们|广告|返回顶部|上一篇|下一篇|扫码)',
+    re.IGNORECASE
+)
+_MARKDOWN_IMAGE_RE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+_MARKDOWN_LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_BARE_URL_RE = re.compile(r'https?://\S+')
+_SENTENCE_END_RE = re.compile(r'(?<=[。！？!?；;])|(?<=\.)\s+')
+_WORD_RE = re.compile(r'\w')
+
+
+def strip_boilerplate(text: str) -> str:
+    """去掉网页正文中的图片、链接地址、导航菜单、页脚等样板内容和重复行"""
+    text = _MARKDOWN_IMAGE_RE.sub('', text or '')
+    text = _MARKDOWN_LINK_RE.sub(r'\1', text)
+    text = _BARE_URL_RE.sub('', text)
+
+    lines = []
+    seen = set()
+    for line in text.splitlines():
+        line = line.strip(' \t#*>-|')
+        if not line:
+            lines.append('')
+            continue
+        # 很短的行多为菜单项，包含样板关键词的短行多为页脚或提示
+        if len(_WORD_RE.findall(line)) < 4:
+            continue
+        if len(line) < 80 and _BOILERPLATE_RE.search(line):
+            continue
+        # 按 | 分隔的多个短项一般是导航栏
+        if line.count('|') >= 3:
+            continue
+        if line in seen:
+            continue
+        seen.add(line)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def split_passages(text: str, max_chars: int = 600, min_chars: int = 80) -> List[str]:
+    """按段落切分文本，过短的段落与后续合并，过长的段落按句子拆分"""
+    passages = []
+    current = ''
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = ' '.join(paragraph.split())
+        if not paragraph:
+            continue
+        pieces = [paragraph]
+        if len(paragraph) > max_chars:
+            pieces = []
+            piece = ''
+            for sentence in _SENTENCE_END_RE.split(paragraph):
+                if piece and len(piece) + len(sentence) > max_chars:
+                    pieces.append(piece.strip())
+                    piece = ''
+                piece += sentence
+            if piece.strip():
+                pieces.append(piece.strip())
+        for piece in pieces:
+            current = f"{current} {piece}".strip() if current else piece
+            if len(current) >= min_chars:
+                passages.append(current[:max_chars * 2])
+                current = ''
+    if current:
+        passages.append(current)
+    return passages
+
+
+class ContentCondenser:
+    """工具结果中原始网页内容的精简
+
+    对 raw_content 去除样板内容后切分为段落，把本次调用所有页面的段落放在一起按BM25与查询排序，
+    在token预算内保留得分最高的段落（各页面内保持原有顺序）。没有查询时保留每个页面开头的段落。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "tokens_before": 0, "tokens_after": 0}
+
+    def condense(self, result: Dict[str, Any], query: Optional[str],
+                 token_budget: int) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """精简结果中各条目的 raw_content，返回新的结果和token统计"""
+        items = result.get("results") or []
+        tokens_before = sum(estimate_tokens(item.get("raw_content")) for item in items)
+
+        # (条目序号, 段落序号, 段落)
+        candidates: List[Tuple[int, int, str]] = []
+        for item_index, item in enumerate(items):
+            for passage_index, passage in enumerate(split_passages(strip_boilerplate(item.get("raw_content")))):
+                candidates.append((item_index, passage_index, passage))
+
+        query_terms = tokenize(query) if query else []
+        if query_terms:
+            scores = bm25_scores(query_terms, [tokenize(passage) for _, _, passage in candidates])
+        else:
+            scores = [0.0] * len(candidates)
+        # 得分相同时靠前的段落优先
+        order = sorted(range(len(candidates)), key=lambda i: (-scores[i], candidates[i][1], candidates[i][0]))
+
+        selected = []
+        used = 0
+        for i in order:
+            if query_terms and scores[i] <= 0 and selected:
+                break
+            cost = estimate_tokens(candidates[i][2])
+            if used + cost > token_budget:
+                continue
+            selected.append(i)
+            used += cost
+
+        kept: Dict[int, List[Tuple[int, str]]] = {}
+        for i in selected:
+            item_index, passage_index, passage = candidates[i]
+            kept.setdefault(item_index, []).append((passage_index, passage))
+
+        condensed_items = []
+        for item_index, item in enumerate(items):
+            item = {name: value for name, value in item.items() if name != "raw_content"}
+            if item_index in kept:
+                item["raw_content"] = "\n\n".join(passage for _, passage in sorted(kept[item_index]))
+            condensed_items.append(item)
+
+        stats = {
+            "tokens_before": tokens_before,
+            "tokens_after": used,
+            "tokens_saved": max(tokens_before - used, 0)
+        }
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["tokens_before"] += tokens_before
+            self._stats["tokens_after"] += used
+        return {**result, "results": condensed_items}, stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        """累计精简效果"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["tokens_saved"] = max(stats["tokens_before"] - stats["tokens_after"], 0)
+        return stats
+
+
+# 全局内容精简实例
+content_condenser = None
+_content_condenser_lock = threading.Lock()
+
+def get_content_condenser() -> ContentCondenser:
+    """获取内容精简实例"""
+    global content_condenser
+    with _content_condenser_lock:
+        if content_condenser is None:
+            content_condenser = ContentCondenser()
+    return content_condenser
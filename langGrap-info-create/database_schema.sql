@@ -23,14 +23,28 @@ CREATE TABLE IF NOT EXISTS webpage_generations (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- 列表接口使用的预览/大小列（由数据库自动生成，列表查询无需读取完整内容）
+ALTER TABLE prompt_history
+    ADD COLUMN IF NOT EXISTS response_preview TEXT GENERATED ALWAYS AS (left(response, 200)) STORED;
+ALTER TABLE prompt_history
+    ADD COLUMN IF NOT EXISTS response_length INTEGER GENERATED ALWAYS AS (char_length(response)) STORED;
+ALTER TABLE webpage_generations
+    ADD COLUMN IF NOT EXISTS html_size INTEGER GENERATED ALWAYS AS (octet_length(html_content)) STORED;
+
 -- 创建索引以提高查询性能
-CREATE INDEX IF NOT EXISTS idx_prompt_history_user_id ON prompt_history(user_id);
-CREATE INDEX IF NOT EXISTS idx_prompt_history_created_at ON prompt_history(created_at DESC);
-CREATE INDEX IF NOT EXISTS idx_prompt_history_type ON prompt_history(prompt_type);
+-- 历史记录按 (created_at, id) 键集分页，复合索引让每一页都是一次索引范围扫描
+CREATE INDEX IF NOT EXISTS idx_prompt_history_user_created ON prompt_history(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_prompt_history_user_type_created ON prompt_history(user_id, prompt_type, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_webpage_generations_user_created ON webpage_generations(user_id, created_at DESC, id DESC);
 
-CREATE INDEX IF NOT EXISTS idx_webpage_generations_user_id ON webpage_generations(user_id);
-CREATE INDEX IF NOT EXISTS idx_webpage_generations_created_at ON webpage_generations(created_at DESC);
-CREATE INDEX IF NOT EXISTS idx_webpage_generations_type ON webpage_generations(design_type);
+-- 旧的单列索引已被上面的复合索引覆盖
+DROP INDEX IF EXISTS idx_prompt_history_user_id;
+DROP INDEX IF EXISTS idx_prompt_history_created_at;
+DROP INDEX IF EXISTS idx_prompt_history_type;
+DROP INDEX IF EXISTS idx_webpage_generations_user_id;
+DROP INDEX IF EXISTS idx_webpage_generations_created_at;
+DROP INDEX IF EXISTS idx_webpage_generations_type;
 
 -- 设置行级安全策略 (RLS)
 ALTER TABLE prompt_history ENABLE ROW LEVEL SECURITY;
@@ -48,4 +62,310 @@ CREATE POLICY "Authenticated users can insert prompt history" ON prompt_history
     FOR INSERT WITH CHECK (auth.uid() = user_id);
 
 CREATE POLICY "Authenticated users can insert webpage generations" ON webpage_generations
-    FOR INSERT WITH CHECK (auth.uid() = user_id); 
\ No newline at end of file
+    FOR INSERT WITH CHECK (auth.uid() = user_id); 
+
+-- 用户历史记录计数表（由触发器维护，统计接口只需读取少量计数行）
+CREATE TABLE IF NOT EXISTS user_history_counters (
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    source VARCHAR(20) NOT NULL,      -- 'prompt' 或 'webpage'
+    item_type VARCHAR(50) NOT NULL,   -- prompt_type 或 design_type
+    item_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, source, item_type)
+);
+
+ALTER TABLE user_history_counters ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can read their own history counters" ON user_history_counters
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- 语句级触发器函数：按用户和类型聚合本条语句插入/删除的行，再一次性更新计数
+-- TG_ARGV[0] 为来源名称，TG_ARGV[1] 为类型字段名
+CREATE OR REPLACE FUNCTION update_user_history_counters() RETURNS TRIGGER
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+BEGIN
+    -- 归档任务把记录从热表移到归档表，这种删除不减少计数
+    IF TG_OP = 'DELETE' AND TG_TABLE_NAME = 'prompt_history'
+       AND current_setting('app.archiving_history', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO user_history_counters (user_id, source, item_type, item_count)
+        SELECT r.user_id, TG_ARGV[0], COALESCE(to_jsonb(r) ->> TG_ARGV[1], 'unknown'), COUNT(*)
+        FROM new_rows r
+        GROUP BY r.user_id, COALESCE(to_jsonb(r) ->> TG_ARGV[1], 'unknown')
+        ON CONFLICT (user_id, source, item_type)
+        DO UPDATE SET item_count = user_history_counters.item_count + EXCLUDED.item_count;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE user_history_counters c
+        SET item_count = GREATEST(c.item_count - d.row_count, 0)
+        FROM (
+            SELECT r.user_id, COALESCE(to_jsonb(r) ->> TG_ARGV[1], 'unknown') AS item_type, COUNT(*) AS row_count
+            FROM old_rows r
+            GROUP BY 1, 2
+        ) d
+        WHERE c.user_id = d.user_id AND c.source = TG_ARGV[0] AND c.item_type = d.item_type;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_prompt_history_count_insert ON prompt_history;
+CREATE TRIGGER trg_prompt_history_count_insert
+    AFTER INSERT ON prompt_history
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_user_history_counters('prompt', 'prompt_type');
+
+DROP TRIGGER IF EXISTS trg_prompt_history_count_delete ON prompt_history;
+CREATE TRIGGER trg_prompt_history_count_delete
+    AFTER DELETE ON prompt_history
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_user_history_counters('prompt', 'prompt_type');
+
+DROP TRIGGER IF EXISTS trg_webpage_generations_count_insert ON webpage_generations;
+CREATE TRIGGER trg_webpage_generations_count_insert
+    AFTER INSERT ON webpage_generations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_user_history_counters('webpage', 'design_type');
+
+DROP TRIGGER IF EXISTS trg_webpage_generations_count_delete ON webpage_generations;
+CREATE TRIGGER trg_webpage_generations_count_delete
+    AFTER DELETE ON webpage_generations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_user_history_counters('webpage', 'design_type');
+
+-- 用已有数据初始化计数（可重复执行）
+INSERT INTO user_history_counters (user_id, source, item_type, item_count)
+SELECT user_id, 'prompt', COALESCE(prompt_type, 'unknown'), COUNT(*)
+FROM prompt_history GROUP BY 1, 3
+ON CONFLICT (user_id, source, item_type) DO UPDATE SET item_count = EXCLUDED.item_count;
+
+INSERT INTO user_history_counters (user_id, source, item_type, item_count)
+SELECT user_id, 'webpage', COALESCE(design_type, 'unknown'), COUNT(*)
+FROM webpage_generations GROUP BY 1, 3
+ON CONFLICT (user_id, source, item_type) DO UPDATE SET item_count = EXCLUDED.item_count;
+
+
+-- 生成的网页以内容哈希为键压缩保存在应用的内容存储中，数据库只记录哈希和原始大小
+-- （html_content 仅保留给早期记录）
+ALTER TABLE webpage_generations ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+ALTER TABLE webpage_generations ADD COLUMN IF NOT EXISTS content_size INTEGER;
+
+
+-- 全文搜索
+-- 中文没有空格分词，这里把连续的中文按相邻两字（二元组）切分后再交给 simple 配置建立 tsvector，
+-- 规则与应用中的 text_utils.tokenize() 一致
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE OR REPLACE FUNCTION cjk_bigram_text(input TEXT) RETURNS TEXT
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    run TEXT;
+    result TEXT;
+    i INT;
+BEGIN
+    IF input IS NULL THEN
+        RETURN '';
+    END IF;
+    -- 非中文部分保持原样，由 simple 解析器按空白和标点切分
+    result := regexp_replace(lower(input), '[㐀-䶿一-鿿豈-﫿]+', ' ', 'g');
+    FOR run IN SELECT (regexp_matches(input, '[㐀-䶿一-鿿豈-﫿]+', 'g'))[1] LOOP
+        IF char_length(run) = 1 THEN
+            result := result || ' ' || run;
+        ELSE
+            FOR i IN 1 .. char_length(run) - 1 LOOP
+                result := result || ' ' || substr(run, i, 2);
+            END LOOP;
+        END IF;
+    END LOOP;
+    RETURN result;
+END;
+$$;
+
+ALTER TABLE prompt_history ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', cjk_bigram_text(prompt)), 'A') ||
+        setweight(to_tsvector('simple', cjk_bigram_text(left(response, 20000))), 'B')
+    ) STORED;
+
+ALTER TABLE webpage_generations ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', cjk_bigram_text(prompt))) STORED;
+
+-- (user_id, search_vector) 复合GIN索引：先按用户缩小范围，再做全文匹配
+CREATE INDEX IF NOT EXISTS idx_prompt_history_search ON prompt_history USING GIN (user_id, search_vector);
+CREATE INDEX IF NOT EXISTS idx_webpage_generations_search ON webpage_generations USING GIN (user_id, search_vector);
+
+
+
+-- 提示词历史分层保留
+-- 热表 prompt_history 只保留最近的记录，更早的记录由 compact_prompt_history() 移到归档表。
+-- 归档表的回复列使用lz4压缩（PostgreSQL 14+），并降低toast_tuple_target让较短的回复也会被压缩
+CREATE TABLE IF NOT EXISTS prompt_history_archive (
+    id BIGINT PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    prompt_type VARCHAR(50),
+    model_type VARCHAR(50),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    response_preview TEXT GENERATED ALWAYS AS (left(response, 200)) STORED,
+    response_length INTEGER GENERATED ALWAYS AS (char_length(response)) STORED
+) WITH (toast_tuple_target = 256);
+
+ALTER TABLE prompt_history_archive ALTER COLUMN response SET COMPRESSION lz4;
+
+CREATE INDEX IF NOT EXISTS idx_prompt_history_archive_user_created ON prompt_history_archive(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_prompt_history_archive_created ON prompt_history_archive(created_at);
+
+ALTER TABLE prompt_history_archive ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can only access their own archived prompt history" ON prompt_history_archive
+    FOR ALL USING (auth.uid() = user_id);
+
+-- 删除归档记录（用户删除或超过归档保留期）时减少计数
+DROP TRIGGER IF EXISTS trg_prompt_history_archive_count_delete ON prompt_history_archive;
+CREATE TRIGGER trg_prompt_history_archive_count_delete
+    AFTER DELETE ON prompt_history_archive
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_user_history_counters('prompt', 'prompt_type');
+
+-- 归档记录与热表使用相同的全文检索列和索引，搜索时一起查询
+ALTER TABLE prompt_history_archive ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', cjk_bigram_text(prompt)), 'A') ||
+        setweight(to_tsvector('simple', cjk_bigram_text(left(response, 20000))), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_prompt_history_archive_search ON prompt_history_archive USING GIN (user_id, search_vector);
+
+-- 搜索当前用户的历史记录（包括归档的提示词记录），按相关度排序，excerpt 为回复中 p_anchor 附近的原文
+CREATE OR REPLACE FUNCTION search_user_history(p_query TEXT, p_anchor TEXT DEFAULT '', p_limit INT DEFAULT 20)
+RETURNS TABLE (
+    source TEXT,
+    id BIGINT,
+    item_type VARCHAR,
+    created_at TIMESTAMP WITH TIME ZONE,
+    rank REAL,
+    prompt TEXT,
+    excerpt TEXT
+)
+LANGUAGE sql STABLE SECURITY INVOKER AS $$
+    WITH q AS (
+        SELECT plainto_tsquery('simple', cjk_bigram_text(p_query)) AS query
+    )
+    SELECT * FROM (
+        (SELECT 'prompt'::TEXT, p.id, p.prompt_type, p.created_at,
+                ts_rank(p.search_vector, q.query) AS rank,
+                left(p.prompt, 300),
+                substr(p.response, greatest(strpos(lower(p.response), lower(p_anchor)) - 80, 1), 240)
+         FROM prompt_history p, q
+         WHERE p.user_id = auth.uid() AND p.search_vector @@ q.query
+         ORDER BY rank DESC
+         LIMIT p_limit)
+        UNION ALL
+        (SELECT 'prompt'::TEXT, a.id, a.prompt_type, a.created_at,
+                ts_rank(a.search_vector, q.query) AS rank,
+                left(a.prompt, 300),
+                substr(a.response, greatest(strpos(lower(a.response), lower(p_anchor)) - 80, 1), 240)
+         FROM prompt_history_archive a, q
+         WHERE a.user_id = auth.uid() AND a.search_vector @@ q.query
+         ORDER BY rank DESC
+         LIMIT p_limit)
+        UNION ALL
+        (SELECT 'webpage'::TEXT, w.id, w.design_type, w.created_at,
+                ts_rank(w.search_vector, q.query) AS rank,
+                left(w.prompt, 300),
+                NULL::TEXT
+         FROM webpage_generations w, q
+         WHERE w.user_id = auth.uid() AND w.search_vector @@ q.query
+         ORDER BY rank DESC
+         LIMIT p_limit)
+    ) results
+    ORDER BY 5 DESC
+    LIMIT p_limit;
+$$;
+
+-- 压缩归档任务：把早于 p_hot_days 天的记录分批移到归档表，
+-- p_retention_days > 0 时删除早于该天数的归档记录，返回处理行数和空间变化（字节）。
+-- 热表释放的空间由autovacuum回收后可重新使用
+CREATE OR REPLACE FUNCTION compact_prompt_history(
+    p_hot_days INT DEFAULT 30,
+    p_retention_days INT DEFAULT 0,
+    p_batch_size INT DEFAULT 1000
+)
+RETURNS TABLE (
+    archived_rows BIGINT,
+    purged_rows BIGINT,
+    moved_bytes BIGINT,
+    archived_bytes BIGINT,
+    purged_bytes BIGINT,
+    reclaimed_bytes BIGINT
+)
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+DECLARE
+    v_ids BIGINT[];
+    v_batch_rows BIGINT;
+    v_batch_bytes BIGINT;
+BEGIN
+    archived_rows := 0;
+    purged_rows := 0;
+    moved_bytes := 0;
+    archived_bytes := 0;
+    purged_bytes := 0;
+
+    PERFORM set_config('app.archiving_history', 'on', true);
+
+    LOOP
+        WITH moved AS (
+            DELETE FROM prompt_history
+            WHERE id IN (
+                SELECT id FROM prompt_history
+                WHERE created_at < NOW() - make_interval(days => p_hot_days)
+                ORDER BY created_at, id
+                LIMIT p_batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_id, prompt, response, prompt_type, model_type, created_at,
+                      pg_column_size(response) AS stored_size
+        ), inserted AS (
+            INSERT INTO prompt_history_archive (id, user_id, prompt, response, prompt_type, model_type, created_at)
+            SELECT id, user_id, prompt, response, prompt_type, model_type, created_at FROM moved
+            RETURNING id
+        )
+        SELECT array_agg(i.id), COUNT(*), COALESCE(SUM(m.stored_size), 0)
+        INTO v_ids, v_batch_rows, v_batch_bytes
+        FROM inserted i JOIN moved m ON m.id = i.id;
+
+        EXIT WHEN v_batch_rows = 0;
+
+        archived_rows := archived_rows + v_batch_rows;
+        moved_bytes := moved_bytes + v_batch_bytes;
+        archived_bytes := archived_bytes + (
+            SELECT COALESCE(SUM(pg_column_size(response)), 0)
+            FROM prompt_history_archive WHERE id = ANY(v_ids)
+        );
+    END LOOP;
+
+    PERFORM set_config('app.archiving_history', 'off', true);
+
+    IF p_retention_days > 0 THEN
+        WITH purged AS (
+            DELETE FROM prompt_history_archive
+            WHERE created_at < NOW() - make_interval(days => p_retention_days)
+            RETURNING pg_column_size(response) AS stored_size
+        )
+        SELECT COUNT(*), COALESCE(SUM(stored_size), 0) INTO purged_rows, purged_bytes FROM purged;
+    END IF;
+
+    reclaimed_bytes := moved_bytes - archived_bytes + purged_bytes;
+    RETURN NEXT;
+END;
+$$;
+
+-- 归档任务会跨用户处理数据，只允许service_role调用
+REVOKE EXECUTE ON FUNCTION compact_prompt_history(INT, INT, INT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION compact_prompt_history(INT, INT, INT) TO service_role;
+
+-- 也可以不在应用中运行归档任务，改用pg_cron在数据库中定时执行，例如每天凌晨3点：
+-- SELECT cron.schedule('compact-prompt-history', '0 3 * * *', $$SELECT * FROM compact_prompt_history(30, 365)$$);
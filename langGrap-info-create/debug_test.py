@@ -104,10 +104,12 @@ def test_history_manager():
         print("\n🔍 检查实际数据库中的用户记录...")
         try:
             # 查询实际的用户记录
-            all_prompts = history_manager.supabase.table("prompt_history").select("user_id, prompt, created_at").limit(5).execute()
+            from supabase_pool import get_supabase_pool
+            with get_supabase_pool().client() as client:
+                all_prompts = client.table("prompt_history").select("user_id, prompt, created_at").limit(5).execute()
+                all_webpages = client.table("webpage_generations").select("user_id, prompt, filename, created_at").limit(5).execute()
             print(f"📊 数据库中总提示词记录: {len(all_prompts.data) if all_prompts.data else 0}")
             
-            all_webpages = history_manager.supabase.table("webpage_generations").select("user_id, prompt, filename, created_at").limit(5).execute()
             print(f"🌐 数据库中总网页记录: {len(all_webpages.data) if all_webpages.data else 0}")
             
             if all_prompts.data:
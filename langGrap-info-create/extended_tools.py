@@ -7,8 +7,16 @@ import psutil
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any, List, Optional
 from langchain_core.tools import tool
+from tool_output import limit_output
+
+# 各工具输出的token预算（超出时截断，避免大文件或长输出占满上下文）
+CALCULATOR_OUTPUT_BUDGET = 200
+DATETIME_OUTPUT_BUDGET = 300
+FILE_OUTPUT_BUDGET = 1500
+SYSTEM_INFO_OUTPUT_BUDGET = 600
 
 @tool
+@limit_output(CALCULATOR_OUTPUT_BUDGET)
 def calculator(expression: str) -> str:
     """执行数学计算，支持基础运算、三角函数、对数等。
     
@@ -43,6 +51,7 @@ def calculator(expression: str) -> str:
         return error_msg
 
 @tool
+@limit_output(DATETIME_OUTPUT_BUDGET)
 def get_datetime(query: str = "current") -> str:
     """获取当前时间、日期信息或进行时间查询。
     
@@ -55,12 +64,12 @@ def get_datetime(query: str = "current") -> str:
         
         if query.lower() in ["current", "now", "现在"]:
             result = f"""当前时间信息:
-📅 日期: {now.strftime('%Y年%m月%d日')} ({now.strftime('%A')})
-🕐 时间: {now.strftime('%H:%M:%S')}
-🌍 时区: {now.astimezone().tzname()}
-📊 详细: {now.strftime('%Y-%m-%d %H:%M:%S %Z')}
-🗓️ 星期: {now.strftime('%A')} (第{now.isocalendar()[1]}周)
-🌙 今年第{now.timetuple().tm_yday}天"""
+日期: {now.strftime('%Y年%m月%d日')} ({now.strftime('%A')})
+时间: {now.strftime('%H:%M:%S')}
+时区: {now.astimezone().tzname()}
+详细: {now.strftime('%Y-%m-%d %H:%M:%S %Z')}
+星期: {now.strftime('%A')} (第{now.isocalendar()[1]}周)
+今年第{now.timetuple().tm_yday}天"""
         
         elif "format" in query.lower():
             # 提供多种格式
@@ -84,6 +93,7 @@ ISO格式: {now.isoformat()}
         return error_msg
 
 @tool
+@limit_output(FILE_OUTPUT_BUDGET)
 def file_operations(operation: str) -> str:
     """文件操作工具：读取文件内容、写入文件、列出目录。
     
@@ -109,12 +119,8 @@ def file_operations(operation: str) -> str:
             with open(path, 'r', encoding='utf-8') as f:
                 content = f.read()
             
-            # 限制输出长度
-            if len(content) > 2000:
-                content = content[:2000] + "\\n...(内容过长，已截断)"
-            
             print(f"✅ 文件读取完成: {path}")
-            return f"文件内容 ({path}):  \\n{content}"
+            return f"文件内容 ({path}):\n{content}"
         
         elif action == "list":
             if not os.path.exists(path):
@@ -127,13 +133,13 @@ def file_operations(operation: str) -> str:
             for item in sorted(os.listdir(path)):
                 item_path = os.path.join(path, item)
                 if os.path.isdir(item_path):
-                    items.append(f"📁 {item}/")
+                    items.append(f"{item}/")
                 else:
                     size = os.path.getsize(item_path)
-                    items.append(f"📄 {item} ({_format_size(size)})")
+                    items.append(f"{item} ({_format_size(size)})")
             
             print(f"✅ 目录列表获取完成: {path}")
-            return f"目录内容 ({path}):\\n" + "\\n".join(items[:50])  # 限制显示50个
+            return f"目录内容 ({path}):\n" + "\n".join(items[:50])  # 限制显示50个
         
         elif action == "write":
             if len(parts) < 3:
@@ -148,7 +154,7 @@ def file_operations(operation: str) -> str:
                 f.write(content)
             
             print(f"✅ 文件写入完成: {path}")
-            return f"已写入文件: {path}\\n内容长度: {len(content)} 字符"
+            return f"已写入文件: {path}\n内容长度: {len(content)} 字符"
         
         else:
             return f"不支持的操作: {action}。支持的操作: read, list, write"
@@ -170,6 +176,7 @@ def _format_size(size_bytes):
         return f"{size_bytes/(1024**3):.1f}GB"
 
 @tool
+@limit_output(SYSTEM_INFO_OUTPUT_BUDGET)
 def get_system_info(info_type: str = "all") -> str:
     """获取系统信息：操作系统、内存、CPU、Python版本等。
     
@@ -183,7 +190,7 @@ def get_system_info(info_type: str = "all") -> str:
         result_parts = []
         
         if info_type in ["os", "all"]:
-            os_info = f"""🖥️ 操作系统信息:
+            os_info = f"""操作系统信息:
 系统: {platform.system()} {platform.release()}
 版本: {platform.version()}
 架构: {platform.machine()}
@@ -193,7 +200,7 @@ def get_system_info(info_type: str = "all") -> str:
         
         if info_type in ["memory", "all"]:
             memory = psutil.virtual_memory()
-            memory_info = f"""💾 内存信息:
+            memory_info = f"""内存信息:
 总内存: {_format_bytes(memory.total)}
 已使用: {_format_bytes(memory.used)} ({memory.percent:.1f}%)
 可用: {_format_bytes(memory.available)}
@@ -201,14 +208,14 @@ def get_system_info(info_type: str = "all") -> str:
             result_parts.append(memory_info)
         
         if info_type in ["cpu", "all"]:
-            cpu_info = f"""⚡ CPU信息:
+            cpu_info = f"""CPU信息:
 CPU核心: {psutil.cpu_count()} 物理核心, {psutil.cpu_count(logical=True)} 逻辑核心
 CPU使用率: {psutil.cpu_percent(interval=1):.1f}%
 负载平均: {os.getloadavg() if hasattr(os, 'getloadavg') else '不可用'}"""
             result_parts.append(cpu_info)
         
         if info_type in ["python", "all"]:
-            python_info = f"""🐍 Python信息:
+            python_info = f"""Python信息:
 Python版本: {platform.python_version()}
 Python实现: {platform.python_implementation()}
 编译器: {platform.python_compiler()}"""
@@ -217,7 +224,7 @@ Python实现: {platform.python_implementation()}
         if not result_parts:
             return f"不支持的信息类型: {info_type}。支持: os, memory, cpu, python, all"
         
-        result = "\\n\\n".join(result_parts)
+        result = "\n\n".join(result_parts)
         print(f"✅ 系统信息获取完成")
         return result
         
@@ -0,0 +1,321 @@
+import os
+import math
+import time
+import threading
+from array import array
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from dotenv import load_dotenv
+from cache_utils import TTLCache
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# 加载环境变量
+load_dotenv()
+
+# 已加载列数据的缓存时间（秒），过期后重新全量加载（反映删除和归档清理）
+ANALYTICS_CACHE_TTL = float(os.getenv("HISTORY_ANALYTICS_CACHE_TTL", "600"))
+# 单个用户最多加载的记录数
+ANALYTICS_MAX_ROWS = int(os.getenv("HISTORY_ANALYTICS_MAX_ROWS", "100000"))
+
+ANALYTICS_COLUMNS = "id, created_at, model_type, response_length"
+ANALYTICS_PAGE_SIZE = 1000
+GRANULARITY_SECONDS = {"hour": 3600, "day": 86400}
+PERCENTILES = (50, 90, 95, 99)
+# 回复长度分布的区间上界（字符数），最后一个区间不设上限
+LENGTH_BIN_EDGES = (200, 500, 1000, 2000, 5000, 10000, 20000)
+
+
+def _parse_timestamp(value: str) -> float:
+    """解析数据库返回的时间，没有时区信息时按UTC处理"""
+    moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值计算百分位数（与numpy.percentile默认方式一致）"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class HistoryColumns:
+    """一个用户的历史记录列数据
+
+    每列保存为紧凑的数组：时间戳（秒）、模型类型编码、回复长度。
+    newest 为已加载的最新记录位置 (时间戳, id)，用于增量加载之后的新记录。
+    """
+
+    def __init__(self, since: float):
+        self.since = since
+        self.timestamps = array("d")
+        self.models = array("h")
+        self.lengths = array("q")
+        self.ids = set()
+        self.newest: Optional[Tuple[float, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def snapshot(self) -> "HistoryColumns":
+        """复制三列数组（不含ids），缓存中的列之后继续追加也不影响快照"""
+        copy = HistoryColumns(self.since)
+        copy.timestamps = array("d", self.timestamps)
+        copy.models = array("h", self.models)
+        copy.lengths = array("q", self.lengths)
+        copy.newest = self.newest
+        return copy
+
+
+class HistoryAnalytics:
+    """用户使用情况分析
+
+    按时间窗口加载提示词记录的少量列，按小时或天分桶统计活跃度、模型类型占比，
+    并计算回复长度的百分位数和分布。列数据按用户缓存，再次请求时只加载之后新增的记录。
+    安装了NumPy时使用向量化计算，否则使用纯Python实现，结果相同。
+    """
+
+    def __init__(self, history_manager=None):
+        self._history_manager = history_manager
+        self._columns_cache = TTLCache(ttl=ANALYTICS_CACHE_TTL, maxsize=256)
+        self._user_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._model_codes: Dict[str, int] = {}
+        self._model_names: List[str] = []
+
+    @property
+    def history_manager(self):
+        """延迟获取历史记录管理器，避免导入时就连接数据库"""
+        if self._history_manager is None:
+            from history_manager import get_history_manager
+            self._history_manager = get_history_manager()
+        return self._history_manager
+
+    def _model_code(self, model_type: Optional[str]) -> int:
+        """模型类型名称对应的编码"""
+        name = model_type or "unknown"
+        with self._lock:
+            code = self._model_codes.get(name)
+            if code is None:
+                code = len(self._model_names)
+                self._model_codes[name] = code
+                self._model_names.append(name)
+            return code
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+    def _scan(self, columns: HistoryColumns, user_id: str, access_token: Optional[str],
+              stop_at: Optional[Tuple[float, int]] = None):
+        """按时间倒序读取记录追加到列数据，早于since或到达stop_at时停止"""
+        backend = self.history_manager.backend
+        for table_name in ("prompt_history", "prompt_history_archive"):
+            after = None
+            while len(columns) < ANALYTICS_MAX_ROWS:
+                rows = backend.list_records(
+                    table_name, user_id, ANALYTICS_COLUMNS, None, after,
+                    ANALYTICS_PAGE_SIZE, access_token
+                )
+                for row in rows:
+                    timestamp = _parse_timestamp(row["created_at"])
+                    if timestamp < columns.since or (stop_at and (timestamp, row["id"]) <= stop_at):
+                        return
+                    if row["id"] in columns.ids:
+                        continue
+                    columns.ids.add(row["id"])
+                    columns.timestamps.append(timestamp)
+                    columns.models.append(self._model_code(row.get("model_type")))
+                    columns.lengths.append(row.get("response_length") or 0)
+                    if columns.newest is None or (timestamp, row["id"]) > columns.newest:
+                        columns.newest = (timestamp, row["id"])
+                if len(rows) < ANALYTICS_PAGE_SIZE:
+                    break
+                after = (rows[-1]["created_at"], rows[-1]["id"])
+
+    def load_columns(self, user_id: str, since: float,
+                     access_token: Optional[str] = None) -> HistoryColumns:
+        """获取覆盖since之后时间段的列数据，已缓存时只加载新增记录
+
+        返回在用户锁内复制的快照：锁外直接对缓存数组调用 np.frombuffer 时，
+        其他请求同时追加记录会因缓冲区被引用而失败（BufferError），三列长度也可能不一致。
+        """
+        with self._user_lock(user_id):
+            columns = self._columns_cache.get(user_id)
+            if columns is not None and columns.since <= since:
+                self._scan(columns, user_id, access_token, stop_at=columns.newest)
+                return columns.snapshot()
+
+            columns = HistoryColumns(since)
+            self._scan(columns, user_id, access_token)
+            self._columns_cache.set(user_id, columns)
+            return columns.snapshot()
+
+    def invalidate(self, user_id: str):
+        """清除用户的列数据缓存"""
+        self._columns_cache.invalidate(user_id)
+
+    @staticmethod
+    def _aggregate_numpy(timestamps, models, lengths, start: float, bucket_size: int,
+                         bucket_count: int, offset: float, model_count: int) -> Dict[str, Any]:
+        """使用NumPy计算分桶计数、模型占比和长度分布"""
+        timestamps = np.frombuffer(timestamps, dtype=np.float64)
+        models = np.frombuffer(models, dtype=np.int16).astype(np.int64)
+        lengths = np.frombuffer(lengths, dtype=np.int64)
+
+        mask = timestamps >= start
+        timestamps, models, lengths = timestamps[mask], models[mask], lengths[mask]
+
+        buckets = ((timestamps - start) // bucket_size).astype(np.int64)
+        buckets = np.minimum(buckets, bucket_count - 1)
+        counts = np.bincount(buckets, minlength=bucket_count)
+        mix = np.bincount(
+            buckets * model_count + models, minlength=bucket_count * model_count
+        ).reshape(bucket_count, model_count)
+        hour_of_day = np.bincount(((timestamps + offset) // 3600 % 24).astype(np.int64), minlength=24)
+        length_bins = np.bincount(
+            np.searchsorted(LENGTH_BIN_EDGES, lengths, side="right"), minlength=len(LENGTH_BIN_EDGES) + 1
+        )
+
+        def describe(values):
+            if values.size == 0:
+                return {"count": 0, "mean": 0.0, "max": 0, **{f"p{q}": 0.0 for q in PERCENTILES}}
+            points = np.percentile(values, PERCENTILES)
+            return {
+                "count": int(values.size),
+                "mean": round(float(values.mean()), 1),
+                "max": int(values.max()),
+                **{f"p{q}": round(float(p), 1) for q, p in zip(PERCENTILES, points)}
+            }
+
+        return {
+            "counts": counts.tolist(),
+            "mix": mix.T.tolist(),
+            "hour_of_day": hour_of_day.tolist(),
+            "length_bins": length_bins.tolist(),
+            "overall": describe(lengths),
+            "by_model": [describe(lengths[models == code]) for code in range(model_count)]
+        }
+
+    @staticmethod
+    def _aggregate_python(timestamps, models, lengths, start: float, bucket_size: int,
+                          bucket_count: int, offset: float, model_count: int) -> Dict[str, Any]:
+        """纯Python实现，与 _aggregate_numpy 输出相同"""
+        counts = [0] * bucket_count
+        mix = [[0] * bucket_count for _ in range(model_count)]
+        hour_of_day = [0] * 24
+        length_bins = [0] * (len(LENGTH_BIN_EDGES) + 1)
+        overall: List[int] = []
+        by_model: List[List[int]] = [[] for _ in range(model_count)]
+
+        for timestamp, model, length in zip(timestamps, models, lengths):
+            if timestamp < start:
+                continue
+            bucket = min(int((timestamp - start) // bucket_size), bucket_count - 1)
+            counts[bucket] += 1
+            mix[model][bucket] += 1
+            hour_of_day[int((timestamp + offset) // 3600 % 24)] += 1
+            length_bins[sum(1 for edge in LENGTH_BIN_EDGES if length >= edge)] += 1
+            overall.append(length)
+            by_model[model].append(length)
+
+        def describe(values):
+            if not values:
+                return {"count": 0, "mean": 0.0, "max": 0, **{f"p{q}": 0.0 for q in PERCENTILES}}
+            values.sort()
+            return {
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 1),
+                "max": values[-1],
+                **{f"p{q}": round(_percentile(values, q), 1) for q in PERCENTILES}
+            }
+
+        return {
+            "counts": counts,
+            "mix": mix,
+            "hour_of_day": hour_of_day,
+            "length_bins": length_bins,
+            "overall": describe(overall),
+            "by_model": [describe(values) for values in by_model]
+        }
+
+    def get_user_analytics(self, user_id: str, days: int = 30, granularity: str = "day",
+                           tz_offset_minutes: int = 0, access_token: Optional[str] = None) -> Dict[str, Any]:
+        """计算用户最近days天的使用分析
+
+        tz_offset_minutes 为用户时区相对UTC的偏移（分钟，东八区为480），
+        按天分桶和按小时分布都以该时区为准。结果均为按桶对齐的数组。
+        """
+        if granularity not in GRANULARITY_SECONDS:
+            raise ValueError(f"不支持的时间粒度: {granularity}（可选 hour、day）")
+        days = max(1, min(int(days), 365))
+        bucket_size = GRANULARITY_SECONDS[granularity]
+        offset = tz_offset_minutes * 60
+
+        # 窗口起点对齐到用户时区的整点或零点
+        now = time.time()
+        end = (now + offset) // bucket_size * bucket_size + bucket_size - offset
+        bucket_count = math.ceil(days * 86400 / bucket_size)
+        start = end - bucket_count * bucket_size
+
+        columns = self.load_columns(user_id, start, access_token)
+        with self._lock:
+            model_names = list(self._model_names)
+
+        aggregate = self._aggregate_numpy if NUMPY_AVAILABLE else self._aggregate_python
+        result = aggregate(
+            columns.timestamps, columns.models, columns.lengths,
+            start, bucket_size, bucket_count, offset, max(len(model_names), 1)
+        )
+
+        # 只返回窗口内出现过的模型类型
+        used = [code for code, model in enumerate(model_names) if sum(result["mix"][code]) > 0]
+        return {
+            "window": {
+                "start": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+                "end": datetime.fromtimestamp(end, timezone.utc).isoformat(),
+                "days": days,
+                "granularity": granularity,
+                "tz_offset_minutes": tz_offset_minutes
+            },
+            "total": sum(result["counts"]),
+            "buckets": [
+                datetime.fromtimestamp(start + i * bucket_size, timezone.utc).isoformat()
+                for i in range(bucket_count)
+            ],
+            "counts": result["counts"],
+            "model_mix": {model_names[code]: result["mix"][code] for code in used},
+            "hour_of_day": result["hour_of_day"],
+            "response_length": {
+                **result["overall"],
+                "bins": {
+                    "edges": list(LENGTH_BIN_EDGES),
+                    "counts": result["length_bins"]
+                },
+                "by_model": {model_names[code]: result["by_model"][code] for code in used}
+            },
+            "engine": "numpy" if NUMPY_AVAILABLE else "python",
+            "rows_loaded": len(columns)
+        }
+
+
+# 全局分析实例
+history_analytics = None
+_history_analytics_lock = threading.Lock()
+
+def get_history_analytics() -> HistoryAnalytics:
+    """获取使用分析实例"""
+    global history_analytics
+    with _history_analytics_lock:
+        if history_analytics is None:
+            history_analytics = HistoryAnalytics()
+    return history_analytics
@@ -0,0 +1,381 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, List, Tuple
+from local_storage import get_local_database, get_storage_backend_name
+from text_utils import tokenize
+from blob_store import COMPRESSION_ENCODING, compress_bytes, decompress_bytes
+
+# 历史记录相关的表
+HISTORY_TABLES = ("prompt_history", "webpage_generations", "prompt_history_archive")
+
+_IDENTIFIER = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+
+class HistoryBackend(ABC):
+    """历史记录存储后端接口
+
+    HistoryManager 只通过这些方法访问数据，具体由Supabase或本地SQLite实现。
+    access_token 用于Supabase的行级安全策略，本地后端直接按 user_id 过滤。
+    after 为键集分页位置 (created_at, id)，结果按 created_at、id 倒序返回。
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def insert(self, table_name: str, records: List[Dict[str, Any]],
+               access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        """批量插入记录，返回插入后的行（包含id）"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def can_write_as_service(self) -> bool:
+        """是否能以服务端身份写入（不使用用户令牌）"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_as_service(self, table_name: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """以服务端身份批量插入记录（不使用用户令牌），调用方负责确认记录的 user_id 归属"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_records(self, table_name: str, user_id: str, columns: str = "*",
+                     filters: Optional[Dict[str, Any]] = None,
+                     after: Optional[Tuple[str, int]] = None, limit: int = 50,
+                     access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按时间倒序分页列出用户记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_record(self, table_name: str, user_id: str, record_id: int,
+                   access_token: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取单条完整记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_record(self, table_name: str, user_id: str, record_id: int,
+                      access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        """删除单条记录，返回被删除的行"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_counters(self, user_id: str, access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        """读取用户的类型计数行（source, item_type, item_count）"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, user_id: str, query: str, anchor: str = "", limit: int = 20,
+               access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        """全文搜索用户的提示词和网页生成记录，按相关度倒序返回
+
+        每行包含 source、id、item_type、created_at、rank、prompt、excerpt，
+        excerpt 为回复中 anchor 附近的一段原文，用于生成高亮摘要。
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def compact_prompt_history(self, hot_days: int, retention_days: int = 0,
+                               batch_size: int = 1000) -> Dict[str, int]:
+        """把早于 hot_days 天的提示词记录压缩移入归档表，并删除超过 retention_days 天的归档记录
+
+        返回 archived_rows、purged_rows、moved_bytes、archived_bytes、purged_bytes、reclaimed_bytes。
+        该操作跨用户执行，不受行级安全策略限制。
+        """
+        raise NotImplementedError
+
+
+class SupabaseHistoryBackend(HistoryBackend):
+    """基于Supabase（PostgREST）的存储后端"""
+
+    name = "supabase"
+
+    def __init__(self, pool=None, service_pool=None):
+        if pool is None:
+            from supabase_pool import get_supabase_pool
+            pool = get_supabase_pool()
+        self.pool = pool
+        self._service_pool = service_pool
+
+    @property
+    def service_pool(self):
+        """使用服务密钥的连接池，首次使用时创建（未配置服务密钥时抛出ValueError）"""
+        if self._service_pool is None:
+            from supabase_pool import get_service_supabase_pool
+            self._service_pool = get_service_supabase_pool()
+        return self._service_pool
+
+    def insert(self, table_name, records, access_token=None):
+        with self.pool.client(access_token) as client:
+            result = client.table(table_name).insert(records).execute()
+        return result.data or []
+
+    def can_write_as_service(self):
+        return bool(self._service_pool or os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+
+    def insert_as_service(self, table_name, records):
+        with self.service_pool.client() as client:
+            result = client.table(table_name).insert(records).execute()
+        return result.data or []
+
+    def list_records(self, table_name, user_id, columns="*", filters=None,
+                     after=None, limit=50, access_token=None):
+        with self.pool.client(access_token) as client:
+            query = client.table(table_name).select(columns).eq("user_id", user_id)
+            for column, value in (filters or {}).items():
+                query = query.eq(column, value)
+            if after:
+                created_at, record_id = after
+                query = query.or_(
+                    f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{record_id})'
+                )
+            result = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+        return result.data or []
+
+    def get_record(self, table_name, user_id, record_id, access_token=None):
+        with self.pool.client(access_token) as client:
+            result = client.table(table_name).select("*").eq(
+                "id", record_id
+            ).eq("user_id", user_id).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def delete_record(self, table_name, user_id, record_id, access_token=None):
+        with self.pool.client(access_token) as client:
+            result = client.table(table_name).delete().eq(
+                "id", record_id
+            ).eq("user_id", user_id).execute()
+        return result.data or []
+
+    def get_counters(self, user_id, access_token=None):
+        with self.pool.client(access_token) as client:
+            result = client.table("user_history_counters").select(
+                "source, item_type, item_count"
+            ).eq("user_id", user_id).execute()
+        return result.data or []
+
+    def search(self, user_id, query, anchor="", limit=20, access_token=None):
+        # 用户范围由函数内的 auth.uid() 和行级安全策略保证
+        with self.pool.client(access_token) as client:
+            result = client.rpc("search_user_history", {
+                "p_query": query,
+                "p_anchor": anchor,
+                "p_limit": limit
+            }).execute()
+        return result.data or []
+
+    def compact_prompt_history(self, hot_days, retention_days=0, batch_size=1000):
+        # 归档函数只允许service_role调用，使用服务密钥连接池中的客户端
+        if not os.getenv("SUPABASE_SERVICE_ROLE_KEY"):
+            raise ValueError(
+                "归档任务需要配置SUPABASE_SERVICE_ROLE_KEY，"
+                "或在数据库中用pg_cron定时执行compact_prompt_history()"
+            )
+        with self.service_pool.client() as client:
+            result = client.rpc("compact_prompt_history", {
+                "p_hot_days": hot_days,
+                "p_retention_days": retention_days,
+                "p_batch_size": batch_size
+            }).execute()
+        return result.data[0]
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """基于本地SQLite的存储后端，表结构和索引与Supabase保持一致"""
+
+    name = "sqlite"
+
+    def __init__(self, database=None):
+        self.db = database or get_local_database()
+
+    @staticmethod
+    def _check_table(table_name: str):
+        if table_name not in HISTORY_TABLES:
+            raise ValueError(f"不支持的表: {table_name}")
+
+    @staticmethod
+    def _check_columns(columns: str) -> str:
+        """校验select列名，防止SQL注入"""
+        if columns.strip() == "*":
+            return "*"
+        names = [name.strip() for name in columns.split(",")]
+        for name in names:
+            if not _IDENTIFIER.match(name):
+                raise ValueError(f"非法列名: {name}")
+        return ", ".join(names)
+
+    def insert(self, table_name, records, access_token=None):
+        self._check_table(table_name)
+        inserted = []
+        with self.db.transaction() as conn:
+            for record in records:
+                columns = [self._check_columns(name) for name in record.keys()]
+                placeholders = ", ".join("?" * len(columns))
+                row = conn.execute(
+                    f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) RETURNING *",
+                    list(record.values())
+                ).fetchone()
+                inserted.append(dict(row))
+        return inserted
+
+    def can_write_as_service(self):
+        return True
+
+    def insert_as_service(self, table_name, records):
+        return self.insert(table_name, records)
+
+    def list_records(self, table_name, user_id, columns="*", filters=None,
+                     after=None, limit=50, access_token=None):
+        self._check_table(table_name)
+        columns = self._check_columns(columns)
+        # 本地归档表中回复是压缩后的BLOB，读取后解压为response列
+        decode_archive = table_name == "prompt_history_archive" and (
+            columns == "*" or "response" in columns.split(", ")
+        )
+        if decode_archive and columns != "*":
+            columns = ", ".join(
+                "response_blob, response_encoding" if name == "response" else name
+                for name in columns.split(", ")
+            )
+        sql = f"SELECT {columns} FROM {table_name} WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        for column, value in (filters or {}).items():
+            sql += f" AND {self._check_columns(column)} = ?"
+            params.append(value)
+        if after:
+            sql += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+            params.extend([after[0], after[0], after[1]])
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        rows = [dict(row) for row in self.db.conn.execute(sql, params).fetchall()]
+        if decode_archive:
+            rows = [self._decode_archive_row(row) for row in rows]
+        return rows
+
+    @staticmethod
+    def _decode_archive_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        """解压归档记录的回复，返回与 prompt_history 相同的字段"""
+        blob = row.pop("response_blob")
+        encoding = row.pop("response_encoding")
+        row["response"] = decompress_bytes(blob, encoding).decode("utf-8")
+        return row
+
+    def get_record(self, table_name, user_id, record_id, access_token=None):
+        self._check_table(table_name)
+        row = self.db.conn.execute(
+            f"SELECT * FROM {table_name} WHERE id = ? AND user_id = ?",
+            (record_id, user_id)
+        ).fetchone()
+        if not row:
+            return None
+        if table_name == "prompt_history_archive":
+            return self._decode_archive_row(dict(row))
+        return dict(row)
+
+    def delete_record(self, table_name, user_id, record_id, access_token=None):
+        self._check_table(table_name)
+        rows = self.db.conn.execute(
+            f"DELETE FROM {table_name} WHERE id = ? AND user_id = ? RETURNING *",
+            (record_id, user_id)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_counters(self, user_id, access_token=None):
+        rows = self.db.conn.execute(
+            "SELECT source, item_type, item_count FROM user_history_counters WHERE user_id = ?",
+            (user_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, user_id, query, anchor="", limit=20, access_token=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # FTS5查询：每个词项加引号，多个词项之间为AND关系
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self.db.conn.execute("""
+            SELECT * FROM (
+                SELECT 'prompt' AS source, p.id, p.prompt_type AS item_type, p.created_at,
+                       -bm25(prompt_history_fts, 2.0, 1.0) AS rank,
+                       substr(p.prompt, 1, 300) AS prompt,
+                       substr(p.response, max(instr(lower(p.response), lower(?)) - 80, 1), 240) AS excerpt
+                FROM prompt_history_fts JOIN prompt_history p ON p.id = prompt_history_fts.rowid
+                WHERE prompt_history_fts MATCH ? AND p.user_id = ?
+                UNION ALL
+                SELECT 'prompt' AS source, id, item_type, created_at, rank, prompt,
+                       substr(response, max(instr(lower(response), lower(?)) - 80, 1), 240) AS excerpt
+                FROM (
+                    -- 归档记录沿用热表的索引条目，只解压命中记录的回复用于摘要
+                    SELECT a.id, a.prompt_type AS item_type, a.created_at,
+                           -bm25(prompt_history_fts, 2.0, 1.0) AS rank,
+                           substr(a.prompt, 1, 300) AS prompt,
+                           decompress_text(a.response_blob, a.response_encoding) AS response
+                    FROM prompt_history_fts JOIN prompt_history_archive a ON a.id = prompt_history_fts.rowid
+                    WHERE prompt_history_fts MATCH ? AND a.user_id = ?
+                )
+                UNION ALL
+                SELECT 'webpage' AS source, w.id, w.design_type AS item_type, w.created_at,
+                       -bm25(webpage_generations_fts) AS rank,
+                       substr(w.prompt, 1, 300) AS prompt,
+                       NULL AS excerpt
+                FROM webpage_generations_fts JOIN webpage_generations w ON w.id = webpage_generations_fts.rowid
+                WHERE webpage_generations_fts MATCH ? AND w.user_id = ?
+            ) ORDER BY rank DESC LIMIT ?
+        """, (anchor, match, user_id, anchor, match, user_id, match, user_id, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def compact_prompt_history(self, hot_days, retention_days=0, batch_size=1000):
+        stats = {"archived_rows": 0, "purged_rows": 0, "moved_bytes": 0,
+                 "archived_bytes": 0, "purged_bytes": 0}
+
+        while True:
+            # 先写归档表再删除热表记录，删除触发器据此判断是否为归档，计数保持不变
+            with self.db.transaction() as conn:
+                rows = conn.execute("""
+                    SELECT id, user_id, prompt, response, response_preview, response_length,
+                           prompt_type, model_type, created_at
+                    FROM prompt_history
+                    WHERE created_at < strftime('%Y-%m-%dT%H:%M:%f', 'now', ?)
+                    ORDER BY created_at, id
+                    LIMIT ?
+                """, (f"-{int(hot_days)} days", batch_size)).fetchall()
+                if not rows:
+                    break
+
+                for row in rows:
+                    raw = row["response"].encode("utf-8")
+                    blob = compress_bytes(raw)
+                    conn.execute("""
+                        INSERT INTO prompt_history_archive
+                            (id, user_id, prompt, response_blob, response_encoding, response_preview,
+                             response_length, prompt_type, model_type, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (row["id"], row["user_id"], row["prompt"], blob, COMPRESSION_ENCODING,
+                          row["response_preview"], row["response_length"], row["prompt_type"],
+                          row["model_type"], row["created_at"]))
+                    stats["moved_bytes"] += len(raw)
+                    stats["archived_bytes"] += len(blob)
+
+                conn.executemany("DELETE FROM prompt_history WHERE id = ?", [(row["id"],) for row in rows])
+                stats["archived_rows"] += len(rows)
+
+        if retention_days > 0:
+            with self.db.transaction() as conn:
+                purged = conn.execute("""
+                    DELETE FROM prompt_history_archive
+                    WHERE created_at < strftime('%Y-%m-%dT%H:%M:%f', 'now', ?)
+                    RETURNING length(response_blob)
+                """, (f"-{int(retention_days)} days",)).fetchall()
+            stats["purged_rows"] = len(purged)
+            stats["purged_bytes"] = sum(row[0] for row in purged)
+
+        stats["reclaimed_bytes"] = stats["moved_bytes"] - stats["archived_bytes"] + stats["purged_bytes"]
+        return stats
+
+
+def create_history_backend() -> HistoryBackend:
+    """根据 STORAGE_BACKEND 环境变量创建存储后端"""
+    backend_name = get_storage_backend_name()
+    if backend_name == "sqlite":
+        return SQLiteHistoryBackend()
+    if backend_name == "supabase":
+        return SupabaseHistoryBackend()
+    raise ValueError(f"不支持的存储后端: {backend_name}（可选 supabase、sqlite）")
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from typing import Optional, Dict, Any
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+
+def _format_bytes(size: int) -> str:
+    """把字节数格式化为便于阅读的文本"""
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+class HistoryCompactor:
+    """提示词历史分层保留任务
+
+    热表只保留最近 hot_days 天的记录，更早的记录压缩后移到归档表，
+    retention_days 大于0时删除超过该天数的归档记录。后台线程按 interval 秒定期执行。
+    """
+
+    def __init__(self, hot_days: int = 30, retention_days: int = 0,
+                 interval: float = 3600.0, batch_size: int = 1000,
+                 history_manager=None):
+        self.hot_days = hot_days
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self._history_manager = history_manager
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._totals = {"runs": 0, "archived_rows": 0, "purged_rows": 0, "reclaimed_bytes": 0}
+        self._last_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def history_manager(self):
+        """延迟获取历史记录管理器，避免导入时就连接数据库"""
+        if self._history_manager is None:
+            from history_manager import get_history_manager
+            self._history_manager = get_history_manager()
+        return self._history_manager
+
+    def run_once(self) -> Dict[str, Any]:
+        """执行一次归档和清理"""
+        started = time.time()
+        result = self.history_manager.compact_prompt_history(
+            self.hot_days, self.retention_days, self.batch_size
+        )
+        result["duration"] = round(time.time() - started, 3)
+
+        with self._lock:
+            self._last_result = result
+            if result.get("success"):
+                self._totals["runs"] += 1
+                for key in ("archived_rows", "purged_rows", "reclaimed_bytes"):
+                    self._totals[key] += result.get(key, 0)
+
+        if result.get("success") and (result.get("archived_rows") or result.get("purged_rows")):
+            print(
+                f"🗜️ 历史记录归档完成: 归档 {result['archived_rows']} 条，"
+                f"清理 {result['purged_rows']} 条，回收 {_format_bytes(result['reclaimed_bytes'])}"
+            )
+        return result
+
+    def _run(self):
+        """后台归档循环"""
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ 历史记录归档异常: {e}")
+            self._stopping.wait(self.interval)
+
+    def start(self):
+        """启动后台归档线程"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="history-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台线程"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取累计归档统计和最近一次的结果"""
+        with self._lock:
+            stats = dict(self._totals)
+            stats["last_result"] = self._last_result
+        return stats
+
+
+# 全局归档任务实例
+history_compactor = None
+_history_compactor_lock = threading.Lock()
+
+def get_history_compactor() -> Optional[HistoryCompactor]:
+    """获取归档任务实例，HISTORY_HOT_DAYS 大于0时启动后台线程（默认不启用）"""
+    global history_compactor
+    with _history_compactor_lock:
+        if history_compactor is None:
+            hot_days = int(os.getenv("HISTORY_HOT_DAYS", "0"))
+            if hot_days <= 0:
+                return None
+            history_compactor = HistoryCompactor(
+                hot_days=hot_days,
+                retention_days=int(os.getenv("HISTORY_ARCHIVE_RETENTION_DAYS", "0")),
+                interval=float(os.getenv("HISTORY_COMPACTION_INTERVAL", "3600"))
+            )
+            history_compactor.start()
+    return history_compactor
+
+def shutdown_history_compactor():
+    """停止归档任务（已启动时才处理）"""
+    with _history_compactor_lock:
+        compactor = history_compactor
+    if compactor is not None:
+        compactor.stop()
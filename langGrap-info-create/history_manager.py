@@ -1,25 +1,67 @@
 import os
 import json
+import base64
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, Any, List
-from supabase import create_client, Client
+from typing import Optional, Dict, Any, List, Tuple, Iterator
 from dotenv import load_dotenv
+from cache_utils import TTLCache
+from blob_store import get_blob_store
+from history_backends import HistoryBackend, create_history_backend
+from text_utils import tokenize, highlight
 
 # 加载环境变量
 load_dotenv()
 
+# 列表接口只返回元数据和预览列，完整内容通过单条记录接口按需获取
+PROMPT_LIST_COLUMNS = "id, prompt, prompt_type, model_type, created_at, response_preview, response_length"
+WEBPAGE_LIST_COLUMNS = "id, prompt, filename, design_type, created_at, html_size, content_hash, content_size"
+
+# 导出时包含完整内容的列，以及每次从数据库读取的行数
+PROMPT_EXPORT_COLUMNS = "id, prompt, response, prompt_type, model_type, created_at"
+WEBPAGE_EXPORT_COLUMNS = "id, prompt, html_content, filename, design_type, created_at, content_hash, content_size"
+EXPORT_PAGE_SIZE = 200
+
+# 历史记录列表每页最多返回的条数
+MAX_PAGE_SIZE = 100
+
+# 用户统计缓存时间（秒）
+STATS_CACHE_TTL = float(os.getenv("HISTORY_STATS_CACHE_TTL", "30"))
+
+# 首页汇总数据缓存时间（秒）和每类历史记录的条数
+DASHBOARD_CACHE_TTL = float(os.getenv("HISTORY_DASHBOARD_CACHE_TTL", "5"))
+DASHBOARD_HISTORY_LIMIT = 20
+
+# 首页汇总数据的并发查询线程池
+_dashboard_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="history-dashboard")
+
+def encode_history_cursor(record: Dict[str, Any]) -> str:
+    """根据一页的最后一条记录生成分页游标（created_at, id）"""
+    raw = json.dumps([record["created_at"], record["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor: str) -> Tuple[str, int]:
+    """解析分页游标，格式错误时抛出ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(created_at), int(record_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
 class HistoryManager:
     """用户历史记录管理器"""
     
-    def __init__(self):
-        """初始化Supabase客户端"""
-        self.supabase_url = os.getenv("SUPABASE_URL")
-        self.supabase_key = os.getenv("SUPABASE_ANON_KEY")
-        
-        if not self.supabase_url or not self.supabase_key:
-            raise ValueError("请在.env文件中配置SUPABASE_URL和SUPABASE_ANON_KEY")
-        
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+    def __init__(self, backend: Optional[HistoryBackend] = None):
+        """初始化存储后端（由STORAGE_BACKEND选择Supabase或本地SQLite）"""
+        self.backend = backend or create_history_backend()
+        self._stats_cache = TTLCache(ttl=STATS_CACHE_TTL)
+        self._dashboard_cache = TTLCache(ttl=DASHBOARD_CACHE_TTL)
+    
+    def _invalidate_user_caches(self, user_id: str):
+        """用户记录变化后清除该用户的统计和首页缓存"""
+        self._stats_cache.invalidate(user_id)
+        self._dashboard_cache.invalidate(user_id)
     
     def save_prompt_history(self, user_id: str, prompt: str, response: str, 
                           prompt_type: str = "custom", model_type: str = "simple", access_token: str = None) -> Dict[str, Any]:
@@ -34,17 +76,14 @@ class HistoryManager:
                 "created_at": datetime.utcnow().isoformat()
             }
             
-            # 如果提供了访问令牌，设置认证头
-            if access_token:
-                self.supabase.postgrest.auth(access_token)
+            rows = self.backend.insert("prompt_history", [data], access_token)
             
-            result = self.supabase.table("prompt_history").insert(data).execute()
-            
-            if result.data:
+            if rows:
+                self._invalidate_user_caches(user_id)
                 return {
                     "success": True,
                     "message": "历史记录保存成功",
-                    "record_id": result.data[0]["id"]
+                    "record_id": rows[0]["id"]
                 }
             else:
                 return {
@@ -59,30 +98,29 @@ class HistoryManager:
                 "message": f"保存失败: {str(e)}"
             }
     
-    def save_webpage_generation(self, user_id: str, prompt: str, html_content: str, 
-                              filename: str, design_type: str = "ai_design", access_token: str = None) -> Dict[str, Any]:
-        """保存用户网页生成记录"""
+    def save_webpage_generation(self, user_id: str, prompt: str, filename: str,
+                              content_hash: str, content_size: int,
+                              design_type: str = "ai_design", access_token: str = None) -> Dict[str, Any]:
+        """保存用户网页生成记录（HTML保存在内容存储中，这里只记录哈希和大小）"""
         try:
             data = {
                 "user_id": user_id,
                 "prompt": prompt,
-                "html_content": html_content,
                 "filename": filename,
+                "content_hash": content_hash,
+                "content_size": content_size,
                 "design_type": design_type,
                 "created_at": datetime.utcnow().isoformat()
             }
             
-            # 如果提供了访问令牌，设置认证头
-            if access_token:
-                self.supabase.postgrest.auth(access_token)
-            
-            result = self.supabase.table("webpage_generations").insert(data).execute()
+            rows = self.backend.insert("webpage_generations", [data], access_token)
             
-            if result.data:
+            if rows:
+                self._invalidate_user_caches(user_id)
                 return {
                     "success": True,
                     "message": "网页生成记录保存成功",
-                    "record_id": result.data[0]["id"]
+                    "record_id": rows[0]["id"]
                 }
             else:
                 return {
@@ -97,52 +135,177 @@ class HistoryManager:
                 "message": f"保存失败: {str(e)}"
             }
     
+    def insert_records(self, table_name: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量插入记录（供写后队列使用，一次请求写入整批数据）
+
+        记录的归属已在入队时用用户令牌校验，这里以服务端身份写入，不依赖会过期的用户令牌。
+        """
+        try:
+            rows = self.backend.insert_as_service(table_name, records)
+
+            if rows:
+                for user_id in {record.get("user_id") for record in records}:
+                    self._invalidate_user_caches(user_id)
+                return {
+                    "success": True,
+                    "message": f"批量写入 {len(rows)} 条记录成功",
+                    "record_ids": [row["id"] for row in rows]
+                }
+            else:
+                return {
+                    "success": False,
+                    "message": "批量写入失败"
+                }
+
+        except Exception as e:
+            print(f"❌ 批量写入 {table_name} 失败: {e}")
+            return {
+                "success": False,
+                "message": f"批量写入失败: {str(e)}"
+            }
+
     def get_user_prompt_history(self, user_id: str, limit: int = 50, 
-                              prompt_type: Optional[str] = None, access_token: str = None) -> List[Dict[str, Any]]:
-        """获取用户提示词历史记录"""
+                              prompt_type: Optional[str] = None, access_token: str = None,
+                              cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取用户提示词历史记录（传入cursor时从该游标之后继续分页）
+
+        归档表中的记录都早于热表，热表翻到底后用同一个游标继续从归档表读取。
+        """
         try:
-            # 如果提供了访问令牌，设置认证头
-            if access_token:
-                self.supabase.postgrest.auth(access_token)
-                
-            query = self.supabase.table("prompt_history").select("*").eq("user_id", user_id)
-            
-            if prompt_type:
-                query = query.eq("prompt_type", prompt_type)
+            limit = min(max(1, limit), MAX_PAGE_SIZE)
+            after = decode_history_cursor(cursor) if cursor else None
+            filters = {"prompt_type": prompt_type} if prompt_type else None
             
-            result = query.order("created_at", desc=True).limit(limit).execute()
-            
-            return result.data if result.data else []
+            history = self.backend.list_records(
+                "prompt_history", user_id, PROMPT_LIST_COLUMNS, filters, after, limit, access_token
+            )
+            if len(history) < limit:
+                if history:
+                    after = (history[-1]["created_at"], history[-1]["id"])
+                history += self.backend.list_records(
+                    "prompt_history_archive", user_id, PROMPT_LIST_COLUMNS, filters, after,
+                    limit - len(history), access_token
+                )
+            return history
             
+        except ValueError:
+            raise
         except Exception as e:
             print(f"❌ 获取历史记录失败: {e}")
             return []
     
-    def get_user_webpage_generations(self, user_id: str, limit: int = 20, access_token: str = None) -> List[Dict[str, Any]]:
-        """获取用户网页生成历史记录"""
+    def get_user_webpage_generations(self, user_id: str, limit: int = 20, access_token: str = None,
+                                     cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取用户网页生成历史记录（传入cursor时从该游标之后继续分页）"""
         try:
-            # 如果提供了访问令牌，设置认证头
-            if access_token:
-                self.supabase.postgrest.auth(access_token)
-                
-            result = self.supabase.table("webpage_generations").select("*").eq(
-                "user_id", user_id
-            ).order("created_at", desc=True).limit(limit).execute()
+            limit = min(max(1, limit), MAX_PAGE_SIZE)
+            after = decode_history_cursor(cursor) if cursor else None
             
-            return result.data if result.data else []
+            return self.backend.list_records(
+                "webpage_generations", user_id, WEBPAGE_LIST_COLUMNS, None, after, limit, access_token
+            )
             
+        except ValueError:
+            raise
         except Exception as e:
             print(f"❌ 获取网页生成记录失败: {e}")
             return []
     
-    def delete_prompt_history(self, user_id: str, record_id: int) -> Dict[str, Any]:
-        """删除用户指定的历史记录"""
+    def get_prompt_history_record(self, user_id: str, record_id: int,
+                                  access_token: str = None) -> Optional[Dict[str, Any]]:
+        """获取单条提示词历史记录（包含完整回复，热表中没有时查找归档表）
+
+        记录不存在时返回None；读取失败时直接抛出异常，不与记录不存在混淆。
+        """
+        record = self.backend.get_record("prompt_history", user_id, record_id, access_token)
+        if record is None:
+            record = self.backend.get_record("prompt_history_archive", user_id, record_id, access_token)
+        return record
+    
+    def get_webpage_generation_record(self, user_id: str, record_id: int,
+                                      access_token: str = None) -> Optional[Dict[str, Any]]:
+        """获取单条网页生成记录（包含完整HTML）
+
+        记录不存在时返回None；读取失败时直接抛出异常，不与记录不存在混淆。
+        """
+        record = self.backend.get_record("webpage_generations", user_id, record_id, access_token)
+        return self._attach_html(record) if record is not None else None
+
+    @staticmethod
+    def _attach_html(record: Dict[str, Any]) -> Dict[str, Any]:
+        """新记录只保存内容哈希（html_content为空），从内容存储读取HTML补全记录"""
+        if not record.get("html_content") and record.get("content_hash"):
+            record["html_content"] = get_blob_store().read_blob_text(record["content_hash"])
+        return record
+    
+    def iter_export_records(self, user_id: str, access_token: str = None,
+                            page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        """按键集游标逐页读取用户的全部历史记录（包含完整内容）
+
+        依次输出提示词记录（先热表后归档表）和网页生成记录，每条记录带 source 字段，
+        同一时间只在内存中保留一页数据。读取失败时直接抛出异常。
+        """
+        sources = (
+            ("prompt", "prompt_history", PROMPT_EXPORT_COLUMNS),
+            ("prompt", "prompt_history_archive", PROMPT_EXPORT_COLUMNS),
+            ("webpage", "webpage_generations", WEBPAGE_EXPORT_COLUMNS),
+        )
+        for source, table_name, columns in sources:
+            after = None
+            while True:
+                rows = self.backend.list_records(
+                    table_name, user_id, columns, None, after, page_size, access_token
+                )
+                for row in rows:
+                    if source == "webpage":
+                        row = self._attach_html(row)
+                    yield {"source": source, **row}
+                if len(rows) < page_size:
+                    break
+                after = (rows[-1]["created_at"], rows[-1]["id"])
+    
+    def search_history(self, user_id: str, query: str, limit: int = 20,
+                       access_token: str = None) -> List[Dict[str, Any]]:
+        """全文搜索用户的提示词和网页生成记录，返回按相关度排序的高亮摘要"""
+        query = (query or "").strip()
+        if not query:
+            return []
+        
         try:
-            result = self.supabase.table("prompt_history").delete().eq(
-                "id", record_id
-            ).eq("user_id", user_id).execute()
+            # 高亮优先使用用户输入的原词，找不到时退回到分词后的词项
+            words = query.split()
+            terms = words + tokenize(query)
+            anchor = max(words, key=len)
             
-            if result.data:
+            rows = self.backend.search(user_id, query, anchor, limit, access_token)
+            
+            results = []
+            for row in rows:
+                results.append({
+                    "source": row["source"],
+                    "id": row["id"],
+                    "type": row["item_type"],
+                    "created_at": row["created_at"],
+                    "rank": row["rank"],
+                    "prompt": row["prompt"],
+                    "prompt_snippet": highlight(row["prompt"], terms),
+                    "response_snippet": highlight(row["excerpt"], terms) if row.get("excerpt") else ""
+                })
+            return results
+            
+        except Exception as e:
+            print(f"❌ 搜索历史记录失败: {e}")
+            return []
+    
+    def delete_prompt_history(self, user_id: str, record_id: int, access_token: str = None) -> Dict[str, Any]:
+        """删除用户指定的历史记录（包括已归档的记录）"""
+        try:
+            deleted = self.backend.delete_record("prompt_history", user_id, record_id, access_token)
+            if not deleted:
+                deleted = self.backend.delete_record("prompt_history_archive", user_id, record_id, access_token)
+            
+            if deleted:
+                self._invalidate_user_caches(user_id)
                 return {
                     "success": True,
                     "message": "历史记录删除成功"
@@ -160,14 +323,13 @@ class HistoryManager:
                 "message": f"删除失败: {str(e)}"
             }
     
-    def delete_webpage_generation(self, user_id: str, record_id: int) -> Dict[str, Any]:
+    def delete_webpage_generation(self, user_id: str, record_id: int, access_token: str = None) -> Dict[str, Any]:
         """删除用户指定的网页生成记录"""
         try:
-            result = self.supabase.table("webpage_generations").delete().eq(
-                "id", record_id
-            ).eq("user_id", user_id).execute()
+            deleted = self.backend.delete_record("webpage_generations", user_id, record_id, access_token)
             
-            if result.data:
+            if deleted:
+                self._invalidate_user_caches(user_id)
                 return {
                     "success": True,
                     "message": "网页生成记录删除成功"
@@ -185,38 +347,94 @@ class HistoryManager:
                 "message": f"删除失败: {str(e)}"
             }
     
-    def get_user_statistics(self, user_id: str) -> Dict[str, Any]:
-        """获取用户使用统计信息"""
+    def compact_prompt_history(self, hot_days: int, retention_days: int = 0,
+                               batch_size: int = 1000) -> Dict[str, Any]:
+        """归档较早的提示词记录并清理过期归档，返回处理结果和回收的空间"""
         try:
-            # 获取提示词历史统计
-            prompt_stats = self.supabase.table("prompt_history").select(
-                "prompt_type", count="exact"
-            ).eq("user_id", user_id).execute()
+            result = self.backend.compact_prompt_history(hot_days, retention_days, batch_size)
+            
+            # 清理过期归档会改变计数
+            if result.get("purged_rows"):
+                self._stats_cache.clear()
+                self._dashboard_cache.clear()
+            return {
+                "success": True,
+                **result
+            }
             
-            # 获取网页生成统计
-            webpage_stats = self.supabase.table("webpage_generations").select(
-                "design_type", count="exact"
-            ).eq("user_id", user_id).execute()
+        except Exception as e:
+            print(f"❌ 归档历史记录失败: {e}")
+            return {
+                "success": False,
+                "message": f"归档失败: {str(e)}"
+            }
+    
+    def get_dashboard(self, user_id: str, access_token: str = None,
+                      limit: int = DASHBOARD_HISTORY_LIMIT) -> Dict[str, Any]:
+        """获取首页需要的统计信息和最近的提示词、网页记录
+
+        三个查询并发执行，结果按用户缓存几秒，用户记录变化时清除。
+        """
+        cached = self._dashboard_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        stats_future = _dashboard_executor.submit(self.get_user_statistics, user_id, access_token)
+        prompts_future = _dashboard_executor.submit(
+            self.get_user_prompt_history, user_id, limit, None, access_token
+        )
+        webpages_future = _dashboard_executor.submit(
+            self.get_user_webpage_generations, user_id, limit, access_token
+        )
+        
+        prompts = prompts_future.result()
+        webpages = webpages_future.result()
+        dashboard = {
+            "stats": stats_future.result(),
+            "prompts": {
+                "history": prompts,
+                "next_cursor": encode_history_cursor(prompts[-1]) if len(prompts) == limit else None
+            },
+            "webpages": {
+                "history": webpages,
+                "next_cursor": encode_history_cursor(webpages[-1]) if len(webpages) == limit else None
+            }
+        }
+        self._dashboard_cache.set(user_id, dashboard)
+        return dashboard
+    
+    def get_user_statistics(self, user_id: str, access_token: str = None) -> Dict[str, Any]:
+        """获取用户使用统计信息
+
+        计数由数据库触发器维护在user_history_counters表中（Supabase和本地SQLite相同），
+        这里只读取该用户的少量计数行，并在内存中短暂缓存。
+        """
+        cached = self._stats_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            counters = self.backend.get_counters(user_id, access_token)
             
-            # 统计不同类型的数量
+            # 按来源整理不同类型的数量
             prompt_type_counts = {}
-            if prompt_stats.data:
-                for record in prompt_stats.data:
-                    prompt_type = record.get("prompt_type", "unknown")
-                    prompt_type_counts[prompt_type] = prompt_type_counts.get(prompt_type, 0) + 1
-            
             webpage_type_counts = {}
-            if webpage_stats.data:
-                for record in webpage_stats.data:
-                    design_type = record.get("design_type", "unknown")
-                    webpage_type_counts[design_type] = webpage_type_counts.get(design_type, 0) + 1
+            for record in counters:
+                if record["item_count"] <= 0:
+                    continue
+                if record["source"] == "prompt":
+                    prompt_type_counts[record["item_type"]] = record["item_count"]
+                else:
+                    webpage_type_counts[record["item_type"]] = record["item_count"]
             
-            return {
-                "total_prompts": len(prompt_stats.data) if prompt_stats.data else 0,
-                "total_webpages": len(webpage_stats.data) if webpage_stats.data else 0,
+            stats = {
+                "total_prompts": sum(prompt_type_counts.values()),
+                "total_webpages": sum(webpage_type_counts.values()),
                 "prompt_type_breakdown": prompt_type_counts,
                 "webpage_type_breakdown": webpage_type_counts
             }
+            self._stats_cache.set(user_id, stats)
+            return stats
             
         except Exception as e:
             print(f"❌ 获取用户统计失败: {e}")
@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 允许写入的表
+QUEUE_TABLES = ("prompt_history", "webpage_generations")
+
+
+class HistoryWriteQueue:
+    """历史记录写后队列
+
+    请求线程只把记录追加到本地SQLite日志（同步落盘）后立即返回，
+    后台线程按批次把日志中的记录写入Supabase，失败时指数退避重试。
+    记录只有在数据库确认写入后才会从日志中删除，进程崩溃后重启会继续写入。
+
+    日志中不保存用户访问令牌：记录的 user_id 由调用方在认证后填入，刷写时以服务端身份写入
+    （Supabase需要配置SUPABASE_SERVICE_ROLE_KEY，未配置时不启用队列，见 history_queue_supported）。
+    """
+
+    def __init__(self, db_path: Optional[str] = None, batch_size: int = 20,
+                 flush_interval: float = 2.0, max_attempts: int = 8,
+                 history_manager=None):
+        self.db_path = db_path or os.getenv(
+            "HISTORY_QUEUE_PATH",
+            os.path.join(os.path.dirname(__file__), "history_queue.db")
+        )
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._history_manager = history_manager
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._idle = threading.Event()
+        self._thread = None
+        self._stats = {"enqueued": 0, "flushed": 0, "batches": 0, "retries": 0, "failed": 0}
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_writes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pending_writes_due "
+            "ON pending_writes(status, next_attempt_at, id)"
+        )
+        self._drop_stored_tokens()
+
+    def _drop_stored_tokens(self):
+        """清除旧版本日志中保存的访问令牌（旧版本按记录保存令牌用于刷写）"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(pending_writes)")]
+        if "access_token" in columns:
+            cursor = self._conn.execute(
+                "UPDATE pending_writes SET access_token = NULL WHERE access_token IS NOT NULL"
+            )
+            if cursor.rowcount:
+                print(f"🔒 已清除写后队列日志中保存的 {cursor.rowcount} 个访问令牌")
+
+    @property
+    def history_manager(self):
+        """延迟获取历史记录管理器，避免导入时就连接Supabase"""
+        if self._history_manager is None:
+            from history_manager import get_history_manager
+            self._history_manager = get_history_manager()
+        return self._history_manager
+
+    def start(self):
+        """启动后台刷写线程"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="history-write-queue", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, table_name: str, record: Dict[str, Any]) -> int:
+        """把一条记录写入本地日志，返回日志ID（record 的 user_id 必须是已认证的当前用户）"""
+        if table_name not in QUEUE_TABLES:
+            raise ValueError(f"不支持的表: {table_name}")
+
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO pending_writes (table_name, payload, created_at) VALUES (?, ?, ?)",
+                (table_name, json.dumps(record, ensure_ascii=False), time.time())
+            )
+            self._stats["enqueued"] += 1
+            queue_id = cursor.lastrowid
+
+        self.start()
+        self._idle.clear()
+        self._wakeup.set()
+        return queue_id
+
+    def enqueue_prompt_history(self, user_id: str, prompt: str, response: str,
+                               prompt_type: str = "custom", model_type: str = "simple") -> int:
+        """排队保存提示词历史记录"""
+        return self.enqueue("prompt_history", {
+            "user_id": user_id,
+            "prompt": prompt,
+            "response": response,
+            "prompt_type": prompt_type,
+            "model_type": model_type,
+            "created_at": datetime.utcnow().isoformat()
+        })
+
+    def enqueue_webpage_generation(self, user_id: str, prompt: str, filename: str,
+                                   content_hash: str, content_size: int,
+                                   design_type: str = "ai_design") -> int:
+        """排队保存网页生成记录（只记录内容哈希和大小，HTML保存在内容存储中）"""
+        return self.enqueue("webpage_generations", {
+            "user_id": user_id,
+            "prompt": prompt,
+            "filename": filename,
+            "content_hash": content_hash,
+            "content_size": content_size,
+            "design_type": design_type,
+            "created_at": datetime.utcnow().isoformat()
+        })
+
+    def _fetch_due_batch(self) -> List[sqlite3.Row]:
+        """取出一批到期的待写记录（同一张表）"""
+        with self._lock:
+            head = self._conn.execute(
+                "SELECT table_name FROM pending_writes "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT 1",
+                (time.time(),)
+            ).fetchone()
+            if not head:
+                return []
+            return self._conn.execute(
+                "SELECT id, table_name, payload, attempts FROM pending_writes "
+                "WHERE status = 'pending' AND next_attempt_at <= ? AND table_name = ? "
+                "ORDER BY id LIMIT ?",
+                (time.time(), head[0], self.batch_size)
+            ).fetchall()
+
+    def _flush_batch(self, batch: List[sqlite3.Row]) -> bool:
+        """把一批记录写入Supabase，成功后从日志删除，失败则安排重试"""
+        ids = [row[0] for row in batch]
+        table_name = batch[0][1]
+        records = [json.loads(row[2]) for row in batch]
+
+        result = self.history_manager.insert_records(table_name, records)
+        placeholders = ",".join("?" * len(ids))
+
+        if result.get("success"):
+            with self._lock:
+                self._conn.execute(f"DELETE FROM pending_writes WHERE id IN ({placeholders})", ids)
+                self._stats["flushed"] += len(ids)
+                self._stats["batches"] += 1
+            print(f"💾 写后队列已写入 {len(ids)} 条 {table_name} 记录")
+            return True
+
+        error = result.get("message", "未知错误")
+        with self._lock:
+            for row_id, attempts in ((row[0], row[3] + 1) for row in batch):
+                if attempts >= self.max_attempts:
+                    # 超过重试次数的记录保留在日志中，等待人工重新排队
+                    self._conn.execute(
+                        "UPDATE pending_writes SET attempts = ?, status = 'failed', last_error = ? WHERE id = ?",
+                        (attempts, error, row_id)
+                    )
+                    self._stats["failed"] += 1
+                else:
+                    delay = min(300.0, 2 ** attempts) * (0.5 + random.random() / 2)
+                    self._conn.execute(
+                        "UPDATE pending_writes SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, time.time() + delay, error, row_id)
+                    )
+                    self._stats["retries"] += 1
+        print(f"⚠️ 写后队列写入 {table_name} 失败，稍后重试: {error}")
+        return False
+
+    def _run(self):
+        """后台刷写循环"""
+        while not self._stopping.is_set():
+            try:
+                batch = self._fetch_due_batch()
+                if batch:
+                    self._flush_batch(batch)
+                    continue
+            except Exception as e:
+                print(f"❌ 写后队列刷写异常: {e}")
+            self._idle.set()
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等待当前到期的记录全部写入，返回是否已清空"""
+        deadline = time.time() + timeout
+        self._wakeup.set()
+        while time.time() < deadline:
+            if self.pending_count(due_only=True) == 0:
+                return True
+            self._idle.clear()
+            self._wakeup.set()
+            self._idle.wait(min(0.5, max(0.0, deadline - time.time())))
+        return self.pending_count(due_only=True) == 0
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台线程（未写入的记录保留在日志中，下次启动继续写入）"""
+        self.flush(timeout)
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def pending_count(self, due_only: bool = False) -> int:
+        """待写记录数"""
+        with self._lock:
+            if due_only:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM pending_writes WHERE status = 'pending' AND next_attempt_at <= ?",
+                    (time.time(),)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM pending_writes WHERE status = 'pending'"
+                ).fetchone()
+        return row[0]
+
+    def requeue_failed(self) -> int:
+        """把失败记录重新放回待写队列"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE pending_writes SET status = 'pending', attempts = 0, next_attempt_at = 0 "
+                "WHERE status = 'failed'"
+            )
+        self.start()
+        self._wakeup.set()
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["failed_in_journal"] = self._conn.execute(
+                "SELECT COUNT(*) FROM pending_writes WHERE status = 'failed'"
+            ).fetchone()[0]
+        stats["pending"] = self.pending_count()
+        return stats
+
+
+# 全局写后队列实例
+history_queue = None
+_history_queue_lock = threading.Lock()
+
+def history_queue_supported() -> bool:
+    """当前存储后端能否以服务端身份写入（本地SQLite总是可以，Supabase需要配置服务密钥）"""
+    from history_manager import get_history_manager
+    return get_history_manager().backend.can_write_as_service()
+
+def get_history_queue() -> HistoryWriteQueue:
+    """获取写后队列实例（首次获取时启动后台线程，继续写入上次未完成的记录）
+
+    存储后端不能以服务端身份写入时抛出ValueError，调用方应改用用户令牌直接写入。
+    """
+    global history_queue
+    with _history_queue_lock:
+        if history_queue is None:
+            if not history_queue_supported():
+                raise ValueError("写后队列需要配置SUPABASE_SERVICE_ROLE_KEY")
+            history_queue = HistoryWriteQueue()
+            history_queue.start()
+    return history_queue
+
+def shutdown_history_queue():
+    """停止写后队列（已启动时才处理）"""
+    with _history_queue_lock:
+        queue = history_queue
+    if queue is not None:
+        queue.stop()
@@ -0,0 +1,408 @@
+import os
+import re
+import math
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple, Iterable
+from dotenv import load_dotenv
+from text_utils import tokenize
+from search_profiles import estimate_query_complexity
+
+# 加载环境变量
+load_dotenv()
+
+# 分类器预测概率低于该值时不采用，按自由问题（custom）处理
+INTENT_ROUTER_MIN_CONFIDENCE = float(os.getenv("INTENT_ROUTER_MIN_CONFIDENCE", "0.6"))
+# 新增该数量的有效标注后在后台重新训练
+INTENT_ROUTER_RETRAIN_EVERY = int(os.getenv("INTENT_ROUTER_RETRAIN_EVERY", "200"))
+# 训练时最多读取的路由日志条数
+INTENT_ROUTER_MAX_EXAMPLES = int(os.getenv("INTENT_ROUTER_MAX_EXAMPLES", "5000"))
+# 路由日志（包含用户提问原文）的保留天数，0表示不清理
+INTENT_ROUTER_LOG_RETENTION_DAYS = float(os.getenv("INTENT_ROUTER_LOG_RETENTION_DAYS", "30"))
+# 每路由该数量的请求清理一次过期日志
+_PRUNE_EVERY = 500
+# 客户端指定的预设在查询复杂度不超过该值时改用预设最便宜的模型档位（0 只对简单查询降档，-1 表示不降档）
+DECLARED_PRESET_DOWNGRADE_MAX_COMPLEXITY = int(os.getenv("DECLARED_PRESET_DOWNGRADE_MAX_COMPLEXITY", "0"))
+
+# 关键词规则，按顺序匹配，命中即确定预设类型
+ROUTE_RULES: List[Tuple[str, re.Pattern]] = [
+    ("ai_design", re.compile(
+        r'(设计|生成|制作|做|写)(一个|一份|个)?.{0,12}(网页|页面|网站|落地页|主页|html)|landing ?page|web ?page design',
+        re.IGNORECASE
+    )),
+    ("extract", re.compile(r'https?://\S+|\bwww\.[\w-]+\.\S+', re.IGNORECASE)),
+    ("calculate", re.compile(
+        r'^[\s\d.+\-*/×÷%^()=（）]+[=?？]?\s*$|计算|等于多少|平方根|开方|\bcalculate\b', re.IGNORECASE
+    )),
+    ("weather", re.compile(r'天气|气温|下雨|降雨|降温|空气质量|\bweather\b|\bforecast\b', re.IGNORECASE)),
+    ("news", re.compile(r'新闻|最新消息|头条|快讯|\bnews\b|\bheadlines?\b', re.IGNORECASE)),
+    ("datetime", re.compile(r'几点|现在时间|当前时间|今天几号|星期几|周几|时区|\bwhat time\b|\btimezone\b', re.IGNORECASE)),
+    ("file", re.compile(r'文件|目录|文件夹|\bls\b|\bfiles?\b|\bdirector(y|ies)\b', re.IGNORECASE)),
+    ("research", re.compile(r'研究|调研|综述|深度分析|行业分析|研究报告|发展趋势|\bresearch\b', re.IGNORECASE)),
+]
+
+# 各预设可用的模型档位（从便宜到贵），按查询复杂度（0 简单、1 一般、2 复杂）依次选取，不足三个时取最后一个
+PRESET_MODEL_TIERS = {
+    "weather": ("simple",),
+    "extract": ("simple",),
+    "calculate": ("simple",),
+    "datetime": ("simple",),
+    "file": ("simple",),
+    "news": ("simple", "research"),
+    "research": ("simple", "research"),
+    "custom": ("simple", "simple", "research"),
+    "ai_design": ("ai_design",),
+}
+
+ROUTER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS route_decisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    prompt TEXT NOT NULL,
+    declared_preset TEXT,
+    predicted_preset TEXT,
+    preset_type TEXT NOT NULL,
+    model_type TEXT NOT NULL,
+    source TEXT NOT NULL,
+    confidence REAL,
+    route_ms REAL,
+    success INTEGER,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS idx_route_decisions_created ON route_decisions(created_at);
+"""
+
+
+class TfidfLinearClassifier:
+    """TF-IDF特征加多类逻辑回归（稀疏特征，纯Python实现，几千条样本训练约一秒，预测为微秒级）"""
+
+    def __init__(self, epochs: int = 10, learning_rate: float = 0.5, l2: float = 1e-4):
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.vocabulary: Dict[str, int] = {}
+        self.idf: List[float] = []
+        self.classes: List[str] = []
+        self.weights: List[Dict[int, float]] = []
+        self.bias: List[float] = []
+
+    def _features(self, text: str) -> Dict[int, float]:
+        """L2归一化的TF-IDF向量（只保留词表中的词）"""
+        counts = Counter(term for term in tokenize(text) if term in self.vocabulary)
+        vector = {self.vocabulary[term]: (1 + math.log(count)) * self.idf[self.vocabulary[term]]
+                  for term, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {index: value / norm for index, value in vector.items()}
+
+    def _scores(self, features: Dict[int, float]) -> List[float]:
+        scores = [
+            self.bias[c] + sum(self.weights[c].get(index, 0.0) * value for index, value in features.items())
+            for c in range(len(self.classes))
+        ]
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [value / total for value in exps]
+
+    def fit(self, texts: List[str], labels: List[str]) -> "TfidfLinearClassifier":
+        """训练：建立词表和IDF，再用随机梯度下降训练softmax回归"""
+        document_frequency = Counter()
+        for text in texts:
+            document_frequency.update(set(tokenize(text)))
+        self.vocabulary = {term: index for index, term in enumerate(sorted(document_frequency))}
+        self.idf = [math.log((1 + len(texts)) / (1 + document_frequency[term])) + 1
+                    for term in sorted(document_frequency)]
+        self.classes = sorted(set(labels))
+        self.weights = [{} for _ in self.classes]
+        self.bias = [0.0] * len(self.classes)
+        class_index = {label: c for c, label in enumerate(self.classes)}
+
+        samples = [(self._features(text), class_index[label]) for text, label in zip(texts, labels)]
+        rng = random.Random(0)
+        for epoch in range(self.epochs):
+            rng.shuffle(samples)
+            rate = self.learning_rate / (1 + epoch)
+            for features, target in samples:
+                probabilities = self._scores(features)
+                for c, probability in enumerate(probabilities):
+                    gradient = probability - (1.0 if c == target else 0.0)
+                    if abs(gradient) < 1e-6:
+                        continue
+                    self.bias[c] -= rate * gradient
+                    weights = self.weights[c]
+                    for index, value in features.items():
+                        weight = weights.get(index, 0.0)
+                        weights[index] = weight - rate * (gradient * value + self.l2 * weight)
+        return self
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """返回 (类别, 概率)，没有训练或文本中没有已知词时返回 (None, 0.0)"""
+        if not self.classes:
+            return None, 0.0
+        features = self._features(text)
+        if not features:
+            return None, 0.0
+        probabilities = self._scores(features)
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.classes[best], probabilities[best]
+
+
+def choose_declared_model_type(preset_type: str, text: str, declared_model: Optional[str] = None,
+                               available: Optional[Iterable[str]] = None) -> str:
+    """客户端指定预设时的模型档位：查询足够简单时使用预设最便宜的可用档位，否则使用配置的模型"""
+    tiers = PRESET_MODEL_TIERS.get(preset_type, PRESET_MODEL_TIERS["custom"])
+    declared_model = declared_model or tiers[-1]
+    cheapest = tiers[0]
+    if (cheapest != declared_model and declared_model in tiers
+            and (available is None or cheapest in set(available))
+            and estimate_query_complexity(text) <= DECLARED_PRESET_DOWNGRADE_MAX_COMPLEXITY):
+        return cheapest
+    return declared_model
+
+
+def match_rules(text: str) -> Optional[str]:
+    """按关键词规则确定预设类型，没有命中时返回None"""
+    for preset_type, pattern in ROUTE_RULES:
+        if pattern.search(text or ""):
+            return preset_type
+    return None
+
+
+class IntentRouter:
+    """意图路由
+
+    先按关键词规则、再用从路由日志训练的TF-IDF线性分类器判断请求的预设类型，
+    再按预设可用的模型档位和查询复杂度选择最便宜的模型，每次决策写入路由日志，
+    请求完成后记录是否成功，成功的决策作为后续训练的标注。日志超过保留天数后删除。
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv(
+            "INTENT_ROUTER_LOG_PATH",
+            os.path.join(os.path.dirname(__file__), "intent_router.db")
+        )
+        self._lock = threading.Lock()
+        self._retrain_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(ROUTER_SCHEMA)
+        self.prune_log()
+        self._classifier: Optional[TfidfLinearClassifier] = None
+        self._labels_since_training = 0
+        self._training: Dict[str, Any] = {}
+        self._stats = {"routed": 0, "rule": 0, "model": 0, "client": 0, "default": 0,
+                       "agreed": 0, "disagreed": 0, "total_route_ms": 0.0}
+
+    def classify(self, text: str) -> Tuple[Optional[str], float, str]:
+        """判断预设类型，返回 (预设类型, 置信度, 来源)，无法判断时预设类型为None"""
+        preset_type = match_rules(text)
+        if preset_type:
+            return preset_type, 1.0, "rule"
+        classifier = self._classifier
+        if classifier is not None:
+            preset_type, confidence = classifier.predict(text)
+            if preset_type and confidence >= INTENT_ROUTER_MIN_CONFIDENCE:
+                return preset_type, confidence, "model"
+            return None, confidence, "default"
+        return None, 0.0, "default"
+
+    @staticmethod
+    def choose_model_type(preset_type: str, text: str, available: Optional[Iterable[str]] = None) -> str:
+        """选择预设可用的最便宜的模型档位，查询越复杂档位越高；档位未初始化时依次尝试更高的档位"""
+        tiers = PRESET_MODEL_TIERS.get(preset_type, PRESET_MODEL_TIERS["custom"])
+        level = min(estimate_query_complexity(text), len(tiers) - 1)
+        available = set(available) if available is not None else None
+        for model_type in tiers[level:]:
+            if available is None or model_type in available:
+                return model_type
+        return tiers[-1]
+
+    def route(self, text: str, declared_preset: Optional[str] = None,
+              available: Optional[Iterable[str]] = None,
+              declared_model: Optional[str] = None) -> Dict[str, Any]:
+        """为请求选择预设类型和模型档位并写入路由日志
+
+        客户端指定了预设类型时预设类型不改变，模型档位只在查询足够简单时降为最便宜的档位
+        （declared_model 为该预设配置的模型），分类器的判断只记录用于评估一致率；
+        未指定时由路由选择预设类型和最便宜的模型档位。
+        """
+        start = time.perf_counter()
+        predicted, confidence, source = self.classify(text)
+        if declared_preset:
+            preset_type, source = declared_preset, "client"
+            model_type = choose_declared_model_type(preset_type, text, declared_model, available)
+        else:
+            preset_type = predicted or "custom"
+            model_type = self.choose_model_type(preset_type, text, available)
+        route_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            decision_id = self._conn.execute(
+                "INSERT INTO route_decisions (created_at, prompt, declared_preset, predicted_preset, preset_type, "
+                "model_type, source, confidence, route_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), text, declared_preset, predicted, preset_type, model_type, source,
+                 confidence, route_ms)
+            ).lastrowid
+            self._stats["routed"] += 1
+            self._stats[source] += 1
+            self._stats["total_route_ms"] += route_ms
+            if declared_preset and predicted:
+                self._stats["agreed" if predicted == declared_preset else "disagreed"] += 1
+            prune = self._stats["routed"] % _PRUNE_EVERY == 0
+        if prune:
+            self.prune_log()
+
+        print(f"🧭 路由: {preset_type} / {model_type}（{source}，置信度 {confidence:.2f}，{route_ms:.2f}ms）")
+        return {
+            "id": decision_id,
+            "preset_type": preset_type,
+            "model_type": model_type,
+            "source": source,
+            "confidence": round(confidence, 3),
+            "predicted_preset": predicted
+        }
+
+    def record_outcome(self, decision_id: int, success: bool, duration: float):
+        """记录请求结果，有效标注累计到一定数量后在后台重新训练"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE route_decisions SET success = ?, duration = ? WHERE id = ?",
+                (1 if success else 0, duration, decision_id)
+            )
+            if success:
+                self._labels_since_training += 1
+            retrain = self._labels_since_training >= INTENT_ROUTER_RETRAIN_EVERY
+            if retrain:
+                self._labels_since_training = 0
+        if retrain:
+            self.retrain_in_background()
+
+    def prune_log(self) -> int:
+        """删除超过保留天数的路由日志，返回删除的条数"""
+        if INTENT_ROUTER_LOG_RETENTION_DAYS <= 0:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM route_decisions WHERE created_at < ?",
+                (time.time() - INTENT_ROUTER_LOG_RETENTION_DAYS * 86400,)
+            )
+        if cursor.rowcount:
+            print(f"🧹 已清理 {cursor.rowcount} 条过期路由日志")
+        return cursor.rowcount
+
+    def training_examples(self) -> List[Tuple[str, str]]:
+        """收集训练样本：路由日志中成功的客户端指定和规则命中的决策
+
+        提示词历史只保存AI设计记录，类型分布严重偏斜，不作为训练数据；
+        分类器自己的判断也不作为标注，避免错误被不断强化。
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT prompt, preset_type FROM route_decisions
+                WHERE success = 1 AND source IN ('client', 'rule')
+                ORDER BY id DESC LIMIT ?
+            """, (INTENT_ROUTER_MAX_EXAMPLES,)).fetchall()
+        # 重复的提问只保留一条，避免高频问题主导训练和评估
+        return list(dict.fromkeys((prompt, preset_type) for prompt, preset_type in rows))
+
+    def retrain(self) -> Dict[str, Any]:
+        """重新训练分类器（样本足够时先留出20%评估准确率，再用全部样本训练）"""
+        with self._retrain_lock:
+            start = time.perf_counter()
+            examples = self.training_examples()
+            labels = {label for _, label in examples}
+            if len(examples) < 20 or len(labels) < 2:
+                return {"success": False, "message": f"训练样本不足（{len(examples)} 条，{len(labels)} 类）"}
+
+            accuracy = None
+            if len(examples) >= 50:
+                shuffled = list(examples)
+                random.Random(0).shuffle(shuffled)
+                split = len(shuffled) // 5
+                holdout, train = shuffled[:split], shuffled[split:]
+                model = TfidfLinearClassifier().fit([t for t, _ in train], [l for _, l in train])
+                accuracy = sum(model.predict(t)[0] == l for t, l in holdout) / len(holdout)
+
+            classifier = TfidfLinearClassifier().fit([t for t, _ in examples], [l for _, l in examples])
+            self._classifier = classifier
+            self._training = {
+                "examples": len(examples),
+                "classes": classifier.classes,
+                "vocabulary": len(classifier.vocabulary),
+                "holdout_accuracy": round(accuracy, 3) if accuracy is not None else None,
+                "seconds": round(time.perf_counter() - start, 2),
+                "trained_at": time.time()
+            }
+        print(f"🧭 意图分类器已训练: {len(examples)} 条样本，准确率 {self._training['holdout_accuracy']}")
+        return {"success": True, **self._training}
+
+    def retrain_in_background(self):
+        """在后台线程中重新训练，已有训练在进行时跳过"""
+        if self._retrain_lock.locked():
+            return
+
+        def run():
+            try:
+                self.retrain()
+            except Exception as e:
+                print(f"❌ 意图分类器训练失败: {e}")
+
+        threading.Thread(target=run, daemon=True, name="intent-router-train").start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取路由来源分布、与客户端指定预设的一致率和训练信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            outcomes = self._conn.execute("""
+                SELECT preset_type, model_type, COUNT(*), SUM(success), AVG(duration)
+                FROM route_decisions WHERE success IS NOT NULL
+                GROUP BY preset_type, model_type
+            """).fetchall()
+        compared = stats["agreed"] + stats["disagreed"]
+        total_route_ms = stats.pop("total_route_ms")
+        return {
+            **stats,
+            "agreement": round(stats["agreed"] / compared, 3) if compared else None,
+            "avg_route_ms": round(total_route_ms / stats["routed"], 3) if stats["routed"] else None,
+            "outcomes": [
+                {"preset_type": preset_type, "model_type": model_type, "requests": count,
+                 "success_rate": round((succeeded or 0) / count, 3),
+                 "avg_duration": round(avg_duration, 2) if avg_duration is not None else None}
+                for preset_type, model_type, count, succeeded, avg_duration in outcomes
+            ],
+            "training": self._training or None
+        }
+
+
+# 全局意图路由实例
+intent_router = None
+_intent_router_lock = threading.Lock()
+
+def get_intent_router() -> IntentRouter:
+    """获取意图路由实例（首次创建时在后台训练分类器）"""
+    global intent_router
+    with _intent_router_lock:
+        if intent_router is None:
+            intent_router = IntentRouter()
+            intent_router.retrain_in_background()
+    return intent_router
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="训练意图分类器并测试路由")
+    parser.add_argument("queries", nargs="*", help="测试查询")
+    args = parser.parse_args()
+
+    router = IntentRouter()
+    print(f"📚 训练结果: {router.retrain()}")
+    for query in args.queries:
+        start = time.perf_counter()
+        preset_type, confidence, source = router.classify(query)
+        preset_type = preset_type or "custom"
+        model_type = router.choose_model_type(preset_type, query)
+        print(f"🔍 {query} → {preset_type} / {model_type}（{source}，置信度 {confidence:.2f}，"
+              f"{(time.perf_counter() - start) * 1000:.2f}ms）")
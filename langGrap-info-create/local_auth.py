@@ -0,0 +1,224 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import base64
+import hashlib
+import secrets
+import sqlite3
+from typing import Optional, Dict, Any
+from dotenv import load_dotenv
+from local_storage import get_local_database
+
+# 加载环境变量
+load_dotenv()
+
+# 访问令牌有效期（秒）
+ACCESS_TOKEN_TTL = int(os.getenv("LOCAL_AUTH_TOKEN_TTL", "3600"))
+PBKDF2_ITERATIONS = 200_000
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class LocalAuthManager:
+    """本地用户认证管理器
+
+    在 STORAGE_BACKEND=sqlite 时代替Supabase Auth，接口和返回格式与 AuthManager 相同，
+    用户和会话保存在本地SQLite中，访问令牌为带HMAC签名的短期令牌。
+    """
+
+    def __init__(self, database=None):
+        """初始化本地数据库和令牌签名密钥"""
+        self.db = database or get_local_database()
+        secret = os.getenv("LOCAL_AUTH_SECRET") or os.getenv("FLASK_SECRET_KEY")
+        if not secret:
+            raise ValueError("请在.env文件中配置LOCAL_AUTH_SECRET或FLASK_SECRET_KEY")
+        self._secret = secret.encode("utf-8")
+
+    @staticmethod
+    def _hash_password(password: str, salt: Optional[bytes] = None) -> str:
+        """使用PBKDF2计算密码哈希"""
+        salt = salt or secrets.token_bytes(16)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64encode(salt)}${_b64encode(digest)}"
+
+    @staticmethod
+    def _verify_password(password: str, password_hash: str) -> bool:
+        """校验密码"""
+        try:
+            _, iterations, salt, expected = password_hash.split("$")
+            digest = hashlib.pbkdf2_hmac(
+                "sha256", password.encode("utf-8"), _b64decode(salt), int(iterations)
+            )
+            return hmac.compare_digest(_b64encode(digest), expected)
+        except ValueError:
+            return False
+
+    def _sign(self, payload: Dict[str, Any]) -> str:
+        """生成签名令牌"""
+        body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        signature = _b64encode(hmac.new(self._secret, body.encode("ascii"), hashlib.sha256).digest())
+        return f"{body}.{signature}"
+
+    def _verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """校验令牌签名和有效期"""
+        try:
+            body, signature = token.split(".")
+            expected = _b64encode(hmac.new(self._secret, body.encode("ascii"), hashlib.sha256).digest())
+            if not hmac.compare_digest(signature, expected):
+                return None
+            payload = json.loads(_b64decode(body))
+        except (ValueError, json.JSONDecodeError):
+            return None
+        if payload.get("exp", 0) < time.time():
+            return None
+        return payload
+
+    def _create_session(self, user_id: str) -> Dict[str, str]:
+        """创建登录会话，返回访问令牌和刷新令牌"""
+        session_id = str(uuid.uuid4())
+        refresh_token = secrets.token_urlsafe(32)
+        self.db.conn.execute(
+            "INSERT INTO user_sessions (id, user_id, refresh_token_hash) VALUES (?, ?, ?)",
+            (session_id, user_id, hashlib.sha256(refresh_token.encode("utf-8")).hexdigest())
+        )
+        access_token = self._sign({
+            "sub": user_id,
+            "sid": session_id,
+            "exp": int(time.time()) + ACCESS_TOKEN_TTL
+        })
+        return {"access_token": access_token, "refresh_token": refresh_token}
+
+    def register(self, email: str, password: str, username: Optional[str] = None) -> Dict[str, Any]:
+        """用户注册"""
+        try:
+            user_id = str(uuid.uuid4())
+            username = username or email.split("@")[0]
+            self.db.conn.execute(
+                "INSERT INTO users (id, email, password_hash, username) VALUES (?, ?, ?, ?)",
+                (user_id, email.lower(), self._hash_password(password), username)
+            )
+            return {
+                "success": True,
+                "message": "注册成功！",
+                "user": {
+                    "id": user_id,
+                    "email": email.lower(),
+                    "username": username
+                }
+            }
+        except sqlite3.IntegrityError:
+            return {
+                "success": False,
+                "message": "注册失败: 该邮箱已注册"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"注册失败: {str(e)}"
+            }
+
+    def login(self, email: str, password: str) -> Dict[str, Any]:
+        """用户登录"""
+        try:
+            row = self.db.conn.execute(
+                "SELECT id, email, password_hash, username FROM users WHERE email = ?",
+                (email.lower(),)
+            ).fetchone()
+
+            if not row or not self._verify_password(password, row["password_hash"]):
+                return {
+                    "success": False,
+                    "message": "登录失败，请检查邮箱和密码"
+                }
+
+            return {
+                "success": True,
+                "message": "登录成功！",
+                "user": {
+                    "id": row["id"],
+                    "email": row["email"],
+                    "username": row["username"] or email.split("@")[0]
+                },
+                "session": self._create_session(row["id"])
+            }
+
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"登录失败: {str(e)}"
+            }
+
+    def logout(self, access_token: Optional[str] = None) -> Dict[str, Any]:
+        """用户登出（删除访问令牌对应的会话）"""
+        try:
+            payload = self._verify(access_token) if access_token else None
+            if payload:
+                self.db.conn.execute("DELETE FROM user_sessions WHERE id = ?", (payload["sid"],))
+            return {
+                "success": True,
+                "message": "登出成功"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"登出失败: {str(e)}"
+            }
+
+    def get_current_user(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """获取当前用户信息"""
+        try:
+            payload = self._verify(access_token)
+            if not payload:
+                return None
+
+            row = self.db.conn.execute(
+                "SELECT u.id, u.email, u.username, u.created_at FROM user_sessions s "
+                "JOIN users u ON u.id = s.user_id WHERE s.id = ? AND s.user_id = ?",
+                (payload["sid"], payload["sub"])
+            ).fetchone()
+            if not row:
+                return None
+
+            return {
+                "id": row["id"],
+                "email": row["email"],
+                "username": row["username"] or row["email"].split("@")[0],
+                "created_at": row["created_at"]
+            }
+
+        except Exception as e:
+            print(f"❌ 获取用户信息失败: {e}")
+            return None
+
+    def refresh_session(self, refresh_token: str) -> Dict[str, Any]:
+        """刷新用户会话（刷新令牌一次性使用）"""
+        try:
+            token_hash = hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+            row = self.db.conn.execute(
+                "DELETE FROM user_sessions WHERE refresh_token_hash = ? RETURNING user_id",
+                (token_hash,)
+            ).fetchone()
+
+            if not row:
+                return {
+                    "success": False,
+                    "message": "会话刷新失败"
+                }
+
+            return {
+                "success": True,
+                "session": self._create_session(row["user_id"])
+            }
+
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"会话刷新失败: {str(e)}"
+            }
@@ -0,0 +1,156 @@
+-- 本地SQLite存储表结构
+-- 与 database_schema.sql 中的Supabase表结构保持一致，供 STORAGE_BACKEND=sqlite 时使用
+
+-- 本地用户表（代替Supabase Auth）
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    username TEXT,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+-- 本地登录会话表（刷新令牌只保存哈希）
+CREATE TABLE IF NOT EXISTS user_sessions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    refresh_token_hash TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+-- 用户提示词历史记录表
+CREATE TABLE IF NOT EXISTS prompt_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    prompt_type TEXT DEFAULT 'custom',
+    model_type TEXT DEFAULT 'simple',
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    response_preview TEXT GENERATED ALWAYS AS (substr(response, 1, 200)) STORED,
+    response_length INTEGER GENERATED ALWAYS AS (length(response)) STORED
+);
+
+-- 用户网页生成记录表
+CREATE TABLE IF NOT EXISTS webpage_generations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    html_content TEXT,
+    filename TEXT,
+    design_type TEXT DEFAULT 'ai_design',
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    content_hash TEXT,
+    content_size INTEGER,
+    html_size INTEGER GENERATED ALWAYS AS (length(CAST(html_content AS BLOB))) STORED
+);
+
+-- 提示词历史归档表：超过保留期的记录从 prompt_history 移到这里，回复压缩后保存
+-- response_encoding 为压缩格式（zstd 或 gzip），预览和长度在归档时写入，列表接口无需解压
+CREATE TABLE IF NOT EXISTS prompt_history_archive (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    response_blob BLOB NOT NULL,
+    response_encoding TEXT NOT NULL,
+    response_preview TEXT,
+    response_length INTEGER,
+    prompt_type TEXT,
+    model_type TEXT,
+    created_at TEXT NOT NULL,
+    archived_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+-- 键集分页使用的复合索引
+CREATE INDEX IF NOT EXISTS idx_prompt_history_user_created ON prompt_history(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_prompt_history_user_type_created ON prompt_history(user_id, prompt_type, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_webpage_generations_user_created ON webpage_generations(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_prompt_history_archive_user_created ON prompt_history_archive(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_prompt_history_archive_created ON prompt_history_archive(created_at);
+
+-- 用户历史记录计数表（由触发器维护）
+CREATE TABLE IF NOT EXISTS user_history_counters (
+    user_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    item_type TEXT NOT NULL,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, source, item_type)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_count_insert AFTER INSERT ON prompt_history
+BEGIN
+    INSERT INTO user_history_counters (user_id, source, item_type, item_count)
+    VALUES (NEW.user_id, 'prompt', COALESCE(NEW.prompt_type, 'unknown'), 1)
+    ON CONFLICT (user_id, source, item_type) DO UPDATE SET item_count = item_count + 1;
+END;
+
+-- 归档时先写入归档表再从热表删除，这种删除不减少计数
+DROP TRIGGER IF EXISTS trg_prompt_history_count_delete;
+CREATE TRIGGER trg_prompt_history_count_delete AFTER DELETE ON prompt_history
+WHEN NOT EXISTS (SELECT 1 FROM prompt_history_archive WHERE id = OLD.id)
+BEGIN
+    UPDATE user_history_counters SET item_count = max(item_count - 1, 0)
+    WHERE user_id = OLD.user_id AND source = 'prompt' AND item_type = COALESCE(OLD.prompt_type, 'unknown');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_archive_count_delete AFTER DELETE ON prompt_history_archive
+BEGIN
+    UPDATE user_history_counters SET item_count = max(item_count - 1, 0)
+    WHERE user_id = OLD.user_id AND source = 'prompt' AND item_type = COALESCE(OLD.prompt_type, 'unknown');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_webpage_generations_count_insert AFTER INSERT ON webpage_generations
+BEGIN
+    INSERT INTO user_history_counters (user_id, source, item_type, item_count)
+    VALUES (NEW.user_id, 'webpage', COALESCE(NEW.design_type, 'unknown'), 1)
+    ON CONFLICT (user_id, source, item_type) DO UPDATE SET item_count = item_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_webpage_generations_count_delete AFTER DELETE ON webpage_generations
+BEGIN
+    UPDATE user_history_counters SET item_count = max(item_count - 1, 0)
+    WHERE user_id = OLD.user_id AND source = 'webpage' AND item_type = COALESCE(OLD.design_type, 'unknown');
+END;
+
+-- 全文索引（FTS5），写入的是 cjk_bigram_text() 分词后的文本，中文按二元组建立索引
+-- cjk_bigram_text 由 local_storage.py 在每个连接上注册
+CREATE VIRTUAL TABLE IF NOT EXISTS prompt_history_fts USING fts5(
+    prompt, response, content='prompt_history', content_rowid='id'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS webpage_generations_fts USING fts5(
+    prompt, content='webpage_generations', content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_fts_insert AFTER INSERT ON prompt_history
+BEGIN
+    INSERT INTO prompt_history_fts (rowid, prompt, response)
+    VALUES (NEW.id, cjk_bigram_text(NEW.prompt), cjk_bigram_text(substr(NEW.response, 1, 20000)));
+END;
+
+-- 归档的记录保留索引条目（归档表沿用原id），搜索时与归档表关联；删除归档记录时再移除
+DROP TRIGGER IF EXISTS trg_prompt_history_fts_delete;
+CREATE TRIGGER trg_prompt_history_fts_delete AFTER DELETE ON prompt_history
+WHEN NOT EXISTS (SELECT 1 FROM prompt_history_archive WHERE id = OLD.id)
+BEGIN
+    INSERT INTO prompt_history_fts (prompt_history_fts, rowid, prompt, response)
+    VALUES ('delete', OLD.id, cjk_bigram_text(OLD.prompt), cjk_bigram_text(substr(OLD.response, 1, 20000)));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_archive_fts_delete AFTER DELETE ON prompt_history_archive
+BEGIN
+    INSERT INTO prompt_history_fts (prompt_history_fts, rowid, prompt, response)
+    VALUES ('delete', OLD.id, cjk_bigram_text(OLD.prompt),
+            cjk_bigram_text(substr(decompress_text(OLD.response_blob, OLD.response_encoding), 1, 20000)));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_webpage_generations_fts_insert AFTER INSERT ON webpage_generations
+BEGIN
+    INSERT INTO webpage_generations_fts (rowid, prompt) VALUES (NEW.id, cjk_bigram_text(NEW.prompt));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_webpage_generations_fts_delete AFTER DELETE ON webpage_generations
+BEGIN
+    INSERT INTO webpage_generations_fts (webpage_generations_fts, rowid, prompt)
+    VALUES ('delete', OLD.id, cjk_bigram_text(OLD.prompt));
+END;
@@ -0,0 +1,563 @@
+import os
+import re
+import json
+import math
+import mmap
+import time
+import heapq
+import hashlib
+import sqlite3
+import argparse
+import threading
+from array import array
+from collections import Counter
+from urllib.parse import urlsplit
+from typing import Optional, Dict, Any, List, Tuple, Iterator, Type
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+from langchain_core.tools import BaseTool
+from text_utils import tokenize, bm25_scores
+from content_condenser import get_content_condenser, split_passages
+from tool_output import format_tool_output, TAVILY_SEARCH_FIELDS
+from search_profiles import SEARCH_PROFILES, current_preset, select_search_profile, get_search_profile_stats
+from text_utils import estimate_tokens
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# 加载环境变量
+load_dotenv()
+
+# 参与索引的文件类型，.jsonl 文件每行一个文档（url、title、content 字段）
+CORPUS_EXTENSIONS = (".txt", ".md", ".markdown", ".html", ".htm", ".jsonl")
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 段数超过上限或已删除文档占比过高时合并为一个段
+MAX_SEGMENTS = int(os.getenv("LOCAL_SEARCH_MAX_SEGMENTS", "8"))
+MAX_DELETED_RATIO = 0.3
+SNIPPET_CHARS = 500
+
+_SCRIPT_RE = re.compile(r'<(script|style|noscript)[^>]*>.*?</\1>', re.IGNORECASE | re.DOTALL)
+_TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+_BLOCK_TAG_RE = re.compile(r'</?(p|div|br|li|h[1-6]|tr|section|article)[^>]*>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    signature TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    file TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    url TEXT,
+    title TEXT,
+    content TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_docs_file ON docs(file, deleted);
+CREATE TABLE IF NOT EXISTS segments (
+    segment INTEGER PRIMARY KEY,
+    doc_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    df INTEGER NOT NULL,
+    PRIMARY KEY (term, segment)
+) WITHOUT ROWID;
+"""
+
+
+def _html_to_text(html: str) -> Tuple[Optional[str], str]:
+    """从HTML中取出标题和正文文本"""
+    match = _TITLE_RE.search(html)
+    title = ' '.join(_TAG_RE.sub('', match.group(1)).split()) if match else None
+    text = _SCRIPT_RE.sub('', html)
+    text = _BLOCK_TAG_RE.sub('\n', text)
+    text = _TAG_RE.sub('', text)
+    for entity, char in (('&nbsp;', ' '), ('&lt;', '<'), ('&gt;', '>'), ('&quot;', '"'), ('&#39;', "'"), ('&amp;', '&')):
+        text = text.replace(entity, char)
+    return title, text
+
+
+def _load_file(path: str) -> Iterator[Dict[str, Any]]:
+    """读取语料文件，返回文档（source 为文档在语料中的唯一标识）"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        if path.endswith('.jsonl'):
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠️ 跳过无法解析的行: {path}:{line_no}")
+                    continue
+                content = record.get('content') or record.get('text') or record.get('body') or ''
+                if not content:
+                    continue
+                url = record.get('url') or f"file://{path}#{line_no}"
+                yield {
+                    "source": f"{path}#{record.get('id') or record.get('url') or line_no}",
+                    "signature": hashlib.sha1(line.encode('utf-8')).hexdigest(),
+                    "url": url,
+                    "title": record.get('title') or url,
+                    "content": content
+                }
+            return
+
+        text = f.read()
+    title = None
+    if path.endswith(('.html', '.htm')):
+        title, text = _html_to_text(text)
+    if not title:
+        first_line = next((line.strip(' #') for line in text.splitlines() if line.strip()), '')
+        title = first_line[:100] or os.path.basename(path)
+    yield {
+        "source": path,
+        "signature": hashlib.sha1(text.encode('utf-8')).hexdigest(),
+        "url": f"file://{path}",
+        "title": title,
+        "content": text
+    }
+
+
+def _iter_corpus_files(corpus_path: str) -> Iterator[str]:
+    """列出语料目录（或单个语料文件）中参与索引的文件"""
+    if os.path.isfile(corpus_path):
+        yield os.path.abspath(corpus_path)
+        return
+    for root, dirs, files in os.walk(corpus_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.lower().endswith(CORPUS_EXTENSIONS):
+                yield os.path.abspath(os.path.join(root, name))
+
+
+class LocalSearchIndex:
+    """本地BM25倒排索引
+
+    文档和词典保存在索引目录的SQLite文件中，倒排表按段写入二进制文件（每个词项连续存放
+    (文档ID, 词频) 的uint32对），查询时通过mmap读取，不需要把倒排表加载到内存。
+    增量更新时只重新读取变化的文件，新文档写入新段，修改或删除的文档标记为已删除，
+    段数过多或已删除文档过多时合并为一个段。
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.db_path = os.path.join(index_dir, "index.db")
+        os.makedirs(index_dir, exist_ok=True)
+        self._conn = self._connect()
+        self._conn.executescript(INDEX_SCHEMA)
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self.refreshed_at = 0.0
+        self._segments: Dict[int, Any] = {}
+        self._query_stats = {"queries": 0, "total_latency": 0.0, "max_latency": 0.0}
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.index_dir, f"segment_{segment}.postings")
+
+    def _load(self):
+        """加载文档长度和存活标记，mmap所有段的倒排文件（调用方持有锁）"""
+        max_id = self._conn.execute("SELECT COALESCE(MAX(doc_id), 0) FROM docs").fetchone()[0]
+        lengths = array('I', bytes(4 * (max_id + 1)))
+        live = bytearray(max_id + 1)
+        total_length = 0
+        for doc_id, length in self._conn.execute("SELECT doc_id, length FROM docs WHERE deleted = 0"):
+            lengths[doc_id] = length
+            live[doc_id] = 1
+            total_length += length
+        self._live_count = sum(live)
+        self._avg_length = total_length / self._live_count if self._live_count else 1.0
+        self._lengths = lengths
+        self._live = live
+        if NUMPY_AVAILABLE:
+            self._np_lengths = np.frombuffer(lengths, dtype=np.uint32).astype(np.float64)
+            self._np_live = np.frombuffer(bytes(live), dtype=np.uint8).astype(bool)
+
+        # 旧段的映射在不再被引用后自动关闭
+        segments = {}
+        for (segment,) in self._conn.execute("SELECT segment FROM segments"):
+            path = self._segment_path(segment)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                segments[segment] = array('I')
+                continue
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            segments[segment] = np.frombuffer(mapped, dtype=np.uint32) if NUMPY_AVAILABLE else memoryview(mapped).cast('I')
+        self._segments = segments
+
+    def _write_segment(self, conn: sqlite3.Connection, segment: int, docs: List[Tuple[int, List[str]]]):
+        """把一批文档写成新段"""
+        postings: Dict[str, array] = {}
+        for doc_id, tokens in docs:
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, array('I')).extend((doc_id, tf))
+
+        rows = []
+        offset = 0
+        with open(self._segment_path(segment), 'wb') as f:
+            for term in sorted(postings):
+                pairs = postings[term]
+                pairs.tofile(f)
+                rows.append((term, segment, offset, len(pairs) // 2))
+                offset += len(pairs)
+        conn.executemany("INSERT INTO terms (term, segment, offset, df) VALUES (?, ?, ?, ?)", rows)
+        conn.execute("INSERT INTO segments (segment, doc_count) VALUES (?, ?)", (segment, len(docs)))
+
+    def _commit_and_load(self, conn: sqlite3.Connection):
+        """提交写入并重新加载，期间查询等待，保证内存状态与数据库一致"""
+        with self._lock:
+            conn.execute("COMMIT")
+            self._load()
+
+    def _merge_segments(self, conn: sqlite3.Connection):
+        """把所有存活文档重新写成一个段并清理已删除文档"""
+        old_segments = [row[0] for row in conn.execute("SELECT segment FROM segments")]
+        segment = max(old_segments, default=0) + 1
+        docs = [
+            (doc_id, tokenize(f"{title or ''}\n{content}"))
+            for doc_id, title, content in conn.execute(
+                "SELECT doc_id, title, content FROM docs WHERE deleted = 0 ORDER BY doc_id"
+            )
+        ]
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM terms")
+            conn.execute("DELETE FROM segments")
+            conn.execute("DELETE FROM docs WHERE deleted = 1")
+            self._write_segment(conn, segment, docs)
+            self._commit_and_load(conn)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for old in old_segments:
+            try:
+                os.remove(self._segment_path(old))
+            except OSError:
+                pass
+        print(f"🗜️ 本地搜索索引已合并: {len(old_segments)} 个段 → 1 个段，{len(docs)} 个文档")
+
+    def refresh(self, corpus_path: str) -> Dict[str, Any]:
+        """按语料目录增量更新索引，返回新增、删除的文档数
+
+        读取文件和写入新段时不阻塞查询，只有提交和重新加载时短暂持有锁。
+        """
+        started = time.perf_counter()
+        with self._refresh_lock:
+            conn = self._connect()
+            try:
+                known_files = dict(conn.execute("SELECT path, signature FROM files"))
+                seen_files = set()
+                new_docs = []
+                deleted = 0
+
+                conn.execute("BEGIN")
+                try:
+                    for path in _iter_corpus_files(corpus_path):
+                        seen_files.add(path)
+                        stat = os.stat(path)
+                        file_signature = f"{stat.st_mtime_ns}:{stat.st_size}"
+                        if known_files.get(path) == file_signature:
+                            continue
+
+                        existing = {
+                            source: (doc_id, signature)
+                            for doc_id, source, signature in conn.execute(
+                                "SELECT doc_id, source, signature FROM docs WHERE file = ? AND deleted = 0", (path,)
+                            )
+                        }
+                        for entry in _load_file(path):
+                            current = existing.pop(entry["source"], None)
+                            if current and current[1] == entry["signature"]:
+                                continue
+                            if current:
+                                conn.execute("UPDATE docs SET deleted = 1 WHERE doc_id = ?", (current[0],))
+                                deleted += 1
+                            tokens = tokenize(f"{entry['title']}\n{entry['content']}")
+                            doc_id = conn.execute(
+                                "INSERT INTO docs (source, file, signature, url, title, content, length) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (entry["source"], path, entry["signature"], entry["url"], entry["title"],
+                                 entry["content"], len(tokens))
+                            ).lastrowid
+                            new_docs.append((doc_id, tokens))
+                        # 文件中已不存在的文档
+                        for doc_id, _ in existing.values():
+                            conn.execute("UPDATE docs SET deleted = 1 WHERE doc_id = ?", (doc_id,))
+                            deleted += 1
+                        conn.execute(
+                            "INSERT OR REPLACE INTO files (path, signature) VALUES (?, ?)", (path, file_signature)
+                        )
+
+                    for path in set(known_files) - seen_files:
+                        deleted += conn.execute(
+                            "UPDATE docs SET deleted = 1 WHERE file = ? AND deleted = 0", (path,)
+                        ).rowcount
+                        conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+                    if new_docs:
+                        segment = conn.execute("SELECT COALESCE(MAX(segment), 0) + 1 FROM segments").fetchone()[0]
+                        self._write_segment(conn, segment, new_docs)
+                    self._commit_and_load(conn)
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+
+                segment_count, total_docs, deleted_docs = conn.execute(
+                    "SELECT (SELECT COUNT(*) FROM segments), COUNT(*), COALESCE(SUM(deleted), 0) FROM docs"
+                ).fetchone()
+                if segment_count > MAX_SEGMENTS or (total_docs and deleted_docs / total_docs > MAX_DELETED_RATIO):
+                    self._merge_segments(conn)
+            finally:
+                conn.close()
+            self.refreshed_at = time.time()
+
+        stats = {
+            "added": len(new_docs),
+            "deleted": deleted,
+            "documents": self._live_count,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        if new_docs or deleted:
+            print(f"📚 本地搜索索引已更新: 新增 {len(new_docs)} 个，删除 {deleted} 个，共 {self._live_count} 个文档")
+        return stats
+
+    def refresh_in_background(self, corpus_path: str):
+        """在后台线程中增量更新索引，同时只运行一次"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(corpus_path)
+            except Exception as e:
+                print(f"❌ 本地搜索索引更新失败: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="local-search-refresh", daemon=True).start()
+
+    def _score(self, query_terms: List[str]) -> Dict[int, float]:
+        """按BM25计算包含查询词的文档得分（调用方持有锁）"""
+        if not query_terms or not self._live_count:
+            return {}
+        placeholders = ",".join("?" * len(query_terms))
+        rows = self._conn.execute(
+            f"SELECT term, segment, offset, df FROM terms WHERE term IN ({placeholders})", query_terms
+        ).fetchall()
+        doc_freq = Counter()
+        for term, _, _, df in rows:
+            doc_freq[term] += df
+        idf = {
+            term: math.log(1 + (self._live_count - min(df, self._live_count) + 0.5) / (df + 0.5))
+            for term, df in doc_freq.items()
+        }
+
+        if NUMPY_AVAILABLE:
+            scores = np.zeros(len(self._lengths), dtype=np.float64)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._np_lengths / self._avg_length)
+            for term, segment, offset, df in rows:
+                pairs = self._segments[segment][offset:offset + 2 * df]
+                doc_ids = pairs[0::2]
+                tf = pairs[1::2].astype(np.float64)
+                np.add.at(scores, doc_ids, idf[term] * tf * (BM25_K1 + 1) / (tf + norm[doc_ids]))
+            scores[~self._np_live] = 0
+            matched = np.flatnonzero(scores)
+            return dict(zip(matched.tolist(), scores[matched].tolist()))
+
+        scores: Dict[int, float] = {}
+        for term, segment, offset, df in rows:
+            pairs = self._segments[segment][offset:offset + 2 * df]
+            weight = idf[term]
+            for i in range(0, len(pairs), 2):
+                doc_id, tf = pairs[i], pairs[i + 1]
+                if not self._live[doc_id]:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / self._avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    @staticmethod
+    def _domain_allowed(url: str, include_domains: Optional[List[str]],
+                        exclude_domains: Optional[List[str]]) -> bool:
+        host = (urlsplit(url or '').hostname or '').lower()
+
+        def matches(domains):
+            return any(host == d.lower() or host.endswith('.' + d.lower()) for d in domains)
+
+        if include_domains and not matches(include_domains):
+            return False
+        if exclude_domains and matches(exclude_domains):
+            return False
+        return True
+
+    def search(self, query: str, max_results: int = 5, include_raw_content: bool = False,
+               include_domains: Optional[List[str]] = None,
+               exclude_domains: Optional[List[str]] = None) -> Dict[str, Any]:
+        """查询索引，返回与Tavily搜索相同结构的结果"""
+        started = time.perf_counter()
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            scores = self._score(query_terms)
+            # 有域名过滤时多取一些候选
+            candidates = max_results * 5 if include_domains or exclude_domains else max_results
+            top = heapq.nlargest(candidates, scores.items(), key=lambda item: item[1])
+            rows = {}
+            if top:
+                placeholders = ",".join("?" * len(top))
+                rows = {
+                    row[0]: row for row in self._conn.execute(
+                        f"SELECT doc_id, url, title, content FROM docs WHERE doc_id IN ({placeholders})",
+                        [doc_id for doc_id, _ in top]
+                    )
+                }
+
+        results = []
+        best = top[0][1] if top else 1.0
+        for doc_id, score in top:
+            _, url, title, content = rows[doc_id]
+            if not self._domain_allowed(url, include_domains, exclude_domains):
+                continue
+            passages = split_passages(content)
+            snippet = passages[0] if passages else content
+            if len(passages) > 1:
+                passage_scores = bm25_scores(query_terms, [tokenize(passage) for passage in passages])
+                snippet = passages[max(range(len(passages)), key=passage_scores.__getitem__)]
+            item = {"title": title, "url": url, "content": snippet[:SNIPPET_CHARS], "score": round(score / best, 4)}
+            if include_raw_content:
+                item["raw_content"] = content
+            results.append(item)
+            if len(results) >= max_results:
+                break
+
+        latency = time.perf_counter() - started
+        with self._lock:
+            self._query_stats["queries"] += 1
+            self._query_stats["total_latency"] += latency
+            self._query_stats["max_latency"] = max(self._query_stats["max_latency"], latency)
+        return {"query": query, "results": results, "response_time": round(latency, 4)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引规模和查询延迟（毫秒）"""
+        with self._lock:
+            queries = self._query_stats["queries"]
+            return {
+                "documents": self._live_count,
+                "segments": len(self._segments),
+                "terms": self._conn.execute("SELECT COUNT(DISTINCT term) FROM terms").fetchone()[0],
+                "queries": queries,
+                "avg_latency_ms": round(self._query_stats["total_latency"] / queries * 1000, 2) if queries else 0.0,
+                "max_latency_ms": round(self._query_stats["max_latency"] * 1000, 2),
+                "engine": "numpy" if NUMPY_AVAILABLE else "python",
+                "refreshed_at": self.refreshed_at
+            }
+
+
+# 全局本地索引实例
+local_search_index = None
+_local_search_index_lock = threading.Lock()
+LOCAL_SEARCH_CORPUS = os.getenv("LOCAL_SEARCH_CORPUS")
+# 查询时距上次更新超过该秒数则在后台增量更新，0表示只在启动时更新
+LOCAL_SEARCH_REFRESH_INTERVAL = float(os.getenv("LOCAL_SEARCH_REFRESH_INTERVAL", "0"))
+
+def get_local_search_index() -> LocalSearchIndex:
+    """获取本地搜索索引实例，首次获取时按LOCAL_SEARCH_CORPUS增量更新"""
+    global local_search_index
+    with _local_search_index_lock:
+        if local_search_index is None:
+            local_search_index = LocalSearchIndex(os.getenv(
+                "LOCAL_SEARCH_INDEX_DIR",
+                os.path.join(os.path.dirname(__file__), "local_search_index")
+            ))
+            if LOCAL_SEARCH_CORPUS:
+                local_search_index.refresh(LOCAL_SEARCH_CORPUS)
+    if (LOCAL_SEARCH_CORPUS and LOCAL_SEARCH_REFRESH_INTERVAL > 0
+            and time.time() - local_search_index.refreshed_at > LOCAL_SEARCH_REFRESH_INTERVAL):
+        local_search_index.refresh_in_background(LOCAL_SEARCH_CORPUS)
+    return local_search_index
+
+
+class LocalSearchInput(BaseModel):
+    """本地搜索工具参数（与Tavily搜索工具的常用参数一致）"""
+    query: str = Field(description="搜索查询")
+    include_domains: Optional[List[str]] = Field(default=None, description="只返回这些域名下的结果")
+    exclude_domains: Optional[List[str]] = Field(default=None, description="排除这些域名下的结果")
+
+
+class LocalSearchTool(BaseTool):
+    """基于本地BM25索引的搜索工具
+
+    工具名称、参数和结果结构与 TavilySearchWithLogging 相同，配置 SEARCH_BACKEND=local 时替换网络搜索。
+    同样按搜索档位决定结果数和是否返回原始内容。
+    """
+
+    name: str = "tavily_search"
+    description: str = "本地知识库搜索工具，用于从内部文档中检索相关信息。"
+    args_schema: Type[BaseModel] = LocalSearchInput
+
+    def _run(self, query: str, include_domains: Optional[List[str]] = None,
+             exclude_domains: Optional[List[str]] = None, **kwargs) -> str:
+        """查询本地索引并按档位精简输出"""
+        preset_type = current_preset.get()
+        profile = select_search_profile(preset_type, query)
+        settings = SEARCH_PROFILES[profile]
+        print(f"🔍 正在使用本地索引搜索: {query}（档位: {profile}）")
+        started = time.perf_counter()
+        try:
+            result = get_local_search_index().search(
+                query, settings["max_results"], bool(settings["include_raw_content"]),
+                include_domains, exclude_domains
+            )
+            if settings["include_raw_content"] and result["results"]:
+                result, _ = get_content_condenser().condense(result, query, settings["content_token_budget"])
+            print(f"✅ 本地搜索完成: {len(result['results'])} 条结果，耗时 {result['response_time'] * 1000:.1f}ms")
+            output = format_tool_output(result, settings["output_token_budget"], TAVILY_SEARCH_FIELDS)
+        except Exception as e:
+            print(f"❌ 本地搜索出错: {str(e)}")
+            output = format_tool_output({"error": {"type": "error", "message": str(e), "retryable": False}})
+        get_search_profile_stats().record(
+            f"local:{profile}", time.perf_counter() - started, estimate_tokens(output)
+        )
+        return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="构建本地搜索索引并测试查询延迟")
+    parser.add_argument("corpus", help="语料目录或 .jsonl 文件")
+    parser.add_argument("--index-dir", default=os.path.join(os.path.dirname(__file__), "local_search_index"))
+    parser.add_argument("--query", action="append", default=[], help="测试查询，可重复指定")
+    parser.add_argument("--repeat", type=int, default=20, help="每个测试查询的执行次数")
+    args = parser.parse_args()
+
+    index = LocalSearchIndex(args.index_dir)
+    print(f"📚 索引更新结果: {index.refresh(args.corpus)}")
+    for query in args.query:
+        latencies = []
+        for _ in range(args.repeat):
+            result = index.search(query)
+            latencies.append(result["response_time"] * 1000)
+        latencies.sort()
+        print(f"🔍 {query}: {len(result['results'])} 条结果，"
+              f"p50 {latencies[len(latencies) // 2]:.2f}ms，max {latencies[-1]:.2f}ms")
+        for item in result["results"][:3]:
+            print(f"   {item['score']:.3f}  {item['title']}  {item['url']}")
+    print(f"📊 {index.get_stats()}")
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from text_utils import cjk_bigram_text
+from blob_store import decompress_bytes
+
+# 加载环境变量
+load_dotenv()
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'local_schema.sql')
+
+
+def get_storage_backend_name() -> str:
+    """当前使用的存储后端：supabase（默认）或 sqlite"""
+    return os.getenv("STORAGE_BACKEND", "supabase").strip().lower()
+
+
+def _decompress_text(data: bytes, encoding: str) -> str:
+    """解压归档回复为文本"""
+    return decompress_bytes(data, encoding).decode('utf-8')
+
+
+class LocalDatabase:
+    """本地SQLite数据库
+
+    每个线程使用独立连接，开启WAL模式以支持并发读写，首次打开时按 local_schema.sql 建表。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建新连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        # 全文索引触发器使用的分词函数，与Postgres中的同名函数规则一致
+        conn.create_function("cjk_bigram_text", 1, cjk_bigram_text, deterministic=True)
+        # 读取归档表中压缩保存的回复（全文索引删除和搜索摘要使用）
+        conn.create_function("decompress_text", 2, _decompress_text, deterministic=True)
+        return conn
+
+    def _ensure_schema(self, conn: sqlite3.Connection):
+        """首次使用时创建表结构"""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if not self._initialized:
+                with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+                    conn.executescript(f.read())
+                self._initialized = True
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._ensure_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """在事务中执行多条语句"""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+# 全局本地数据库实例
+local_database = None
+_local_database_lock = threading.Lock()
+
+def get_local_database() -> LocalDatabase:
+    """获取本地数据库实例"""
+    global local_database
+    with _local_database_lock:
+        if local_database is None:
+            db_path = os.getenv(
+                "LOCAL_DB_PATH",
+                os.path.join(os.path.dirname(__file__), 'local_storage.db')
+            )
+            local_database = LocalDatabase(db_path)
+    return local_database
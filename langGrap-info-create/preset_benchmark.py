@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+预设Agent基准测试 - 比较绑定全部工具和只绑定预设所需工具时的提示词token
+运行方式:
+    python preset_benchmark.py                          # 只统计工具定义和提示词的token（不调用模型）
+    python preset_benchmark.py --live calculate=2+3*4   # 实际运行查询，比较模型上报的输入token和耗时
+"""
+
+import json
+import time
+import argparse
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.prebuilt import create_react_agent
+from text_utils import estimate_tokens
+from preset_registry import PRESET_REGISTRY, build_preset_prompt
+from search_profiles import current_preset
+import web_agent
+
+
+def tool_schema_tokens(tools) -> int:
+    """估计工具定义（每次模型调用都会携带）的token数"""
+    return estimate_tokens(json.dumps([convert_to_openai_tool(tool) for tool in tools], ensure_ascii=False))
+
+
+def report_static():
+    """统计每个预设每次模型调用携带的工具定义token"""
+    full_tokens = tool_schema_tokens(web_agent.agent_tools)
+    print(f"🧰 全部工具 {len(web_agent.agent_tools)} 个，工具定义约 {full_tokens} tokens/次调用\n")
+    print(f"{'预设':<10}{'工具':<34}{'工具定义':>8}{'节省':>8}{'提示词':>8}")
+    for preset_type in PRESET_REGISTRY:
+        tools = web_agent.get_preset_tools(preset_type)
+        tokens = tool_schema_tokens(tools)
+        prompt_tokens = estimate_tokens(build_preset_prompt(preset_type, "示例输入"))
+        saved = (full_tokens - tokens) / full_tokens * 100
+        print(f"{preset_type:<10}{', '.join(tool.name for tool in tools):<34}{tokens:>8}{saved:>7.0f}%{prompt_tokens:>8}")
+
+
+async def measure(agent, preset_type: str, prompt: str) -> dict:
+    """运行一次查询，返回模型调用次数、输入token（模型上报）和耗时"""
+    token = current_preset.set(preset_type)
+    start = time.perf_counter()
+    try:
+        result = await agent.ainvoke(
+            {"messages": [HumanMessage(content=prompt)]},
+            config=RunnableConfig(configurable={"thread_id": f"benchmark-{time.time_ns()}"})
+        )
+    finally:
+        current_preset.reset(token)
+    replies = [m for m in result["messages"] if isinstance(m, AIMessage)]
+    return {
+        "calls": len(replies),
+        "input_tokens": sum((m.usage_metadata or {}).get("input_tokens", 0) for m in replies),
+        "seconds": time.perf_counter() - start
+    }
+
+
+def report_live(queries, repeat: int):
+    """实际运行查询，比较通用Agent和预设专用Agent"""
+    for item in queries:
+        preset_type, _, user_input = item.partition("=")
+        model_type = web_agent.get_model_type_for_preset(preset_type)
+        prompt = build_preset_prompt(preset_type, user_input)
+        if prompt is None or model_type not in web_agent.models:
+            print(f"⚠️ 跳过 {item}：无效的预设类型或模型未初始化")
+            continue
+        candidates = {
+            "全部工具": create_react_agent(model=web_agent.models[model_type], tools=web_agent.agent_tools),
+            "预设工具": create_react_agent(
+                model=web_agent.models[model_type], tools=web_agent.get_preset_tools(preset_type)
+            )
+        }
+        print(f"\n🔍 {preset_type}: {user_input}")
+        for label, agent in candidates.items():
+            runs = [web_agent.run_async_in_loop(measure(agent, preset_type, prompt)) for _ in range(repeat)]
+            print(f"   {label}: 模型调用 {sum(r['calls'] for r in runs) / repeat:.1f} 次，"
+                  f"输入 {sum(r['input_tokens'] for r in runs) / repeat:.0f} tokens，"
+                  f"耗时 {sum(r['seconds'] for r in runs) / repeat:.1f}秒")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="比较预设专用Agent与通用Agent的提示词token")
+    parser.add_argument("--live", nargs="*", default=[], metavar="PRESET=INPUT",
+                        help="实际运行的查询，如 weather=北京 calculate=2+3*4")
+    parser.add_argument("--repeat", type=int, default=1, help="每个查询的执行次数")
+    args = parser.parse_args()
+
+    report_static()
+    report_live(args.live, args.repeat)
+    web_agent.cleanup()
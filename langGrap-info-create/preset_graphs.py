@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import operator
+from typing import TypedDict, Annotated, List, Dict, Any, Optional, Tuple
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, AIMessage
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
+from preset_registry import get_preset_schema, format_instructions, validate_preset_data
+
+# 加载环境变量
+load_dotenv()
+
+# 研究流程拆分的子查询数、参与总结的来源数和每个来源送入模型的最大字符数
+RESEARCH_MAX_SUBQUERIES = int(os.getenv("RESEARCH_MAX_SUBQUERIES", "4"))
+RESEARCH_MAX_SOURCES = int(os.getenv("RESEARCH_MAX_SOURCES", "6"))
+RESEARCH_SOURCE_CHARS = 6000
+# 原始内容少于该字符数时先提取完整页面再总结
+RESEARCH_MIN_SOURCE_CHARS = 500
+# 固定流程参考的对话历史：最近的消息条数和每条消息的最大字符数
+PIPELINE_HISTORY_MESSAGES = 6
+PIPELINE_HISTORY_CHARS = 1500
+
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+_JSON_BLOCK_RE = re.compile(r'\{[\s\S]*\}|\[[\s\S]*\]')
+
+
+def message_text(message: Any) -> str:
+    """取出模型回复的文本（部分模型返回内容片段列表）"""
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+        )
+    return str(content or "")
+
+
+def parse_json_block(text: str) -> Optional[Any]:
+    """解析模型回复中的JSON（允许包在代码块中或前后有说明文字），失败时返回None"""
+    text = _FENCE_RE.sub('', (text or '').strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    match = _JSON_BLOCK_RE.search(text)
+    if match:
+        try:
+            return json.loads(match.group())
+        except ValueError:
+            pass
+    return None
+
+
+def parse_tool_output(output: Any) -> Dict[str, Any]:
+    """把工具返回的紧凑JSON文本还原为字典"""
+    if isinstance(output, dict):
+        return output
+    parsed = parse_json_block(message_text(output))
+    return parsed if isinstance(parsed, dict) else {"error": message_text(output)}
+
+
+async def ainvoke_preset_output(model, preset_type: str, prompt: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """按预设结构生成结果，返回 (结构化数据, JSON文本)
+
+    优先通过模型的工具调用模式（结构化输出）直接得到对象；模型不支持或结果不符合结构时，
+    退回到附带JSON格式说明的普通调用并解析，仍不符合时数据为None、文本为模型原文。
+    """
+    schema = get_preset_schema(preset_type)
+    try:
+        structured_model = model.with_structured_output(schema, method="function_calling")
+        data = validate_preset_data(preset_type, await structured_model.ainvoke([HumanMessage(content=prompt)]))
+        if data is not None:
+            return data, json.dumps(data, ensure_ascii=False)
+    except Exception as e:
+        print(f"⚠️ {preset_type} 结构化输出失败，改用JSON格式说明: {e or type(e).__name__}")
+    response = await model.ainvoke([HumanMessage(content=f"{prompt}\n\n{format_instructions(schema)}")])
+    text = message_text(response)
+    data = validate_preset_data(preset_type, parse_json_block(text))
+    if data is None:
+        return None, text
+    return data, json.dumps(data, ensure_ascii=False)
+
+
+def format_history(messages: List[Any]) -> str:
+    """把对话记忆整理为文本（只保留用户消息和模型的最终回复），没有历史时返回空字符串"""
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            role = "用户"
+        elif isinstance(message, AIMessage) and not message.tool_calls:
+            role = "助手"
+        else:
+            continue
+        text = message_text(message).strip()
+        if text:
+            lines.append(f"{role}：{text[:PIPELINE_HISTORY_CHARS]}")
+    return "\n\n".join(lines[-PIPELINE_HISTORY_MESSAGES:])
+
+
+def with_history(prompt: str, state: Dict[str, Any]) -> str:
+    """有对话历史时把历史放在提示词前，让追问能引用之前的内容"""
+    if not state.get("history"):
+        return prompt
+    return f"""以下是本次对话之前的内容，当前请求可能是对它的追问：
+
+{state['history']}
+
+{prompt}"""
+
+
+# 固定流程预设的工具调用：预设类型 -> (工具名, 根据用户输入生成工具参数)
+FAST_PRESET_TOOL_CALLS = {
+    "weather": ("tavily_search", lambda user_input: {"query": f"{user_input} 今天天气 温度 湿度 风力 空气质量"}),
+    "news": ("tavily_search", lambda user_input: {"query": f"{user_input} 最新新闻"}),
+    "extract": ("tavily_extract", lambda user_input: {"urls": [user_input.strip()]}),
+}
+
+
+class FastPresetState(TypedDict, total=False):
+    """固定流程状态：一次工具调用加一次格式化"""
+    topic: str
+    report_prompt: str
+    history: str
+    tool_output: str
+    errors: List[str]
+    data: Dict[str, Any]
+    report: str
+
+
+def create_fast_preset_graph(preset_type: str, model, tool):
+    """创建固定流程图：直接用用户输入调用工具 → 一次模型调用整理为预设结构
+
+    天气、新闻和内容提取预设总是"调用一次工具再格式化"，不需要Agent决定调用什么工具，
+    模型调用从至少两轮减少为一轮。
+    """
+    _, make_args = FAST_PRESET_TOOL_CALLS[preset_type]
+
+    async def fetch(state: FastPresetState) -> Dict[str, Any]:
+        """调用工具"""
+        try:
+            output = message_text(await tool.ainvoke(make_args(state["topic"])))
+        except Exception as e:
+            return {"tool_output": "", "errors": [f"{tool.name} 调用失败: {e}"]}
+        if "error" in parse_tool_output(output):
+            return {"tool_output": output, "errors": [f"{tool.name} 返回错误"]}
+        return {"tool_output": output, "errors": []}
+
+    async def format_output(state: FastPresetState) -> Dict[str, Any]:
+        """根据工具结果生成预设的结构化结果"""
+        output = state.get("tool_output") or "（工具没有返回结果，请根据已有知识谨慎作答，无法确定的字段填写「未知」）"
+        prompt = f"""{state['report_prompt']}
+
+以下是已经调用 {tool.name} 得到的结果，不需要再调用工具，请据此填写：
+
+{output}"""
+        data, report = await ainvoke_preset_output(model, preset_type, with_history(prompt, state))
+        return {"data": data, "report": report}
+
+    graph = StateGraph(FastPresetState)
+    graph.add_node("fetch", fetch)
+    graph.add_node("format", format_output)
+    graph.add_edge(START, "fetch")
+    graph.add_edge("fetch", "format")
+    graph.add_edge("format", END)
+    return graph.compile()
+
+
+class ResearchState(TypedDict, total=False):
+    """研究流程状态，sources、summaries、errors 由并行分支追加"""
+    topic: str
+    report_prompt: str
+    history: str
+    sub_queries: List[str]
+    sources: Annotated[List[Dict[str, Any]], operator.add]
+    selected: List[Dict[str, Any]]
+    summaries: Annotated[List[Dict[str, Any]], operator.add]
+    errors: Annotated[List[str], operator.add]
+    data: Dict[str, Any]
+    report: str
+
+
+def select_research_sources(sources: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """按URL去重后轮流从各子查询的结果中选取来源，保证每个子查询都有覆盖"""
+    by_query: Dict[str, List[Dict[str, Any]]] = {}
+    for source in sources:
+        by_query.setdefault(source["query"], []).append(source)
+    selected = []
+    seen = set()
+    queues = list(by_query.values())
+    while queues and len(selected) < limit:
+        for queue in list(queues):
+            while queue and queue[0]["url"] in seen:
+                queue.pop(0)
+            if not queue:
+                queues.remove(queue)
+                continue
+            source = queue.pop(0)
+            seen.add(source["url"])
+            selected.append(source)
+            if len(selected) >= limit:
+                break
+    return selected
+
+
+def create_research_graph(planner_model, summarizer_model, search_tool, extract_tool):
+    """创建研究流程图：规划子查询 → 并行搜索 → 选取来源 → 并行提取和总结 → 撰写报告
+
+    模型调用只有规划、各来源的总结（并行）和撰写三轮，耗时约为最长的一条分支。
+    """
+
+    async def plan(state: ResearchState) -> Dict[str, Any]:
+        """一次调用拆分子查询"""
+        prompt = f"""请把下面的研究主题拆分为2到{RESEARCH_MAX_SUBQUERIES}个互不重复、可以直接用于网络搜索的子查询，分别覆盖背景现状、关键进展、发展趋势、挑战与机会等方面。
+
+研究主题：{state['topic']}
+
+只返回JSON字符串数组，例如 ["子查询1", "子查询2"]，不要包含其他文字。"""
+        response = await planner_model.ainvoke([HumanMessage(content=with_history(prompt, state))])
+        parsed = parse_json_block(message_text(response))
+        queries = []
+        if isinstance(parsed, list):
+            for query in parsed:
+                query = str(query).strip()
+                if query and query not in queries:
+                    queries.append(query)
+        queries = queries[:RESEARCH_MAX_SUBQUERIES] or [state['topic']]
+        print(f"🗺️ 研究子查询: {queries}")
+        return {"sub_queries": queries}
+
+    def dispatch_searches(state: ResearchState) -> List[Send]:
+        return [Send("search", {"query": query}) for query in state["sub_queries"]]
+
+    async def search(state: Dict[str, Any]) -> Dict[str, Any]:
+        """执行一个子查询"""
+        query = state["query"]
+        try:
+            result = parse_tool_output(await search_tool.ainvoke({"query": query}))
+        except Exception as e:
+            result = {"error": str(e)}
+        if "error" in result:
+            return {"errors": [f"搜索「{query}」失败: {result['error']}"]}
+        return {"sources": [
+            {
+                "query": query,
+                "url": item.get("url"),
+                "title": item.get("title") or item.get("url"),
+                "content": item.get("content") or "",
+                "raw_content": item.get("raw_content") or ""
+            }
+            for item in result.get("results", []) if item.get("url")
+        ]}
+
+    def select_sources(state: ResearchState) -> Dict[str, Any]:
+        return {"selected": select_research_sources(state.get("sources", []), RESEARCH_MAX_SOURCES)}
+
+    def dispatch_summaries(state: ResearchState):
+        if not state.get("selected"):
+            return "write"
+        return [Send("summarize", {"topic": state["topic"], "source": source}) for source in state["selected"]]
+
+    async def summarize(state: Dict[str, Any]) -> Dict[str, Any]:
+        """总结一个来源，内容不完整时先提取页面"""
+        source = state["source"]
+        text = source["raw_content"]
+        if len(text) < RESEARCH_MIN_SOURCE_CHARS:
+            try:
+                extracted = parse_tool_output(await extract_tool.ainvoke({"urls": [source["url"]]}))
+            except Exception as e:
+                extracted = {"error": str(e)}
+            for item in extracted.get("results", []):
+                if len(item.get("raw_content") or "") > len(text):
+                    text = item["raw_content"]
+        text = text or source["content"]
+        if not text:
+            return {"errors": [f"来源 {source['url']} 没有可用内容"]}
+
+        prompt = f"""围绕研究主题「{state['topic']}」，用3到5条要点总结下面资料中的关键事实、数据和观点。只保留与主题相关的内容，不要编造资料中没有的信息。
+
+资料标题：{source['title']}
+资料链接：{source['url']}
+
+{text[:RESEARCH_SOURCE_CHARS]}"""
+        try:
+            response = await summarizer_model.ainvoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            return {"errors": [f"总结来源 {source['url']} 失败: {e}"]}
+        return {"summaries": [{"url": source["url"], "title": source["title"], "summary": message_text(response)}]}
+
+    async def write(state: ResearchState) -> Dict[str, Any]:
+        """根据各来源的摘要撰写最终报告"""
+        notes = "\n\n".join(
+            f"[{i}] {item['title']}（{item['url']}）\n{item['summary']}"
+            for i, item in enumerate(state.get("summaries", []), 1)
+        ) or "（没有检索到可用资料，请根据已有知识谨慎作答，并在结论中说明）"
+        prompt = f"""{state['report_prompt']}
+
+以下是已经完成搜索和整理的资料摘要，不需要再调用工具，请据此撰写，sources 填写实际引用的资料标题和链接：
+
+{notes}"""
+        data, report = await ainvoke_preset_output(planner_model, "research", with_history(prompt, state))
+        return {"data": data, "report": report}
+
+    graph = StateGraph(ResearchState)
+    graph.add_node("plan", plan)
+    graph.add_node("search", search)
+    graph.add_node("select_sources", select_sources)
+    graph.add_node("summarize", summarize)
+    graph.add_node("write", write)
+    graph.add_edge(START, "plan")
+    graph.add_conditional_edges("plan", dispatch_searches, ["search"])
+    graph.add_edge("search", "select_sources")
+    graph.add_conditional_edges("select_sources", dispatch_summaries, ["summarize", "write"])
+    graph.add_edge("summarize", "write")
+    graph.add_edge("write", END)
+    return graph.compile()
@@ -0,0 +1,220 @@
+import json
+import typing
+from typing import Literal, List, Dict, Any, Optional, Type
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+
+class PresetResult(BaseModel):
+    """预设结果的基类：关键字段必填且不能为空，其余字段有默认值；数字自动转为字符串，多余字段忽略
+
+    关键字段缺失（如返回空对象）时校验失败，调用方改用JSON格式说明重试或返回模型原文。
+    """
+    model_config = ConfigDict(coerce_numbers_to_str=True, extra="ignore")
+
+
+class Temperature(PresetResult):
+    current: str = Field(..., min_length=1, description="当前温度，如 25°C")
+    high: str = Field("", description="最高温度")
+    low: str = Field("", description="最低温度")
+
+
+class WeatherResult(PresetResult):
+    type: Literal["weather"] = "weather"
+    city: str = Field(..., min_length=1, description="城市名称")
+    temperature: Temperature = Field(..., description="温度")
+    condition: str = Field("", description="天气现象")
+    humidity: str = Field("", description="湿度")
+    wind: str = Field("", description="风力风向")
+    airQuality: str = Field("", description="空气质量状况")
+    suggestions: List[str] = Field(default_factory=list, description="3条生活建议")
+    details: str = Field("", description="天气详细描述")
+
+
+class NewsArticle(PresetResult):
+    title: str = Field(..., min_length=1, description="新闻标题")
+    summary: str = Field("", description="新闻摘要")
+    source: str = Field("", description="新闻来源")
+    time: str = Field("", description="发布时间")
+
+
+class NewsResult(PresetResult):
+    type: Literal["news"] = "news"
+    topic: str = Field("", description="新闻主题")
+    articles: List[NewsArticle] = Field(..., min_length=1, description="新闻列表")
+    summary: str = Field("", description="整体新闻概述")
+    keyPoints: List[str] = Field(default_factory=list, description="3条关键点")
+
+
+class ExtractResult(PresetResult):
+    type: Literal["extract"] = "extract"
+    url: str = Field("", description="网页URL")
+    title: str = Field("", description="网页标题")
+    description: str = Field("", description="网页描述")
+    mainContent: str = Field(..., min_length=1, description="主要内容摘要")
+    keyFeatures: List[str] = Field(default_factory=list, description="3条特色功能")
+    technologies: List[str] = Field(default_factory=list, description="涉及的技术栈")
+    summary: str = Field("", description="整体分析总结")
+
+
+class ResearchResult(PresetResult):
+    type: Literal["research"] = "research"
+    topic: str = Field("", description="研究主题")
+    introduction: str = Field("", description="研究背景介绍")
+    keyFindings: List[str] = Field(..., min_length=1, description="3条以上核心发现")
+    detailedAnalysis: str = Field("", description="详细分析内容")
+    trends: List[str] = Field(default_factory=list, description="发展趋势")
+    challenges: List[str] = Field(default_factory=list, description="面临的挑战")
+    opportunities: List[str] = Field(default_factory=list, description="机会")
+    conclusion: str = Field(..., min_length=1, description="研究结论")
+    sources: List[str] = Field(default_factory=list, description="资料来源（标题和链接）")
+
+
+class DatetimeFormats(PresetResult):
+    iso: str = Field("", description="ISO格式时间")
+    readable: str = Field("", description="可读格式时间")
+    timestamp: str = Field("", description="时间戳")
+
+
+class CalculateResult(PresetResult):
+    type: Literal["calculate"] = "calculate"
+    expression: str = Field("", description="计算表达式")
+    result: str = Field(..., min_length=1, description="计算结果")
+    steps: List[str] = Field(default_factory=list, description="计算步骤")
+    explanation: str = Field("", description="计算说明")
+
+
+class DatetimeResult(PresetResult):
+    type: Literal["datetime"] = "datetime"
+    query: str = Field("", description="查询内容")
+    currentTime: str = Field(..., min_length=1, description="当前时间")
+    date: str = Field("", description="日期")
+    timezone: str = Field("", description="时区")
+    weekday: str = Field("", description="星期")
+    formats: DatetimeFormats = Field(default_factory=DatetimeFormats, description="多种格式的时间")
+
+
+class FileResult(PresetResult):
+    type: Literal["file"] = "file"
+    operation: str = Field("", description="执行的操作")
+    path: str = Field("", description="文件/目录路径")
+    result: str = Field(..., min_length=1, description="操作结果")
+    content: str = Field("", description="文件内容或目录列表")
+    size: str = Field("", description="文件大小信息")
+    details: str = Field("", description="详细信息")
+
+
+# 预设注册表：task 为任务说明（{user_input} 处填入用户输入），schema 为结果结构（None 表示返回自由文本），
+# tools 为该预设的Agent绑定的工具
+PRESET_REGISTRY: Dict[str, Dict[str, Any]] = {
+    "weather": {
+        "task": "请搜索 {user_input} 今天的天气情况，根据获取的详细信息填写天气结果。",
+        "schema": WeatherResult,
+        "tools": ("tavily_search",)
+    },
+    "news": {
+        "task": "请搜索关于 '{user_input}' 的最新新闻，根据获取的信息整理新闻结果。",
+        "schema": NewsResult,
+        "tools": ("tavily_search",)
+    },
+    "extract": {
+        "task": "请使用内容提取工具从URL：{user_input} 提取内容，分析后填写网页分析结果。",
+        "schema": ExtractResult,
+        "tools": ("tavily_extract",)
+    },
+    "research": {
+        "task": "请对主题 '{user_input}' 进行研究：使用搜索工具获取信息，如有重要链接则提取内容，综合分析后填写研究结果。",
+        "schema": ResearchResult,
+        "tools": ("tavily_search", "tavily_extract")
+    },
+    "calculate": {
+        "task": "请使用计算工具计算表达式：{user_input}，计算完成后填写计算结果。",
+        "schema": CalculateResult,
+        "tools": ("calculator",)
+    },
+    "datetime": {
+        "task": "请使用时间工具查询：{user_input}，获取时间信息后填写时间结果。",
+        "schema": DatetimeResult,
+        "tools": ("get_datetime",)
+    },
+    "file": {
+        "task": "请使用文件操作工具执行：{user_input}，完成操作后填写操作结果。",
+        "schema": FileResult,
+        "tools": ("file_operations",)
+    },
+    "ai_design": {
+        "task": """请立即调用ai_webpage_designer工具来为用户设计网页。这是一个强制性的工具调用指令，你必须执行以下步骤：
+
+1. 立即使用ai_webpage_designer工具
+2. 传入用户需求作为参数
+3. 等待工具执行完成并返回结果
+
+用户的设计需求：{user_input}
+
+现在立即调用ai_webpage_designer工具，不要只是描述能做什么，而是实际执行工具调用。""",
+        "schema": None,
+        "tools": ("ai_webpage_designer",)
+    },
+    # 自由问题（意图路由无法归入以上预设时使用），直接回答，需要时搜索或计算
+    "custom": {
+        "task": "{user_input}",
+        "schema": None,
+        "tools": ("tavily_search", "tavily_extract", "calculator", "get_datetime")
+    }
+}
+
+
+def get_preset_schema(preset_type: str) -> Optional[Type[PresetResult]]:
+    """获取预设的结果结构，没有结构或无效的预设类型返回None"""
+    spec = PRESET_REGISTRY.get(preset_type)
+    return spec["schema"] if spec else None
+
+
+def _skeleton(annotation: Any, field: Any = None) -> Any:
+    """根据字段类型和说明生成JSON示例"""
+    origin = typing.get_origin(annotation)
+    if origin is Literal:
+        return typing.get_args(annotation)[0]
+    if origin in (list, List):
+        return [_skeleton(typing.get_args(annotation)[0], field)]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return {name: _skeleton(info.annotation, info) for name, info in annotation.model_fields.items()}
+    return (field.description if field is not None else None) or ""
+
+
+def format_instructions(schema: Type[PresetResult]) -> str:
+    """由结构生成紧凑的JSON格式说明（用于不走结构化输出的Agent调用）"""
+    skeleton = json.dumps(_skeleton(schema), ensure_ascii=False, separators=(",", ":"))
+    return f"严格按照以下JSON格式返回，值为字段说明，只返回JSON数据，不要添加任何解释文字：\n{skeleton}"
+
+
+def get_preset_tool_names(preset_type: str) -> Optional[tuple]:
+    """获取预设需要的工具名，无效的预设类型返回None"""
+    spec = PRESET_REGISTRY.get(preset_type)
+    return spec["tools"] if spec else None
+
+
+def build_preset_prompt(preset_type: str, user_input: str, with_format: bool = True) -> Optional[str]:
+    """生成预设类型的提示词，无效的预设类型返回None
+
+    with_format 为 False 时不附带JSON格式说明（结果结构通过模型的结构化输出传入）。
+    """
+    spec = PRESET_REGISTRY.get(preset_type)
+    if spec is None:
+        return None
+    prompt = spec["task"].format(user_input=user_input)
+    if with_format and spec["schema"] is not None:
+        prompt = f"{prompt}\n\n{format_instructions(spec['schema'])}"
+    return prompt
+
+
+def validate_preset_data(preset_type: str, data: Any) -> Optional[Dict[str, Any]]:
+    """按预设结构校验数据，不符合时返回None"""
+    schema = get_preset_schema(preset_type)
+    if schema is None or data is None:
+        return None
+    try:
+        if isinstance(data, BaseModel):
+            data = data.model_dump()
+        return schema.model_validate(data).model_dump()
+    except ValidationError:
+        return None
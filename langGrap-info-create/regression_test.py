@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+回归测试脚本 - 测试写后队列、本地存储分页、本地搜索索引和工具输出预算
+
+所有测试使用临时目录中的SQLite文件，不需要Supabase和网络，可直接运行：
+    python regression_test.py
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+# 测试数据都写入临时目录
+TEST_DIR = tempfile.mkdtemp(prefix="web_agent_test_")
+
+
+class BlockingHistoryManager:
+    """写入时一直阻塞的历史记录管理器，模拟刷写到一半时进程崩溃"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def insert_records(self, table_name, records):
+        self.calls += 1
+        self.release.wait()
+        return {"success": False, "message": "进程已崩溃"}
+
+
+class FailingHistoryManager:
+    """写入总是失败的历史记录管理器"""
+
+    def insert_records(self, table_name, records):
+        return {"success": False, "message": "数据库不可用"}
+
+
+def _create_local_history(name):
+    """创建使用临时SQLite文件的历史记录管理器"""
+    from local_storage import LocalDatabase
+    from history_backends import SQLiteHistoryBackend
+    from history_manager import HistoryManager
+
+    return HistoryManager(SQLiteHistoryBackend(LocalDatabase(os.path.join(TEST_DIR, name))))
+
+
+def test_history_queue_replay():
+    """测试写后队列：进程崩溃后重启继续写入日志中的记录，失败记录可重新排队"""
+    print("🔍 测试写后队列崩溃恢复...")
+
+    from history_queue import HistoryWriteQueue
+
+    journal_path = os.path.join(TEST_DIR, "history_queue.db")
+    user_id = "queue-user"
+
+    # 第一个队列在刷写时阻塞，之后不再使用，相当于进程崩溃
+    blocking = BlockingHistoryManager()
+    crashed = HistoryWriteQueue(db_path=journal_path, flush_interval=0.1, history_manager=blocking)
+    for i in range(5):
+        crashed.enqueue_prompt_history(user_id, f"问题{i}", f"回答{i}", "research", "research")
+    crashed.enqueue_webpage_generation(user_id, "咖啡店网页", "ai_designed_webpage_1.html", "hash1", 1024)
+    assert crashed.pending_count() == 6, "崩溃前日志中应有6条待写记录"
+    print(f"   崩溃前日志中的待写记录: {crashed.pending_count()} 条")
+
+    # 重启后使用同一个日志文件，记录全部写入数据库
+    history_manager = _create_local_history("queue_history.db")
+    restarted = HistoryWriteQueue(db_path=journal_path, flush_interval=0.1, history_manager=history_manager)
+    restarted.start()
+    assert restarted.flush(10), "重启后日志中的记录应全部写入"
+    blocking.release.set()
+
+    prompts = history_manager.get_user_prompt_history(user_id, limit=10)
+    webpages = history_manager.get_user_webpage_generations(user_id, limit=10)
+    assert sorted(record["prompt"] for record in prompts) == [f"问题{i}" for i in range(5)], "提示词记录不完整"
+    assert [record["filename"] for record in webpages] == ["ai_designed_webpage_1.html"], "网页记录不完整"
+    print(f"✅ 重启后写入: {len(prompts)} 条提示词记录，{len(webpages)} 条网页记录")
+
+    # 超过重试次数的记录标记为失败，重新排队后写入
+    failing = HistoryWriteQueue(
+        db_path=os.path.join(TEST_DIR, "history_queue_failed.db"), flush_interval=0.1,
+        max_attempts=1, history_manager=FailingHistoryManager()
+    )
+    failing.enqueue_prompt_history(user_id, "失败的问题", "回答")
+    failing.flush(2)
+    failing.stop()
+    assert failing.get_stats()["failed_in_journal"] == 1, "超过重试次数的记录应标记为失败"
+
+    recovered = HistoryWriteQueue(
+        db_path=failing.db_path, flush_interval=0.1, history_manager=history_manager
+    )
+    assert recovered.requeue_failed() == 1, "失败记录应可以重新排队"
+    assert recovered.flush(10), "重新排队的记录应写入"
+    recovered.stop()
+    restarted.stop()
+    assert len(history_manager.get_user_prompt_history(user_id, limit=10)) == 6
+    print("✅ 失败记录重新排队后写入成功")
+    return True
+
+
+def test_sqlite_history_pagination():
+    """测试本地存储：跨热表和归档表的游标分页，以及归档、删除时的计数"""
+    print("\n🔍 测试本地存储分页和计数...")
+
+    from history_manager import encode_history_cursor
+
+    history_manager = _create_local_history("pagination.db")
+    backend = history_manager.backend
+    user_id = "page-user"
+    now = datetime.utcnow()
+
+    # 30条记录，每天一条，同一时间再插入一条检查相同created_at时的排序
+    records = [
+        {
+            "user_id": user_id,
+            "prompt": f"问题{i}",
+            "response": f"回答{i} " * 50,
+            "prompt_type": "research" if i % 2 else "news",
+            "created_at": (now - timedelta(days=i)).isoformat()
+        }
+        for i in range(30)
+    ]
+    records.append({**records[15], "prompt": "同一时间的问题"})
+    backend.insert("prompt_history", records)
+    backend.insert("prompt_history", [{"user_id": "other-user", "prompt": "其他用户", "response": "回答"}])
+
+    def counters():
+        return {(row["source"], row["item_type"]): row["item_count"] for row in backend.get_counters(user_id)}
+
+    before = counters()
+    assert sum(before.values()) == 31, f"计数应为31，实际为 {before}"
+
+    stats = backend.compact_prompt_history(hot_days=10)
+    assert stats["archived_rows"] == 21, f"应归档21条记录，实际 {stats['archived_rows']}"
+    assert counters() == before, "归档不应改变计数"
+    print(f"   归档 {stats['archived_rows']} 条记录，压缩前 {stats['moved_bytes']} 字节，压缩后 {stats['archived_bytes']} 字节")
+
+    # 按7条一页翻到底，结果应与按时间倒序排列的全部记录一致
+    expected = sorted(
+        backend.list_records("prompt_history", user_id, "id, created_at", limit=100)
+        + backend.list_records("prompt_history_archive", user_id, "id, created_at", limit=100),
+        key=lambda record: (record["created_at"], record["id"]), reverse=True
+    )
+    pages = []
+    cursor = None
+    while True:
+        page = history_manager.get_user_prompt_history(user_id, limit=7, cursor=cursor)
+        if not page:
+            break
+        pages.append(page)
+        cursor = encode_history_cursor(page[-1])
+    seen = [record["id"] for page in pages for record in page]
+    assert seen == [record["id"] for record in expected], "分页结果与完整列表不一致"
+    assert len(set(seen)) == 31, "分页结果有重复或遗漏"
+    print(f"✅ 分页 {len(pages)} 页共 {len(seen)} 条记录，跨越热表和归档表")
+
+    # 归档记录的详情和回复可以正常读取
+    archived = backend.list_records("prompt_history_archive", user_id, "id, prompt, response", limit=1)[0]
+    assert archived["response"].startswith("回答"), "归档记录的回复应解压"
+
+    # 删除热表和归档表中的记录都会减少计数
+    hot = backend.list_records("prompt_history", user_id, "id, prompt_type", limit=1)[0]
+    backend.delete_record("prompt_history", user_id, hot["id"])
+    backend.delete_record("prompt_history_archive", user_id, archived["id"])
+    after = counters()
+    assert sum(after.values()) == 29, f"删除两条后计数应为29，实际为 {after}"
+    assert after[("prompt", hot["prompt_type"])] < before[("prompt", hot["prompt_type"])]
+
+    backend.insert("webpage_generations", [{"user_id": user_id, "prompt": "网页", "filename": "a.html"}])
+    assert counters()[("webpage", "ai_design")] == 1, "网页计数应为1"
+    print(f"✅ 计数正确: {counters()}")
+    return True
+
+
+def test_local_search_refresh():
+    """测试本地搜索索引：增量更新只重新索引变化的文件，段数过多时合并"""
+    print("\n🔍 测试本地搜索索引增量更新和段合并...")
+
+    import local_search
+    from local_search import LocalSearchIndex
+
+    corpus = os.path.join(TEST_DIR, "corpus")
+    os.makedirs(corpus)
+
+    def write(name, text):
+        with open(os.path.join(corpus, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    write("quantum.md", "# 量子计算\n\n超导量子比特的相干时间持续提升，量子纠错需要大量物理比特。")
+    write("coffee.md", "# 咖啡\n\n手冲咖啡的水温一般在90到96度之间，研磨度影响萃取。")
+    write("news.jsonl", "\n".join(json.dumps(record, ensure_ascii=False) for record in [
+        {"id": "a", "url": "https://example.com/a", "title": "芯片新闻", "content": "新一代芯片采用3纳米工艺。"},
+        {"id": "b", "url": "https://example.com/b", "title": "电池新闻", "content": "固态电池能量密度显著提升。"},
+    ]))
+
+    index = LocalSearchIndex(os.path.join(TEST_DIR, "index"))
+    stats = index.refresh(corpus)
+    assert stats["added"] == 4 and stats["deleted"] == 0, f"首次索引应新增4个文档: {stats}"
+    assert index.search("量子纠错")["results"][0]["url"].endswith("quantum.md")
+
+    # 没有变化时不重新索引
+    stats = index.refresh(corpus)
+    assert stats["added"] == 0 and stats["deleted"] == 0, f"没有变化时不应更新: {stats}"
+
+    # 修改jsonl中的一条记录：只替换这一条
+    write("news.jsonl", "\n".join(json.dumps(record, ensure_ascii=False) for record in [
+        {"id": "a", "url": "https://example.com/a", "title": "芯片新闻", "content": "新一代芯片采用3纳米工艺。"},
+        {"id": "b", "url": "https://example.com/b", "title": "电池新闻", "content": "钠离子电池成本更低，适合储能场景。"},
+    ]))
+    stats = index.refresh(corpus)
+    assert stats["added"] == 1 and stats["deleted"] == 1, f"应只替换修改的记录: {stats}"
+    assert all("固态" not in item["content"] for item in index.search("固态电池")["results"]), "旧内容不应再被检索到"
+    assert index.search("钠离子 储能")["results"][0]["url"] == "https://example.com/b"
+
+    # 删除文件
+    os.remove(os.path.join(corpus, "coffee.md"))
+    stats = index.refresh(corpus)
+    assert stats["deleted"] == 1 and stats["documents"] == 3, f"应删除1个文档: {stats}"
+    assert not index.search("手冲咖啡 水温")["results"], "已删除的文档不应被检索到"
+    # 6个文档中已删除2个，超过 MAX_DELETED_RATIO，两个段合并为一个并清理已删除文档
+    assert index.get_stats()["segments"] == 1, "已删除文档过多时应合并段"
+    print("✅ 增量更新正确，已删除文档过多时合并为1个段")
+
+    # 段数超过上限时合并为一个段，合并后检索结果不变
+    original_max_segments = local_search.MAX_SEGMENTS
+    local_search.MAX_SEGMENTS = 2
+    segment_counts = []
+    try:
+        for i in range(3):
+            write(f"extra_{i}.md", f"# 附加文档{i}\n\n第{i}篇附加文档，讨论分布式数据库的一致性。")
+            index.refresh(corpus)
+            segment_counts.append(index.get_stats()["segments"])
+    finally:
+        local_search.MAX_SEGMENTS = original_max_segments
+    assert segment_counts == [2, 1, 2], f"第3个段写入后应合并为1个段: {segment_counts}"
+    index_stats = index.get_stats()
+    assert index_stats["documents"] == 6, f"合并后应有6个文档: {index_stats}"
+    assert len(index.search("分布式数据库 一致性", max_results=10)["results"]) == 3
+    assert index.search("钠离子 储能")["results"][0]["url"] == "https://example.com/b"
+    postings = [name for name in os.listdir(index.index_dir) if name.endswith(".postings")]
+    assert len(postings) == index_stats["segments"], "合并后旧段文件应删除"
+    print(f"✅ 段合并正确: {index_stats['segments']} 个段，{index_stats['documents']} 个文档")
+    return True
+
+
+def test_tool_output_budget():
+    """测试工具输出：超出token预算时截断，透传的文本内容不被改写"""
+    print("\n🔍 测试工具输出token预算...")
+
+    from text_utils import estimate_tokens
+    from tool_output import format_tool_output, truncate_text, limit_output, TAVILY_SEARCH_FIELDS
+
+    # 预算内的结果：去掉空字段和未列出的字段，保持字段顺序
+    result = {
+        "query": "量子计算", "images": [], "response_time": 1.23, "request_id": "x",
+        "results": [{"content": "摘要", "url": "https://a.com", "title": "标题", "score": 0.876543, "raw_content": None}]
+    }
+    text = format_tool_output(result, 500, TAVILY_SEARCH_FIELDS)
+    assert json.loads(text) == {
+        "query": "量子计算",
+        "results": [{"title": "标题", "url": "https://a.com", "score": 0.88, "content": "摘要"}]
+    }, text
+    assert list(json.loads(text)["results"][0]) == ["title", "url", "score", "content"], "字段顺序应固定"
+
+    # 超出预算：优先截短最长的字段，结构和短字段保持完整
+    result = {"results": [
+        {"title": "长文档", "url": "https://a.com", "raw_content": "量子计算的发展历程。" * 400},
+        {"title": "短文档", "url": "https://b.com", "content": "简短摘要"},
+    ]}
+    text = format_tool_output(result, 300, TAVILY_SEARCH_FIELDS)
+    parsed = json.loads(text)
+    assert estimate_tokens(text) <= 300, f"输出应在预算内: {estimate_tokens(text)} tokens"
+    assert parsed["results"][0]["raw_content"].endswith("…(已截断)"), "最长字段应被截短"
+    assert parsed["results"][1]["content"] == "简短摘要", "短字段不应截断"
+    print(f"   结构化结果: {estimate_tokens(json.dumps(result, ensure_ascii=False))} → {estimate_tokens(text)} tokens")
+
+    # 文本截断只改变长度，不改写内容
+    content = "# 🎉 标题\n\n\n    缩进的代码   \n✅ 完成"
+    assert truncate_text(content, 1000) == content, "预算内的文本应原样返回"
+    long_text = "文件内容 🎉\n\n\n" + "x" * 20000
+    truncated = truncate_text(long_text, 200)
+    assert truncated.endswith("…(已截断)") and truncated.startswith("文件内容 🎉\n\n\n"), "截断不应改写文本"
+    assert estimate_tokens(truncated) <= 220, f"截断后应接近预算: {estimate_tokens(truncated)} tokens"
+
+    @limit_output(50)
+    def read_file():
+        return content
+
+    assert read_file() == content, "limit_output 不应改写透传的文件内容"
+    print("✅ 预算截断正确，透传内容保持不变")
+    return True
+
+
+def main():
+    """主函数"""
+    print("🚀 开始回归测试")
+    print(f"📁 临时目录: {TEST_DIR}")
+    print("=" * 50)
+
+    tests = [
+        ("写后队列崩溃恢复", test_history_queue_replay),
+        ("本地存储分页和计数", test_sqlite_history_pagination),
+        ("本地搜索增量更新和段合并", test_local_search_refresh),
+        ("工具输出token预算", test_tool_output_budget),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            result = test_func()
+            results.append((test_name, result))
+        except Exception as e:
+            print(f"❌ {test_name}测试出错: {type(e).__name__}: {e}")
+            results.append((test_name, False))
+
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+    print("\n" + "=" * 50)
+    print("📊 测试结果汇总:")
+    for test_name, result in results:
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"   {test_name}: {status}")
+
+    all_passed = all(result for _, result in results)
+    if all_passed:
+        print("\n🎉 所有测试通过！")
+    else:
+        print("\n⚠️  部分测试失败，请查看上面的输出")
+    return all_passed
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,265 @@
+import os
+import time
+import random
+import hashlib
+import sqlite3
+import threading
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List
+from dotenv import load_dotenv
+from text_utils import tokenize, cjk_bigram_text
+from content_condenser import strip_boilerplate, split_passages
+
+# 加载环境变量
+load_dotenv()
+
+# 跨会话复用（同一主题）时文档的最长保存时间（秒），同一会话内不限
+RESEARCH_STORE_MAX_AGE = float(os.getenv("RESEARCH_STORE_MAX_AGE", "21600"))
+# 文档保留天数，超过后清理
+RESEARCH_STORE_RETENTION_DAYS = float(os.getenv("RESEARCH_STORE_RETENTION_DAYS", "7"))
+# 已保存段落覆盖查询词的比例达到该值时直接使用，不再联网搜索
+RESEARCH_STORE_MIN_COVERAGE = float(os.getenv("RESEARCH_STORE_MIN_COVERAGE", "0.8"))
+
+# 可以跨会话复用的文档来源：只有公开搜索结果中的页面，内容提取的页面（可能是内网或需要登录的地址）只在提取它的会话中可用
+SHARED_SOURCES = ("search",)
+
+# 当前请求的会话ID，在 run_agent_query 中设置
+current_thread: ContextVar[Optional[str]] = ContextVar("current_thread", default=None)
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    content_hash TEXT NOT NULL,
+    content TEXT NOT NULL,
+    source TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(content_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_fetched ON documents(fetched_at);
+
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id INTEGER NOT NULL REFERENCES documents(doc_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_doc ON chunks(doc_id, seq);
+
+-- 段落全文索引（外部内容表），写入的是 cjk_bigram_text() 分词后的文本
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(text, content='chunks', content_rowid='chunk_id');
+
+-- 会话使用过的文档
+CREATE TABLE IF NOT EXISTS thread_documents (
+    thread_id TEXT NOT NULL,
+    doc_id INTEGER NOT NULL REFERENCES documents(doc_id) ON DELETE CASCADE,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, doc_id)
+);
+CREATE INDEX IF NOT EXISTS idx_thread_documents_doc ON thread_documents(doc_id);
+"""
+
+
+class ResearchStore:
+    """研究文档库
+
+    保存内容提取和搜索得到的原始网页内容，按URL和内容哈希去重，切分为段落并建立全文索引，
+    同时记录每个会话用过哪些文档。同一会话（或同一主题）的后续问题先从已保存的段落中检索，
+    覆盖查询的段落足够时不再联网；已保存的页面再次提取时直接使用。
+    跨会话只复用来自公开搜索结果的文档（见 SHARED_SOURCES）。
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv(
+            "RESEARCH_STORE_PATH",
+            os.path.join(os.path.dirname(__file__), "research_store.db")
+        )
+        self._lock = threading.Lock()
+        self._stats = {"documents_saved": 0, "documents_unchanged": 0, "search_hits": 0,
+                       "search_misses": 0, "extract_hits": 0}
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(STORE_SCHEMA)
+
+    def _delete_chunks(self, doc_id: int):
+        """删除文档的段落和索引（调用方持有锁）"""
+        rows = self._conn.execute("SELECT chunk_id, text FROM chunks WHERE doc_id = ?", (doc_id,)).fetchall()
+        self._conn.executemany(
+            "INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', ?, ?)",
+            [(chunk_id, cjk_bigram_text(text)) for chunk_id, text in rows]
+        )
+        self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+
+    def add_document(self, url: str, content: str, title: Optional[str] = None,
+                     thread_id: Optional[str] = None, source: str = "extract") -> Optional[int]:
+        """保存文档，内容未变化时只更新时间和会话关联，返回文档ID"""
+        if not url or not content:
+            return None
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute(
+                    "SELECT doc_id, content_hash FROM documents WHERE url = ?", (url,)
+                ).fetchone()
+                if row and row[1] == content_hash:
+                    doc_id = row[0]
+                    self._conn.execute("UPDATE documents SET fetched_at = ? WHERE doc_id = ?", (now, doc_id))
+                    self._stats["documents_unchanged"] += 1
+                else:
+                    if row:
+                        doc_id = row[0]
+                        self._delete_chunks(doc_id)
+                        self._conn.execute(
+                            "UPDATE documents SET title = ?, content_hash = ?, content = ?, source = ?, fetched_at = ? "
+                            "WHERE doc_id = ?",
+                            (title, content_hash, content, source, now, doc_id)
+                        )
+                    else:
+                        doc_id = self._conn.execute(
+                            "INSERT INTO documents (url, title, content_hash, content, source, fetched_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (url, title, content_hash, content, source, now)
+                        ).lastrowid
+                    for seq, passage in enumerate(split_passages(strip_boilerplate(content))):
+                        chunk_id = self._conn.execute(
+                            "INSERT INTO chunks (doc_id, seq, text) VALUES (?, ?, ?)", (doc_id, seq, passage)
+                        ).lastrowid
+                        self._conn.execute(
+                            "INSERT INTO chunks_fts (rowid, text) VALUES (?, ?)",
+                            (chunk_id, cjk_bigram_text(passage))
+                        )
+                    self._stats["documents_saved"] += 1
+                if thread_id:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO thread_documents (thread_id, doc_id, added_at) VALUES (?, ?, ?)",
+                        (thread_id, doc_id, now)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # 偶尔清理过期文档
+            if random.random() < 0.01:
+                self._purge(now - RESEARCH_STORE_RETENTION_DAYS * 86400)
+        return doc_id
+
+    def _purge(self, before: float):
+        """删除早于before的文档（调用方持有锁）"""
+        for (doc_id,) in self._conn.execute("SELECT doc_id FROM documents WHERE fetched_at < ?", (before,)).fetchall():
+            self._delete_chunks(doc_id)
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def get_document(self, url: str, thread_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取已保存的页面：会话中用过的不限时间，其他会话的只使用 RESEARCH_STORE_MAX_AGE 内的公开搜索结果"""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT d.doc_id, d.url, d.title, d.content, d.fetched_at,
+                       EXISTS (SELECT 1 FROM thread_documents t WHERE t.doc_id = d.doc_id AND t.thread_id = ?),
+                       d.source
+                FROM documents d WHERE d.url = ?
+            """, (thread_id, url)).fetchone()
+            if row is None:
+                return None
+            if not row[5] and (row[6] not in SHARED_SOURCES or time.time() - row[4] > RESEARCH_STORE_MAX_AGE):
+                return None
+            if thread_id and not row[5]:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO thread_documents (thread_id, doc_id, added_at) VALUES (?, ?, ?)",
+                    (thread_id, row[0], time.time())
+                )
+            self._stats["extract_hits"] += 1
+        return {"url": row[1], "title": row[2], "raw_content": row[3]}
+
+    def search_passages(self, query: str, thread_id: Optional[str] = None,
+                        limit: int = 5) -> List[Dict[str, Any]]:
+        """检索与查询相关的段落
+
+        有会话ID时只在该会话用过的文档中检索，否则在 RESEARCH_STORE_MAX_AGE 内保存的公开搜索结果中检索。
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        # 词项之间为OR关系，按BM25排序
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        if thread_id:
+            scope = "d.doc_id IN (SELECT doc_id FROM thread_documents WHERE thread_id = ?)"
+            scope_arg = (thread_id,)
+        else:
+            scope = f"d.fetched_at >= ? AND d.source IN ({','.join('?' * len(SHARED_SOURCES))})"
+            scope_arg = (time.time() - RESEARCH_STORE_MAX_AGE, *SHARED_SOURCES)
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT c.text, d.url, d.title, -bm25(chunks_fts) AS rank
+                FROM chunks_fts
+                JOIN chunks c ON c.chunk_id = chunks_fts.rowid
+                JOIN documents d ON d.doc_id = c.doc_id
+                WHERE chunks_fts MATCH ? AND {scope}
+                ORDER BY rank DESC LIMIT ?
+            """, (match, *scope_arg, limit)).fetchall()
+        return [{"text": text, "url": url, "title": title, "rank": rank} for text, url, title, rank in rows]
+
+    def retrieve(self, query: str, thread_id: Optional[str] = None,
+                 limit: int = 5) -> Optional[Dict[str, Any]]:
+        """从已保存的段落组成搜索结果，段落对查询词的覆盖不足时返回None
+
+        先在会话范围内检索，没有会话或覆盖不足时在近期的公开搜索结果（同一主题）中检索，
+        后者要求段落覆盖全部查询词。
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return None
+        scopes = [(thread_id, RESEARCH_STORE_MIN_COVERAGE)] if thread_id else []
+        scopes.append((None, 1.0))
+        for scope, min_coverage in scopes:
+            passages = self.search_passages(query, scope, limit)
+            if not passages:
+                continue
+            covered = set()
+            for passage in passages:
+                covered.update(terms.intersection(tokenize(passage["text"])))
+            if len(covered) / len(terms) < min_coverage:
+                continue
+            with self._lock:
+                self._stats["search_hits"] += 1
+            best = passages[0]["rank"] or 1.0
+            return {
+                "query": query,
+                "results": [
+                    {
+                        "title": passage["title"],
+                        "url": passage["url"],
+                        "content": passage["text"],
+                        "score": round(passage["rank"] / best, 4)
+                    }
+                    for passage in passages
+                ]
+            }
+        with self._lock:
+            self._stats["search_misses"] += 1
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取文档库规模和复用统计"""
+        with self._lock:
+            documents, chunks, threads = self._conn.execute("""
+                SELECT (SELECT COUNT(*) FROM documents), (SELECT COUNT(*) FROM chunks),
+                       (SELECT COUNT(DISTINCT thread_id) FROM thread_documents)
+            """).fetchone()
+            return {**self._stats, "documents": documents, "chunks": chunks, "threads": threads}
+
+
+# 全局文档库实例
+research_store = None
+_research_store_lock = threading.Lock()
+
+def get_research_store() -> ResearchStore:
+    """获取研究文档库实例"""
+    global research_store
+    with _research_store_lock:
+        if research_store is None:
+            research_store = ResearchStore()
+    return research_store
@@ -0,0 +1,134 @@
+import re
+import threading
+from contextvars import ContextVar
+from typing import Optional, Dict, Any
+from text_utils import estimate_tokens
+
+# 搜索档位：各档位的参数都是搜索工具的实例字段（Tavily的结果数、原始内容等只能在实例化时设置）
+SEARCH_PROFILES: Dict[str, Dict[str, Any]] = {
+    # 少量结果、不要原始网页内容，适合天气、时间等事实查询
+    "quick": {
+        "max_results": 3,
+        "search_depth": "basic",
+        "include_answer": True,
+        "include_raw_content": False,
+        "content_token_budget": 800,
+        "output_token_budget": 1200
+    },
+    # 新闻主题，限定最近一周，摘要即可
+    "news": {
+        "max_results": 6,
+        "search_depth": "basic",
+        "topic": "news",
+        "time_range": "week",
+        "include_answer": True,
+        "include_raw_content": False,
+        "content_token_budget": 1500,
+        "output_token_budget": 2500
+    },
+    # 默认档位（与原来的固定配置相同）
+    "standard": {
+        "max_results": 5,
+        "search_depth": "basic",
+        "include_answer": True,
+        "include_raw_content": True,
+        "content_token_budget": 2000,
+        "output_token_budget": 3000
+    },
+    # 深度搜索，用于研究类任务
+    "deep": {
+        "max_results": 8,
+        "search_depth": "advanced",
+        "include_answer": True,
+        "include_raw_content": True,
+        "content_token_budget": 4000,
+        "output_token_budget": 6000
+    }
+}
+
+# 预设类型可用的档位，按查询复杂度（简单、一般、复杂）依次选取，不足三个时取最后一个
+PRESET_SEARCH_PROFILES = {
+    "weather": ("quick",),
+    "news": ("news",),
+    "research": ("standard", "deep"),
+}
+DEFAULT_SEARCH_PROFILES = ("quick", "standard", "deep")
+
+# 表示需要分析、比较或多方面信息的词
+_COMPLEX_QUERY_RE = re.compile(
+    r'(分析|比较|对比|区别|原因|为什么|影响|趋势|前景|优缺点|综述|研究|评估|如何|怎么|'
+    r'\bvs\b|\bversus\b|\bcompare|\bwhy\b|\bhow\b|\banalys|\bimpact|\btrend|\bpros\b)',
+    re.IGNORECASE
+)
+
+# 当前请求的预设类型，在 run_agent_query 中设置，工具调用时读取
+current_preset: ContextVar[Optional[str]] = ContextVar("current_preset", default=None)
+
+
+def estimate_query_complexity(query: str) -> int:
+    """估计查询复杂度：0 简单、1 一般、2 复杂"""
+    tokens = estimate_tokens(query)
+    level = 1
+    if tokens <= 8:
+        level = 0
+    elif tokens >= 30:
+        level = 2
+    if _COMPLEX_QUERY_RE.search(query or ""):
+        level = min(level + 1, 2)
+    # 多个并列子问题
+    if len(re.findall(r'[，,；;、?？]|\band\b|以及|和', query or "")) >= 3:
+        level = 2
+    return level
+
+
+def select_search_profile(preset_type: Optional[str], query: str) -> str:
+    """根据预设类型和查询复杂度选择搜索档位"""
+    profiles = PRESET_SEARCH_PROFILES.get(preset_type, DEFAULT_SEARCH_PROFILES)
+    level = estimate_query_complexity(query)
+    return profiles[min(level, len(profiles) - 1)]
+
+
+class SearchProfileStats:
+    """按档位统计搜索调用次数、延迟和输出token数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, profile: str, latency: float, tokens: int):
+        """记录一次搜索"""
+        with self._lock:
+            stats = self._stats.setdefault(
+                profile, {"calls": 0, "total_latency": 0.0, "max_latency": 0.0, "total_tokens": 0}
+            )
+            stats["calls"] += 1
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            stats["total_tokens"] += tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取每个档位的平均延迟（毫秒）和平均输出token数"""
+        with self._lock:
+            return {
+                profile: {
+                    "calls": stats["calls"],
+                    "avg_latency_ms": round(stats["total_latency"] / stats["calls"] * 1000, 1),
+                    "max_latency_ms": round(stats["max_latency"] * 1000, 1),
+                    "avg_tokens": round(stats["total_tokens"] / stats["calls"]),
+                    "total_tokens": stats["total_tokens"]
+                }
+                for profile, stats in self._stats.items()
+            }
+
+
+# 全局档位统计实例
+search_profile_stats = None
+_search_profile_stats_lock = threading.Lock()
+
+def get_search_profile_stats() -> SearchProfileStats:
+    """获取搜索档位统计实例"""
+    global search_profile_stats
+    with _search_profile_stats_lock:
+        if search_profile_stats is None:
+            search_profile_stats = SearchProfileStats()
+    return search_profile_stats
@@ -0,0 +1,139 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+DEFAULT_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "8"))
+DEFAULT_ACQUIRE_TIMEOUT = float(os.getenv("SUPABASE_POOL_TIMEOUT", "30"))
+
+
+def _read_supabase_config():
+    """读取Supabase配置"""
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_ANON_KEY")
+
+    if not supabase_url or not supabase_key:
+        raise ValueError("请在.env文件中配置SUPABASE_URL和SUPABASE_ANON_KEY")
+
+    return supabase_url, supabase_key
+
+
+def _read_service_config():
+    """读取使用服务密钥的Supabase配置（跨用户操作，不受行级安全策略限制）"""
+    supabase_url = os.getenv("SUPABASE_URL")
+    service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+    if not supabase_url or not service_key:
+        raise ValueError("服务端写入和跨用户操作需要在.env文件中配置SUPABASE_URL和SUPABASE_SERVICE_ROLE_KEY")
+
+    return supabase_url, service_key
+
+
+class SupabaseClientPool:
+    """Supabase客户端连接池
+
+    每个请求独占一个客户端，在其上设置本次请求的访问令牌，用完后恢复为匿名密钥再放回池中。
+    客户端内部的HTTP会话保持长连接，在不同请求之间复用，不会在并发请求之间串用认证头。
+    """
+
+    def __init__(self, supabase_url: str, supabase_key: str,
+                 size: int = DEFAULT_POOL_SIZE, acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT):
+        self.supabase_url = supabase_url
+        self.supabase_key = supabase_key
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+
+        self._idle: "queue.LifoQueue[Client]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> Client:
+        """取出一个空闲客户端，池未满时新建"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create_new = True
+            else:
+                create_new = False
+
+        if create_new:
+            try:
+                return create_client(self.supabase_url, self.supabase_key)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"等待Supabase客户端超时（连接池大小 {self.size}）")
+
+    def _release(self, client: Client, discard: bool = False):
+        """恢复匿名认证头后放回池中；带有用户会话的客户端直接丢弃"""
+        if not discard:
+            try:
+                client.postgrest.auth(self.supabase_key)
+            except Exception as e:
+                print(f"⚠️ 重置Supabase客户端认证头失败，丢弃该客户端: {e}")
+                discard = True
+
+        if discard:
+            with self._lock:
+                self._created -= 1
+            return
+
+        self._idle.put(client)
+
+    @contextmanager
+    def client(self, access_token: Optional[str] = None, discard: bool = False):
+        """借出一个客户端，并为本次请求设置访问令牌
+
+        Args:
+            access_token: 用户访问令牌，为空时使用匿名密钥
+            discard: 用完后丢弃客户端，用于登录、刷新会话等会在客户端内保存用户会话的操作
+        """
+        client = self._acquire()
+        try:
+            if access_token:
+                client.postgrest.auth(access_token)
+            yield client
+        finally:
+            self._release(client, discard)
+
+    def get_stats(self):
+        """获取连接池状态"""
+        return {"size": self.size, "created": self._created, "idle": self._idle.qsize()}
+
+
+# 全局连接池实例
+supabase_pool = None
+service_supabase_pool = None
+_pool_lock = threading.Lock()
+
+def get_supabase_pool() -> SupabaseClientPool:
+    """获取同步客户端连接池实例"""
+    global supabase_pool
+    with _pool_lock:
+        if supabase_pool is None:
+            supabase_pool = SupabaseClientPool(*_read_supabase_config())
+    return supabase_pool
+
+def get_service_supabase_pool() -> SupabaseClientPool:
+    """获取使用服务密钥的客户端连接池实例（写后队列刷写、归档等服务端任务使用）"""
+    global service_supabase_pool
+    with _pool_lock:
+        if service_supabase_pool is None:
+            service_supabase_pool = SupabaseClientPool(*_read_service_config(), size=2)
+    return service_supabase_pool
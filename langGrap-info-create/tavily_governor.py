@@ -0,0 +1,281 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from typing import Optional, Dict, Any, Callable
+from dotenv import load_dotenv
+from langchain_tavily._utilities import TavilySearchAPIWrapper, TavilyExtractAPIWrapper
+
+# 加载环境变量
+load_dotenv()
+
+_STATUS_RE = re.compile(r'Error (\d{3})')
+
+# Tavily的错误状态码：429 请求过于频繁，432/433 套餐或按量额度用完，401 密钥无效
+RATE_LIMIT_STATUSES = (429,)
+QUOTA_STATUSES = (432, 433)
+AUTH_STATUSES = (401, 403)
+
+# 出错时给Agent的建议，避免模型盲目重试
+ERROR_SUGGESTIONS = {
+    "rate_limited": "搜索服务当前请求过多，请稍后再试或减少并行调用，不要立即重复相同的调用。",
+    "quota_exhausted": "搜索服务额度已用完，请不要再调用搜索或提取工具，直接根据已有信息回答。",
+    "auth": "搜索服务密钥无效，请不要再调用搜索或提取工具，直接根据已有信息回答。",
+    "timeout": "请求超时，可以稍后重试一次，或换用更简短的查询。",
+    "upstream": "搜索服务暂时不可用，可以稍后重试一次。",
+    "error": "调用参数可能有误，请检查参数后再试。"
+}
+
+
+class TavilyAPIError(Exception):
+    """Tavily调用失败（已按错误类型分类，重试用尽后抛出）"""
+
+    def __init__(self, kind: str, message: str, status: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in ("rate_limited", "timeout", "upstream")
+
+
+def classify_error(error: BaseException) -> TavilyAPIError:
+    """把请求异常归类为 TavilyAPIError"""
+    if isinstance(error, TavilyAPIError):
+        return error
+    message = str(error) or error.__class__.__name__
+    match = _STATUS_RE.search(message)
+    status = int(match.group(1)) if match else None
+    if status in RATE_LIMIT_STATUSES:
+        kind = "rate_limited"
+    elif status in QUOTA_STATUSES:
+        kind = "quota_exhausted"
+    elif status in AUTH_STATUSES:
+        kind = "auth"
+    elif status is not None and status >= 500:
+        kind = "upstream"
+    elif isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "timed out" in message.lower():
+        kind = "timeout"
+    elif isinstance(error, (ConnectionError, OSError)) or "connection" in message.lower():
+        kind = "upstream"
+    else:
+        kind = "error"
+    return TavilyAPIError(kind, message, status)
+
+
+def describe_error(error: Any) -> Dict[str, Any]:
+    """把工具错误整理为给Agent看的结构化信息"""
+    if isinstance(error, BaseException):
+        error = classify_error(error)
+    else:
+        error = TavilyAPIError("error", str(error))
+    described = {
+        "type": error.kind,
+        "message": str(error),
+        "retryable": error.retryable,
+        "suggestion": ERROR_SUGGESTIONS[error.kind]
+    }
+    if error.retry_after:
+        described["retry_after"] = round(error.retry_after, 1)
+    return described
+
+
+class TavilyGovernor:
+    """Tavily请求调度
+
+    所有搜索和提取请求（同步、异步和后台刷新）共用一个并发上限和令牌桶限速，
+    被限流或服务端出错时按指数退避加随机抖动重试，额度用完后在冷却期内直接失败，
+    并记录消耗的额度（credits）和限流次数。
+    """
+
+    def __init__(self, max_concurrency: int = 4, rate: float = 5.0, burst: int = 10,
+                 max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 quota_cooldown: float = 600.0, credit_limit: Optional[int] = None):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.quota_cooldown = quota_cooldown
+        self.credit_limit = credit_limit
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._exhausted_until = 0.0
+        self._active = 0
+        self._stats = {
+            "requests": 0, "succeeded": 0, "failed": 0, "retries": 0,
+            "throttled": 0, "rate_wait_seconds": 0.0, "credits_used": 0
+        }
+        self._last_error: Optional[Dict[str, Any]] = None
+
+    def _reserve(self) -> float:
+        """从令牌桶取一个令牌，返回需要等待的秒数（令牌不足时预支）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, 0.0)
+            self._stats["requests"] += 1
+            self._stats["rate_wait_seconds"] += wait
+            return wait
+
+    def _check_quota(self):
+        """额度用完后的冷却期内不再请求"""
+        remaining = self._exhausted_until - time.monotonic()
+        if remaining > 0:
+            raise TavilyAPIError("quota_exhausted", "Tavily 额度已用完", retry_after=remaining)
+
+    def _backoff(self, attempt: int) -> float:
+        """指数退避加全抖动"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _on_success(self, result: Any):
+        with self._lock:
+            self._stats["succeeded"] += 1
+            usage = result.get("usage") if isinstance(result, dict) else None
+            if isinstance(usage, dict):
+                self._stats["credits_used"] += usage.get("credits") or 0
+
+    def _on_error(self, operation: str, error: BaseException, attempt: int) -> Optional[float]:
+        """记录错误，可以重试时返回等待秒数，否则抛出归类后的错误"""
+        classified = classify_error(error)
+        with self._lock:
+            if classified.kind == "rate_limited":
+                self._stats["throttled"] += 1
+            elif classified.kind == "quota_exhausted":
+                self._exhausted_until = time.monotonic() + self.quota_cooldown
+            self._last_error = {
+                "operation": operation, "type": classified.kind,
+                "message": str(classified), "at": time.time()
+            }
+            if not classified.retryable or attempt >= self.max_retries:
+                self._stats["failed"] += 1
+                raise classified from error
+            self._stats["retries"] += 1
+        delay = self._backoff(attempt)
+        print(f"⏳ Tavily {operation} {classified.kind}，{delay:.1f}秒后第{attempt + 1}次重试")
+        return delay
+
+    def call(self, operation: str, func: Callable, *args, **kwargs) -> Any:
+        """在并发上限和限速下同步调用，失败时重试"""
+        attempt = 0
+        while True:
+            self._check_quota()
+            time.sleep(self._reserve())
+            with self._semaphore:
+                with self._lock:
+                    self._active += 1
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                else:
+                    self._on_success(result)
+                    return result
+                finally:
+                    with self._lock:
+                        self._active -= 1
+            time.sleep(self._on_error(operation, error, attempt))
+            attempt += 1
+
+    async def acall(self, operation: str, func: Callable, *args, **kwargs) -> Any:
+        """异步调用，与同步调用共用并发上限和令牌桶"""
+        attempt = 0
+        while True:
+            self._check_quota()
+            await asyncio.sleep(self._reserve())
+            while not self._semaphore.acquire(blocking=False):
+                await asyncio.sleep(0.05)
+            try:
+                with self._lock:
+                    self._active += 1
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                else:
+                    self._on_success(result)
+                    return result
+                finally:
+                    with self._lock:
+                        self._active -= 1
+            finally:
+                self._semaphore.release()
+            await asyncio.sleep(self._on_error(operation, error, attempt))
+            attempt += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计和额度记录"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["rate_wait_seconds"] = round(stats["rate_wait_seconds"], 2)
+            exhausted_for = max(self._exhausted_until - time.monotonic(), 0.0)
+            return {
+                **stats,
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "rate_per_second": self.rate,
+                "quota": {
+                    "credit_limit": self.credit_limit,
+                    "credits_remaining": (
+                        max(self.credit_limit - stats["credits_used"], 0) if self.credit_limit else None
+                    ),
+                    "exhausted": exhausted_for > 0,
+                    "retry_after": round(exhausted_for, 1) if exhausted_for else None
+                },
+                "last_error": self._last_error
+            }
+
+
+class GovernedTavilySearchAPIWrapper(TavilySearchAPIWrapper):
+    """经过调度的Tavily搜索API（同时请求返回额度消耗）"""
+
+    def raw_results(self, *args, **kwargs) -> Dict[str, Any]:
+        kwargs["include_usage"] = True
+        return get_tavily_governor().call("search", super().raw_results, *args, **kwargs)
+
+    async def raw_results_async(self, *args, **kwargs) -> Dict[str, Any]:
+        kwargs["include_usage"] = True
+        return await get_tavily_governor().acall("search", super().raw_results_async, *args, **kwargs)
+
+
+class GovernedTavilyExtractAPIWrapper(TavilyExtractAPIWrapper):
+    """经过调度的Tavily内容提取API（同时请求返回额度消耗）"""
+
+    def raw_results(self, *args, **kwargs) -> Dict[str, Any]:
+        kwargs["include_usage"] = True
+        return get_tavily_governor().call("extract", super().raw_results, *args, **kwargs)
+
+    async def raw_results_async(self, *args, **kwargs) -> Dict[str, Any]:
+        kwargs["include_usage"] = True
+        return await get_tavily_governor().acall("extract", super().raw_results_async, *args, **kwargs)
+
+
+# 全局调度实例
+tavily_governor = None
+_tavily_governor_lock = threading.Lock()
+
+def get_tavily_governor() -> TavilyGovernor:
+    """获取Tavily请求调度实例"""
+    global tavily_governor
+    with _tavily_governor_lock:
+        if tavily_governor is None:
+            credit_limit = os.getenv("TAVILY_CREDIT_LIMIT")
+            tavily_governor = TavilyGovernor(
+                max_concurrency=int(os.getenv("TAVILY_MAX_CONCURRENCY", "4")),
+                rate=float(os.getenv("TAVILY_RATE_PER_SECOND", "5")),
+                burst=int(os.getenv("TAVILY_RATE_BURST", "10")),
+                max_retries=int(os.getenv("TAVILY_MAX_RETRIES", "3")),
+                credit_limit=int(credit_limit) if credit_limit else None
+            )
+    return tavily_governor
@@ -0,0 +1,94 @@
+import re
+import math
+import html
+from collections import Counter
+from typing import List, Iterable, Sequence
+
+# 中日韩统一表意文字范围
+_CJK_RANGES = '㐀-䶿一-鿿豈-﫿'
+_TOKEN_RE = re.compile(f'[{_CJK_RANGES}]+|[0-9a-zÀ-ɏ]+')
+_CJK_RE = re.compile(f'[{_CJK_RANGES}]')
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：英文和数字按单词切分，中文按相邻两字（二元组）切分
+
+    与 database_schema.sql 中的 cjk_bigram_text() 规则保持一致，
+    这样同一段文字在Python、Postgres和本地SQLite中得到相同的词项。
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer((text or '').lower()):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def cjk_bigram_text(text: str) -> str:
+    """把文本转换为以空格分隔的词项，供全文索引使用"""
+    return ' '.join(tokenize(text))
+
+
+def highlight(text: str, terms: Iterable[str], width: int = 160) -> str:
+    """截取包含查询词的片段，转义HTML后用<mark>标记命中的词"""
+    text = text or ''
+    terms = sorted({term for term in terms if term}, key=len, reverse=True)
+    if not terms:
+        return html.escape(text[:width])
+
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max((first.start() if first else 0) - width // 4, 0)
+    excerpt = text[start:start + width]
+
+    parts = []
+    last = 0
+    for match in pattern.finditer(excerpt):
+        parts.append(html.escape(excerpt[last:match.start()]))
+        parts.append(f'<mark>{html.escape(match.group())}</mark>')
+        last = match.end()
+    parts.append(html.escape(excerpt[last:]))
+
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if start + width < len(text) else ''
+    return prefix + ''.join(parts) + suffix
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文每个字约1个token，其他字符约4个字符1个token"""
+    text = text or ''
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def bm25_scores(query_terms: Sequence[str], documents: Sequence[Sequence[str]],
+                k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """计算每个文档（已分词）相对查询词项的BM25得分"""
+    if not documents:
+        return []
+    doc_count = len(documents)
+    avg_length = sum(len(terms) for terms in documents) / doc_count or 1.0
+    query = set(query_terms)
+
+    doc_freq = Counter()
+    for terms in documents:
+        doc_freq.update(query.intersection(terms))
+    idf = {
+        term: math.log(1 + (doc_count - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+        for term in query
+    }
+
+    scores = []
+    for terms in documents:
+        freq = Counter(terms)
+        norm = k1 * (1 - b + b * len(terms) / avg_length)
+        scores.append(sum(
+            idf[term] * freq[term] * (k1 + 1) / (freq[term] + norm)
+            for term in query if freq[term]
+        ))
+    return scores
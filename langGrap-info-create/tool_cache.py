@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+from typing import Optional, Dict, Any, Tuple, Callable
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本：统一全角半角、大小写并合并空白"""
+    return " ".join(unicodedata.normalize("NFKC", query or "").lower().split())
+
+
+def normalize_url(url: str) -> Optional[str]:
+    """规范化URL：补全协议，协议和域名小写，去掉默认端口和锚点，无法识别时返回None"""
+    url = (url or "").strip().strip("'\"<>")
+    if not url:
+        return None
+    if "://" not in url:
+        url = "https://" + url
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    default_port = {"http": 80, "https": 443}[parts.scheme.lower()]
+    if port and port != default_port:
+        host = f"{host}:{port}"
+    return urlunsplit((parts.scheme.lower(), host, parts.path or "/", parts.query, ""))
+
+
+def make_cache_key(tool_name: str, query: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """根据工具名、规范化后的查询和选项生成缓存键
+
+    值为None的选项被忽略，列表选项（如域名列表）按排序后的内容比较。
+    """
+    normalized_options = {}
+    for name, value in (options or {}).items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(item) for item in value)
+        normalized_options[name] = value
+    raw = json.dumps(
+        [tool_name, normalize_query(query), normalized_options],
+        ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ToolResultCache:
+    """工具结果两级缓存
+
+    第一级为进程内LRU，第二级为本地SQLite文件（WAL模式），多个worker进程共享。
+    每条记录有新鲜期（ttl）和过期后仍可使用的陈旧期（stale_ttl）：
+    陈旧期内的结果先直接返回，同时在后台线程中重新获取（stale-while-revalidate）。
+    """
+
+    def __init__(self, db_path: Optional[str] = None, memory_size: int = 512):
+        self.db_path = db_path or os.getenv(
+            "TOOL_CACHE_PATH",
+            os.path.join(os.path.dirname(__file__), "tool_cache.db")
+        )
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, Tuple[float, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tool_cache (
+                cache_key TEXT PRIMARY KEY,
+                tool_name TEXT NOT NULL,
+                value TEXT NOT NULL,
+                fresh_until REAL NOT NULL,
+                stale_until REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_cache_stale ON tool_cache(stale_until)")
+
+    def _count(self, tool_name: str, field: str):
+        """累加统计（调用方持有锁）"""
+        stats = self._stats.setdefault(
+            tool_name, {"memory_hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+        )
+        stats[field] += 1
+
+    def _remember(self, key: str, entry: Tuple[float, float, Any]):
+        """写入内存LRU（调用方持有锁）"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, tool_name: str, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """读取缓存，返回 (结果, 状态)，状态为 fresh、stale 或 None（未命中）"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            source = "memory_hits"
+            if entry is None or entry[1] < now:
+                row = self._conn.execute(
+                    "SELECT value, fresh_until, stale_until FROM tool_cache WHERE cache_key = ? AND stale_until >= ?",
+                    (key, now)
+                ).fetchone()
+                if row is None:
+                    self._memory.pop(key, None)
+                    self._count(tool_name, "misses")
+                    return None, None
+                entry = (row[1], row[2], json.loads(row[0]))
+                self._remember(key, entry)
+                source = "disk_hits"
+            else:
+                self._memory.move_to_end(key)
+
+            fresh_until, _, value = entry
+            if fresh_until >= now:
+                self._count(tool_name, source)
+                return value, "fresh"
+            self._count(tool_name, "stale_hits")
+            return value, "stale"
+
+    def set(self, tool_name: str, key: str, value: Any, ttl: float, stale_ttl: float = 0.0):
+        """写入两级缓存"""
+        now = time.time()
+        entry = (now + ttl, now + ttl + stale_ttl, value)
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._remember(key, entry)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tool_cache (cache_key, tool_name, value, fresh_until, stale_until, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool_name, data, entry[0], entry[1], now)
+            )
+            # 偶尔清理已完全过期的记录
+            if random.random() < 0.01:
+                self._conn.execute("DELETE FROM tool_cache WHERE stale_until < ?", (now,))
+
+    def refresh_in_background(self, tool_name: str, key: str, fetch: Callable[[], Any],
+                              ttl: float, stale_ttl: float = 0.0,
+                              is_valid: Callable[[Any], bool] = lambda value: True):
+        """在后台线程中重新获取结果并写入缓存，同一个键同时只刷新一次"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._count(tool_name, "refreshes")
+
+        def refresh():
+            try:
+                value = fetch()
+                if is_valid(value):
+                    self.set(tool_name, key, value, ttl, stale_ttl)
+            except Exception as e:
+                print(f"⚠️ 后台刷新 {tool_name} 缓存失败: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"tool-cache-refresh-{tool_name}", daemon=True).start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取每个工具的命中统计"""
+        with self._lock:
+            tools = {}
+            for tool_name, stats in self._stats.items():
+                hits = stats["memory_hits"] + stats["disk_hits"] + stats["stale_hits"]
+                total = hits + stats["misses"]
+                tools[tool_name] = {
+                    **stats,
+                    "hits": hits,
+                    "hit_rate": round(hits / total, 3) if total else 0.0
+                }
+            return {
+                "tools": tools,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._conn.execute("SELECT COUNT(*) FROM tool_cache").fetchone()[0]
+            }
+
+
+# 全局工具缓存实例
+tool_cache = None
+_tool_cache_lock = threading.Lock()
+
+def get_tool_cache() -> ToolResultCache:
+    """获取工具结果缓存实例"""
+    global tool_cache
+    with _tool_cache_lock:
+        if tool_cache is None:
+            tool_cache = ToolResultCache(
+                memory_size=int(os.getenv("TOOL_CACHE_MEMORY_SIZE", "512"))
+            )
+    return tool_cache
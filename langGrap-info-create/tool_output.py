@@ -0,0 +1,135 @@
+import re
+import json
+import functools
+from typing import Any, Optional, Sequence, Dict, Callable
+from text_utils import estimate_tokens
+
+# 装饰性的emoji和符号（对模型没有信息量，只会增加token）
+_EMOJI_RE = re.compile(
+    '[\U0001F000-\U0001FAFF☀-➿⬀-⯿⌀-⏿️‍]+ ?'
+)
+_TRUNCATED = '…(已截断)'
+
+# Tavily结果保留的字段及顺序，未列出的字段（如images、response_time、request_id）不输出
+TAVILY_SEARCH_FIELDS = {
+    "": ("query", "answer", "results", "failed_results", "error"),
+    "results": ("title", "url", "published_date", "score", "content", "raw_content"),
+    "failed_results": ("url", "error"),
+}
+TAVILY_EXTRACT_FIELDS = {
+    "": ("results", "failed_results", "error"),
+    "results": ("url", "raw_content"),
+    "failed_results": ("url", "error"),
+}
+
+
+def prune_empty(value: Any) -> Any:
+    """递归去掉值为None、空字符串、空列表和空字典的字段，浮点数保留两位小数"""
+    if isinstance(value, dict):
+        pruned = {key: prune_empty(item) for key, item in value.items()}
+        return {key: item for key, item in pruned.items() if item not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        pruned = [prune_empty(item) for item in value]
+        return [item for item in pruned if item not in (None, "", [], {})]
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def project_fields(value: Any, fields: Dict[str, Sequence[str]], path: str = "") -> Any:
+    """按字段表筛选并固定字段顺序，fields的键为字段路径（顶层为空字符串）"""
+    if isinstance(value, list):
+        return [project_fields(item, fields, path) for item in value]
+    if isinstance(value, dict) and path in fields:
+        return {
+            name: project_fields(value[name], fields, name)
+            for name in fields[path] if name in value
+        }
+    return value
+
+
+def _shrink_longest(value: Any, ratio: float) -> bool:
+    """把结构中最长的字符串按比例截短，没有可截短的内容时返回False"""
+    longest = None
+
+    def visit(container, key):
+        nonlocal longest
+        item = container[key]
+        if isinstance(item, str):
+            if len(item) > 80 and (longest is None or len(item) > len(longest[0][longest[1]])):
+                longest = (container, key)
+        elif isinstance(item, dict):
+            for child in item:
+                visit(item, child)
+        elif isinstance(item, list):
+            for index in range(len(item)):
+                visit(item, index)
+
+    holder = [value]
+    visit(holder, 0)
+    if longest is None:
+        return False
+    container, key = longest
+    text = container[key]
+    if text.endswith(_TRUNCATED):
+        text = text[:-len(_TRUNCATED)]
+    container[key] = text[:int(len(text) * ratio)] + _TRUNCATED
+    return True
+
+
+def compact_text(text: str) -> str:
+    """去掉装饰性emoji、行尾空白和多余空行"""
+    text = _EMOJI_RE.sub('', text or '')
+    lines = [line.rstrip() for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def format_tool_output(value: Any, token_budget: Optional[int] = None,
+                       fields: Optional[Dict[str, Sequence[str]]] = None) -> str:
+    """把工具结果转换为紧凑文本
+
+    字典和列表输出为紧凑JSON（去掉空字段，可按字段表固定结构），字符串去掉装饰性内容。
+    超出token预算时优先截短最长的文本字段，仍然超出时整体截断。
+    """
+    if isinstance(value, str):
+        return truncate_text(compact_text(value), token_budget)
+
+    if fields:
+        value = project_fields(value, fields)
+    value = prune_empty(value)
+
+    def dump(data):
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+    text = dump(value)
+    if token_budget:
+        for _ in range(50):
+            if estimate_tokens(text) <= token_budget or not _shrink_longest(value, 0.6):
+                break
+            text = dump(value)
+        text = truncate_text(text, token_budget)
+    return text
+
+
+def truncate_text(text: str, token_budget: Optional[int] = None) -> str:
+    """超出token预算时按比例截断文本，不改动文本内容本身"""
+    tokens = estimate_tokens(text)
+    if token_budget and tokens > token_budget:
+        return text[:max(len(text) * token_budget // tokens, 1)] + _TRUNCATED
+    return text
+
+
+def limit_output(token_budget: Optional[int] = None) -> Callable:
+    """工具函数装饰器：返回的文本超出token预算时截断
+
+    只做截断，不去掉emoji和空白，文件内容、目录列表等原样透传的数据保持不变。
+    放在 @tool 之下使用，函数签名和文档说明保持不变。
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return truncate_text(func(*args, **kwargs), token_budget)
+        return wrapper
+    return decorator
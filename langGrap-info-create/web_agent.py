@@ -1,24 +1,50 @@
 import os
+import re
+import zlib
 import asyncio
+import functools
 import json
+import time
 import threading
 import atexit
-from concurrent.futures import ThreadPoolExecutor
-from flask import Flask, request, jsonify, render_template, Response, session
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import Flask, request, jsonify, render_template, Response, session, send_file, stream_with_context
 from flask_cors import CORS
 from flask_session import Session
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Callable
 from dotenv import load_dotenv
 from langchain_tavily import TavilySearch, TavilyExtract
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.runnables import RunnableConfig
+from pydantic import PrivateAttr
 from langgraph.prebuilt import create_react_agent
 from langgraph.checkpoint.memory import MemorySaver
 from extended_tools import get_extended_tools
 # 删除未使用的 webpage_generator 导入
-from ai_webpage_designer import get_ai_webpage_designer_tool
+from ai_webpage_designer import get_ai_webpage_designer_tool, pop_generated_blob
 from auth_manager import get_auth_manager
-from history_manager import get_history_manager
+from history_manager import get_history_manager, encode_history_cursor, MAX_PAGE_SIZE
+from history_queue import get_history_queue, shutdown_history_queue, history_queue_supported
+from history_compaction import get_history_compactor, shutdown_history_compactor
+from history_analytics import get_history_analytics
+from tool_cache import get_tool_cache, make_cache_key, normalize_url
+from content_condenser import get_content_condenser
+from tool_output import format_tool_output, TAVILY_SEARCH_FIELDS, TAVILY_EXTRACT_FIELDS
+from search_profiles import SEARCH_PROFILES, current_preset, select_search_profile, get_search_profile_stats
+from text_utils import estimate_tokens
+from local_search import LocalSearchTool, get_local_search_index
+from research_store import get_research_store, current_thread
+from preset_graphs import (
+    create_research_graph, create_fast_preset_graph, ainvoke_preset_output, message_text, parse_json_block,
+    format_history, FAST_PRESET_TOOL_CALLS
+)
+from preset_registry import build_preset_prompt, get_preset_schema, get_preset_tool_names, validate_preset_data
+from intent_router import get_intent_router, choose_declared_model_type
+from tavily_governor import (
+    GovernedTavilySearchAPIWrapper, GovernedTavilyExtractAPIWrapper, TavilyAPIError,
+    describe_error, get_tavily_governor
+)
+from blob_store import get_blob_store
 
 try:
     from langchain_google_genai import ChatGoogleGenerativeAI
@@ -98,88 +124,381 @@ def run_async_in_loop(coro):
         print(f"❌ 异步操作执行失败: {str(e)}")
         return {"success": False, "error": f"操作失败: {str(e)}"}
 
+def _is_cacheable_result(result: Any) -> bool:
+    """只缓存成功的工具结果"""
+    return isinstance(result, dict) and "error" not in result
+
+def _structure_error(result: Any) -> Any:
+    """把Tavily工具返回的 {"error": 异常} 换成结构化的错误信息"""
+    if isinstance(result, dict) and "error" in result:
+        return {"error": describe_error(result["error"])}
+    return result
+
+def _save_research_documents(result: Any, source: str):
+    """把结果中的原始网页内容保存到研究文档库，并关联到当前会话"""
+    if not isinstance(result, dict):
+        return
+    store = get_research_store()
+    thread_id = current_thread.get()
+    for item in result.get("results") or []:
+        if item.get("raw_content"):
+            try:
+                store.add_document(item.get("url"), item["raw_content"], item.get("title"), thread_id, source)
+            except Exception as e:
+                print(f"⚠️ 保存研究文档失败: {e}")
+
+def _condense_result(tool_name: str, result: Any, query: str, token_budget: int) -> Any:
+    """按查询精简结果中的原始网页内容，并记录节省的token数"""
+    if not isinstance(result, dict) or not result.get("results"):
+        return result
+    condensed, stats = get_content_condenser().condense(result, query, token_budget)
+    if stats["tokens_saved"]:
+        print(f"✂️ {tool_name} 内容精简: {stats['tokens_before']} → {stats['tokens_after']} tokens"
+              f"（节省 {stats['tokens_saved']}）")
+    return condensed
+
 class TavilySearchWithLogging(TavilySearch):
-    """带输出日志的Tavily搜索工具"""
+    """带输出日志和结果缓存的Tavily搜索工具
+
+    注册给Agent的实例不固定搜索参数：每次调用根据当前预设类型和查询复杂度选择搜索档位，
+    交给该档位的实例执行（结果数、是否返回原始内容等只能在实例化时设置），并按档位统计延迟和token数。
+    """
+    
+    # 档位实例的档位名称，为None时按调用选择档位
+    search_profile: Optional[str] = None
+    # 结果新鲜期和过期后仍先返回旧结果、同时后台刷新的陈旧期（秒）
+    cache_ttl: float = 900
+    cache_stale_ttl: float = 3600
+    # 原始网页内容精简后保留的token数，以及整个工具输出的token上限
+    content_token_budget: int = 2000
+    output_token_budget: int = 3000
+    
+    def _cache_options(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """影响搜索结果的选项（实例配置加本次调用参数）"""
+        return {
+            "max_results": self.max_results,
+            "search_depth": self.search_depth,
+            "topic": self.topic,
+            "time_range": self.time_range,
+            "include_answer": self.include_answer,
+            "include_raw_content": self.include_raw_content,
+            "include_images": self.include_images,
+            "include_domains": self.include_domains,
+            "exclude_domains": self.exclude_domains,
+            **kwargs
+        }
+    
+    def _from_cache(self, query: str, kwargs: Dict[str, Any]):
+        """查询缓存，返回 (缓存键, 缓存结果)；结果已陈旧时在后台刷新"""
+        cache = get_tool_cache()
+        key = make_cache_key(self.name, query, self._cache_options(kwargs))
+        cached, state = cache.get(self.name, key)
+        if state == "stale":
+            print(f"⚡ Tavily 搜索命中缓存（已过期，后台刷新）")
+            cache.refresh_in_background(
+                self.name, key, functools.partial(super()._run, query, **kwargs),
+                self.cache_ttl, self.cache_stale_ttl, _is_cacheable_result
+            )
+        elif state == "fresh":
+            print(f"⚡ Tavily 搜索命中缓存")
+        return key, cached
+    
+    _profile_tools: Dict[str, "TavilySearchWithLogging"] = PrivateAttr(default_factory=dict)
+    
+    def _select_profile(self, query: str) -> Tuple[str, "TavilySearchWithLogging"]:
+        """选择本次调用的搜索档位，返回 (档位名称, 档位实例)"""
+        if self.search_profile:
+            return self.search_profile, self
+        preset_type = current_preset.get()
+        profile = select_search_profile(preset_type, query)
+        tool = self._profile_tools.get(profile)
+        if tool is None:
+            tool = self.model_copy(update={**SEARCH_PROFILES[profile], "search_profile": profile})
+            self._profile_tools[profile] = tool
+        print(f"🎚️ 搜索档位: {profile}（预设: {preset_type or '无'}）")
+        return profile, tool
     
-    def _run(self, query: str) -> str:
+    def _run(self, query: str, **kwargs) -> str:
+        """按搜索档位执行搜索，并记录延迟和输出token数"""
+        profile, tool = self._select_profile(query)
+        started = time.perf_counter()
+        output = tool._search(query, kwargs)
+        get_search_profile_stats().record(profile, time.perf_counter() - started, estimate_tokens(output))
+        return output
+    
+    async def _arun(self, query: str, **kwargs) -> str:
+        """异步按搜索档位执行搜索，并记录延迟和输出token数"""
+        profile, tool = self._select_profile(query)
+        started = time.perf_counter()
+        output = await tool._asearch(query, kwargs)
+        get_search_profile_stats().record(profile, time.perf_counter() - started, estimate_tokens(output))
+        return output
+    
+    def _from_research_store(self, query: str) -> Optional[Dict[str, Any]]:
+        """同一会话或主题已保存的段落足以回答时直接使用（新闻和不需要原始内容的档位除外）"""
+        if not self.include_raw_content or self.topic == "news":
+            return None
+        stored = get_research_store().retrieve(query, current_thread.get(), self.max_results)
+        if stored:
+            print(f"📚 使用研究文档库中已保存的 {len(stored['results'])} 个段落，不再联网搜索")
+        return stored
+    
+    def _search(self, query: str, kwargs: Dict[str, Any]) -> str:
         """执行搜索并记录日志"""
         print(f"🔍 正在使用 Tavily 搜索工具查询: {query}")
         try:
-            result = super()._run(query)
-            print(f"✅ Tavily 搜索完成，获取到相关信息")
-            if isinstance(result, dict):
-                return str(result)
-            return result
+            stored = self._from_research_store(query)
+            if stored:
+                return format_tool_output(stored, self.output_token_budget, TAVILY_SEARCH_FIELDS)
+            key, result = self._from_cache(query, kwargs)
+            if result is None:
+                result = super()._run(query, **kwargs)
+                if _is_cacheable_result(result):
+                    get_tool_cache().set(self.name, key, result, self.cache_ttl, self.cache_stale_ttl)
+                print(f"✅ Tavily 搜索完成，获取到相关信息")
+            _save_research_documents(result, "search")
+            result = _condense_result(self.name, _structure_error(result), query, self.content_token_budget)
+            return format_tool_output(result, self.output_token_budget, TAVILY_SEARCH_FIELDS)
         except Exception as e:
             print(f"❌ Tavily 搜索出错: {str(e)}")
-            return f"搜索出错: {str(e)}"
+            return format_tool_output({"error": describe_error(e)})
     
-    async def _arun(self, query: str) -> str:
+    async def _asearch(self, query: str, kwargs: Dict[str, Any]) -> str:
         """异步执行搜索并记录日志"""
         print(f"🔍 正在使用 Tavily 搜索工具查询: {query}")
         try:
-            result = await super()._arun(query)
-            print(f"✅ Tavily 搜索完成，获取到相关信息")
-            if isinstance(result, dict):
-                return str(result)
-            return result
+            stored = self._from_research_store(query)
+            if stored:
+                return format_tool_output(stored, self.output_token_budget, TAVILY_SEARCH_FIELDS)
+            key, result = self._from_cache(query, kwargs)
+            if result is None:
+                result = await super()._arun(query, **kwargs)
+                if _is_cacheable_result(result):
+                    get_tool_cache().set(self.name, key, result, self.cache_ttl, self.cache_stale_ttl)
+                print(f"✅ Tavily 搜索完成，获取到相关信息")
+            _save_research_documents(result, "search")
+            result = _condense_result(self.name, _structure_error(result), query, self.content_token_budget)
+            return format_tool_output(result, self.output_token_budget, TAVILY_SEARCH_FIELDS)
         except Exception as e:
             print(f"❌ Tavily 搜索出错: {str(e)}")
-            return f"搜索出错: {str(e)}"
+            return format_tool_output({"error": describe_error(e)})
+
+# 内容提取工具按URL并发请求使用的线程池
+_extract_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tavily-extract")
 
 class TavilyExtractWithLogging(TavilyExtract):
-    """带输出日志的Tavily内容提取工具"""
+    """带输出日志的Tavily内容提取工具
+
+    URL去重规范化后先查按URL的内容缓存，未命中的URL各自单独并发提取，
+    每个URL有独立的超时时间，超时或失败的URL放在failed_results中，其余结果照常返回。
+    """
     
-    def _run(self, urls: str) -> str:
-        """执行内容提取并记录日志"""
+    cache_ttl: float = 86400
+    cache_stale_ttl: float = 7 * 86400
+    url_timeout: float = 20.0
+    content_token_budget: int = 3000
+    output_token_budget: int = 4000
+    
+    @staticmethod
+    def _prepare_urls(urls) -> List[str]:
+        """拆分、规范化并去重URL（保持原有顺序）"""
         if isinstance(urls, str):
-            url_list = [url.strip() for url in urls.split(',') if url.strip()]
+            urls = urls.split(',')
+        url_list = []
+        for url in urls:
+            normalized = normalize_url(url)
+            if normalized and normalized not in url_list:
+                url_list.append(normalized)
+        return url_list
+    
+    def _lookup_cache(self, url_list: List[str], kwargs: Dict[str, Any]):
+        """查询每个URL的缓存，返回 (缓存键, 已命中的结果)；结果已陈旧时在后台重新提取"""
+        cache = get_tool_cache()
+        options = {
+            "extract_depth": self.extract_depth,
+            "include_images": self.include_images,
+            "format": self.format,
+            "query": self.query,
+            **kwargs
+        }
+        # URL路径区分大小写，放在选项中而不是作为查询文本规范化
+        keys = {url: make_cache_key(self.name, "", {**options, "url": url}) for url in url_list}
+        found = {}
+        store = get_research_store()
+        thread_id = current_thread.get()
+        extract = super()._run
+        for url in url_list:
+            item, state = cache.get(self.name, keys[url])
+            if state == "stale":
+                # 陈旧的内容本次直接使用，同时在后台重新提取，刷新后的内容供后续请求使用
+                cache.refresh_in_background(
+                    self.name, keys[url], functools.partial(self._extract_item, extract, url, kwargs),
+                    self.cache_ttl, self.cache_stale_ttl, lambda value: value is not None
+                )
+            if item is None:
+                # 研究文档库中本会话用过或近期保存的页面
+                item = store.get_document(url, thread_id)
+            if item is not None:
+                found[url] = item
+        return keys, found
+    
+    @staticmethod
+    def _extract_item(extract: Callable, url: str, kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """提取单个URL，返回该URL的结果，失败时返回None"""
+        outcome = extract([url], **kwargs)
+        if isinstance(outcome, dict) and outcome.get("results") and "error" not in outcome:
+            return outcome["results"][0]
+        return None
+    
+    def _collect(self, url: str, outcome: Any, keys: Dict[str, str],
+                 found: Dict[str, Any], failed: List[Dict[str, Any]]):
+        """整理单个URL的提取结果，成功的写入缓存"""
+        if isinstance(outcome, Exception):
+            failed.append({"url": url, "error": describe_error(outcome)})
+        elif isinstance(outcome, dict) and outcome.get("results") and "error" not in outcome:
+            item = outcome["results"][0]
+            found[url] = item
+            get_tool_cache().set(self.name, keys[url], item, self.cache_ttl, self.cache_stale_ttl)
         else:
-            url_list = urls
-            
+            outcome = outcome if isinstance(outcome, dict) else {}
+            failed.extend(
+                outcome.get("failed_results") or [{"url": url, "error": describe_error(outcome.get("error", "未提取到内容"))}]
+            )
+    
+    @staticmethod
+    def _assemble(url_list: List[str], found: Dict[str, Any], failed: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """按请求顺序合并结果"""
+        print(f"✅ Tavily 内容提取完成: 成功 {len(found)} 个，失败 {len(failed)} 个")
+        return {
+            "results": [found[url] for url in url_list if url in found],
+            "failed_results": failed
+        }
+    
+    def _finish(self, url_list: List[str], found: Dict[str, Any], failed: List[Dict[str, Any]],
+                kwargs: Dict[str, Any]) -> str:
+        """合并结果，精简原始内容（有query参数时按相关度，否则保留各页面开头部分）后输出紧凑JSON"""
+        result = self._assemble(url_list, found, failed)
+        _save_research_documents(result, "extract")
+        result = _condense_result(
+            self.name, result, kwargs.get("query") or self.query, self.content_token_budget
+        )
+        return format_tool_output(result, self.output_token_budget, TAVILY_EXTRACT_FIELDS)
+    
+    def _run(self, urls: str, **kwargs) -> str:
+        """执行内容提取并记录日志"""
+        url_list = self._prepare_urls(urls)
         print(f"📄 正在使用 Tavily 提取工具从 {len(url_list)} 个URL提取内容...")
         try:
-            result = super()._run(url_list)
-            print(f"✅ Tavily 内容提取完成")
-            if isinstance(result, dict):
-                return str(result)
-            return result
+            keys, found = self._lookup_cache(url_list, kwargs)
+            misses = [url for url in url_list if url not in found]
+            if len(misses) < len(url_list):
+                print(f"⚡ {len(url_list) - len(misses)} 个URL命中缓存")
+            
+            failed = []
+            if misses:
+                extract = super()._run
+                started: Dict[str, float] = {}
+                
+                def extract_one(url: str):
+                    # 超时从该URL实际开始提取时计算，在线程池中排队的时间不算在内
+                    started[url] = time.monotonic()
+                    return extract([url], **kwargs)
+                
+                futures = {_extract_executor.submit(extract_one, url): url for url in misses}
+                pending = set(futures)
+                while pending:
+                    now = time.monotonic()
+                    expired = {
+                        future for future in pending
+                        if futures[future] in started and now - started[futures[future]] >= self.url_timeout
+                    }
+                    for future in expired:
+                        failed.append({
+                            "url": futures[future],
+                            "error": describe_error(TavilyAPIError("timeout", f"提取超时（{self.url_timeout:g}秒）"))
+                        })
+                    pending -= expired
+                    if not pending:
+                        break
+                    # 等到下一个URL完成或到期；还有排队未开始的URL时定期检查
+                    deadlines = [
+                        started[futures[future]] + self.url_timeout
+                        for future in pending if futures[future] in started
+                    ]
+                    timeout = min(deadlines) - now if deadlines else None
+                    if len(deadlines) < len(pending):
+                        timeout = min(timeout, 0.5) if timeout is not None else 0.5
+                    done, _ = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url = futures[future]
+                        try:
+                            self._collect(url, future.result(), keys, found, failed)
+                        except Exception as e:
+                            self._collect(url, e, keys, found, failed)
+                    pending -= done
+            
+            return self._finish(url_list, found, failed, kwargs)
         except Exception as e:
             print(f"❌ Tavily 内容提取出错: {str(e)}")
-            return f"内容提取出错: {str(e)}"
+            return format_tool_output({"error": describe_error(e)})
     
-    async def _arun(self, urls: str) -> str:
+    async def _arun(self, urls: str, **kwargs) -> str:
         """异步执行内容提取并记录日志"""
-        if isinstance(urls, str):
-            url_list = [url.strip() for url in urls.split(',') if url.strip()]
-        else:
-            url_list = urls
-            
+        url_list = self._prepare_urls(urls)
         print(f"📄 正在使用 Tavily 提取工具从 {len(url_list)} 个URL提取内容...")
         try:
-            result = await super()._arun(url_list)
-            print(f"✅ Tavily 内容提取完成")
-            if isinstance(result, dict):
-                return str(result)
-            return result
+            keys, found = self._lookup_cache(url_list, kwargs)
+            misses = [url for url in url_list if url not in found]
+            if len(misses) < len(url_list):
+                print(f"⚡ {len(url_list) - len(misses)} 个URL命中缓存")
+            
+            extract = super()._arun
+            
+            async def extract_one(url: str):
+                try:
+                    return await asyncio.wait_for(extract([url], **kwargs), timeout=self.url_timeout)
+                except asyncio.TimeoutError:
+                    return asyncio.TimeoutError(f"提取超时（{self.url_timeout:g}秒）")
+                except Exception as e:
+                    return e
+            
+            failed = []
+            outcomes = await asyncio.gather(*(extract_one(url) for url in misses))
+            for url, outcome in zip(misses, outcomes):
+                self._collect(url, outcome, keys, found, failed)
+            
+            return self._finish(url_list, found, failed, kwargs)
         except Exception as e:
             print(f"❌ Tavily 内容提取出错: {str(e)}")
-            return f"内容提取出错: {str(e)}"
+            return format_tool_output({"error": describe_error(e)})
+
+# 搜索后端：tavily（网络搜索）或 local（本地BM25索引，见 local_search.py），工具名称和结果结构相同
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "tavily").lower()
 
 # 定义所有可用工具
-tavily_tools = [
-    TavilySearchWithLogging(
+if SEARCH_BACKEND == "local":
+    search_tool = LocalSearchTool()
+    print(f"📚 使用本地搜索索引: {get_local_search_index().get_stats()['documents']} 个文档")
+else:
+    search_tool = TavilySearchWithLogging(
         max_results=5,
         search_depth="basic",
         include_answer=True,
         include_raw_content=True,
         include_images=False,
+        cache_ttl=float(os.getenv("TAVILY_SEARCH_CACHE_TTL", "900")),
+        api_wrapper=GovernedTavilySearchAPIWrapper(),
         name="tavily_search",
         description="强大的实时网络搜索工具，用于获取最新信息、新闻和网络内容。"
-    ),
+    )
+
+tavily_tools = [
+    search_tool,
     TavilyExtractWithLogging(
         extract_depth="basic",
         include_images=False,
+        url_timeout=float(os.getenv("TAVILY_EXTRACT_URL_TIMEOUT", "20")),
+        apiwrapper=GovernedTavilyExtractAPIWrapper(),
         name="tavily_extract",
         description="强大的网页内容提取工具，可以从指定URL中提取和处理原始内容。"
     )
@@ -189,6 +508,7 @@ tavily_tools = [
 extended_tools = get_extended_tools()
 ai_designer_tool = get_ai_webpage_designer_tool()
 agent_tools = tavily_tools + extended_tools + [ai_designer_tool]
+tools_by_name = {tool.name: tool for tool in agent_tools}
 
 def create_deepseek_model():
     """创建 DeepSeek 模型实例"""
@@ -250,6 +570,8 @@ MODEL_CONFIG = {
 print("🚀 初始化多模型系统...")
 models = {}
 agents = {}
+# 每种模型的通用Agent的对话记忆（预设专用Agent各自使用独立的记忆）
+checkpointers = {}
 
 for model_type, config in MODEL_CONFIG.items():
     try:
@@ -270,6 +592,7 @@ for model_type, config in MODEL_CONFIG.items():
         else:
             # 复杂任务使用checkpoint，保持对话连贯性
             checkpoint = MemorySaver()
+            checkpointers[model_type] = checkpoint
             agent = create_react_agent(
                 model=model,
                 tools=agent_tools,
@@ -306,6 +629,7 @@ for model_type, config in MODEL_CONFIG.items():
                 models[model_type] = fallback_model
                 # AI设计师任务使用记忆模式
                 checkpoint = MemorySaver()
+                checkpointers[model_type] = checkpoint
                 agent = create_react_agent(
                     model=fallback_model,
                     tools=agent_tools,
@@ -328,12 +652,80 @@ def get_model_type_for_preset(preset_type):
 
 print("✅ 多模型系统初始化完成")
 
-async def run_agent_query(prompt: str, thread_id: str = "web_session", model_type: str = "simple"):
-    """运行 Agent 查询并返回结果"""
+# 意图路由：按请求内容选择最便宜的可用模型档位，自由问题同时选择预设类型
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER", "false").lower() == "true"
+if INTENT_ROUTER_ENABLED:
+    get_intent_router()
+
+# 预设的固定流程图：研究预设使用并行的研究流程（规划 → 并行搜索 → 并行总结 → 撰写），
+# 总结用简单任务模型；天气、新闻、内容提取直接调用工具后由所选模型格式化一次。按 (预设类型, 模型类型) 创建一次后复用
+RESEARCH_PIPELINE_ENABLED = os.getenv("RESEARCH_PIPELINE", "true").lower() == "true"
+FAST_PRESET_PIPELINES_ENABLED = os.getenv("FAST_PRESET_PIPELINES", "true").lower() == "true"
+PIPELINE_PRESETS = set()
+if RESEARCH_PIPELINE_ENABLED:
+    PIPELINE_PRESETS.add('research')
+    print("🔀 研究流程已启用（并行搜索和总结）")
+if FAST_PRESET_PIPELINES_ENABLED:
+    PIPELINE_PRESETS.update(FAST_PRESET_TOOL_CALLS)
+    print(f"⚡ 固定流程已启用: {', '.join(FAST_PRESET_TOOL_CALLS)}")
+preset_pipelines = {}
+_preset_pipelines_lock = threading.Lock()
+
+def get_preset_pipeline(preset_type: str, model_type: str):
+    """获取预设的固定流程图，首次使用时创建；预设没有固定流程或模型未初始化时返回None"""
+    if preset_type not in PIPELINE_PRESETS or model_type not in models:
+        return None
+    key = (preset_type, model_type)
+    with _preset_pipelines_lock:
+        if key not in preset_pipelines:
+            if preset_type == 'research':
+                preset_pipelines[key] = create_research_graph(
+                    models[model_type], models.get('simple', models[model_type]), search_tool, tavily_tools[1]
+                )
+            else:
+                tool_name, _ = FAST_PRESET_TOOL_CALLS[preset_type]
+                preset_pipelines[key] = create_fast_preset_graph(
+                    preset_type, models[model_type], tools_by_name[tool_name]
+                )
+    return preset_pipelines[key]
+
+# 预设专用Agent只绑定该预设需要的工具（减少每次模型调用携带的工具定义），按 (预设类型, 模型类型) 创建一次后复用
+PRESET_TOOL_SUBSETS_ENABLED = os.getenv("PRESET_TOOL_SUBSETS", "true").lower() == "true"
+preset_agents = {}
+_preset_agents_lock = threading.Lock()
+
+def get_preset_tools(preset_type: Optional[str]) -> List[Any]:
+    """获取预设需要的工具，没有登记的预设类型返回全部工具"""
+    names = get_preset_tool_names(preset_type)
+    if not names:
+        return agent_tools
+    return [tools_by_name[name] for name in names if name in tools_by_name]
+
+def get_preset_agent(preset_type: Optional[str], model_type: str):
+    """获取预设专用的Agent，首次使用时创建；未启用或没有登记的预设类型返回通用Agent"""
+    if not PRESET_TOOL_SUBSETS_ENABLED or not get_preset_tool_names(preset_type) or model_type not in models:
+        return agents.get(model_type)
+    key = (preset_type, model_type)
+    with _preset_agents_lock:
+        if key not in preset_agents:
+            tools = get_preset_tools(preset_type)
+            # 独立的对话记忆：同一thread_id在通用Agent中的历史可能包含专用Agent没有绑定的工具调用
+            preset_agents[key] = create_react_agent(
+                model=models[model_type],
+                tools=tools,
+                checkpointer=MemorySaver() if model_type in checkpointers else None
+            )
+            print(f"🧰 已创建 {preset_type} 专用Agent（{MODEL_CONFIG[model_type]['name']}）: "
+                  f"{', '.join(tool.name for tool in tools)}")
+    return preset_agents[key]
+
+async def run_agent_query(prompt: str, thread_id: str = "web_session", model_type: str = "simple",
+                          preset_type: Optional[str] = None):
+    """运行 Agent 查询并返回结果，preset_type 供工具选择搜索档位"""
     if model_type not in agents:
         return {"success": False, "error": f"模型类型 {model_type} 未初始化"}
         
-    agent = agents[model_type]
+    agent = get_preset_agent(preset_type, model_type)
     model_name = MODEL_CONFIG[model_type]['name']
     
     # 根据模型类型决定是否使用thread_id配置
@@ -346,6 +738,8 @@ async def run_agent_query(prompt: str, thread_id: str = "web_session", model_typ
         config = RunnableConfig(configurable={"thread_id": thread_id})
         print(f"🤖 使用 {model_name} (记忆模式) 处理查询: {prompt[:50]}...")
     
+    preset_token = current_preset.set(preset_type)
+    thread_token = current_thread.set(thread_id)
     try:
         if config:
             result = await agent.ainvoke(
@@ -368,6 +762,87 @@ async def run_agent_query(prompt: str, thread_id: str = "web_session", model_typ
     except Exception as e:
         print(f"❌ {model_name} 查询处理失败: {str(e)}")
         return {"success": False, "error": str(e)}
+    finally:
+        current_preset.reset(preset_token)
+        current_thread.reset(thread_token)
+
+async def run_preset_pipeline(preset_type: str, prompt: str, user_input: str, thread_id: str = "web_session",
+                              model_type: Optional[str] = None):
+    """运行预设的固定流程并返回结果
+
+    使用记忆模式的模型时，流程与该预设的专用Agent共用记忆：从中读取本对话之前的内容，并把本轮问答写回，
+    追问（无论走固定流程还是Agent）都能看到之前的对话。
+    """
+    model_type = model_type or get_model_type_for_preset(preset_type)
+    print(f"🔀 使用 {preset_type} 流程（{MODEL_CONFIG[model_type]['name']}）处理: {user_input[:50]}...")
+    preset_token = current_preset.set(preset_type)
+    thread_token = current_thread.set(thread_id)
+    start = time.perf_counter()
+    memory_agent = get_preset_agent(preset_type, model_type) if model_type in checkpointers else None
+    config = RunnableConfig(configurable={"thread_id": thread_id})
+    try:
+        history = ""
+        if memory_agent is not None:
+            try:
+                snapshot = await memory_agent.aget_state(config)
+                history = format_history(snapshot.values.get("messages", []))
+            except Exception as e:
+                print(f"⚠️ 读取对话记忆失败: {e}")
+        state = await get_preset_pipeline(preset_type, model_type).ainvoke(
+            {"topic": user_input, "report_prompt": prompt, "history": history}
+        )
+        report = state.get("report")
+        if not report:
+            print(f"❌ {preset_type} 流程未生成结果")
+            return {"success": False, "error": "未收到回复"}
+        for error in state.get("errors", []):
+            print(f"⚠️ {error}")
+        if preset_type == 'research':
+            print(f"✅ 研究流程完成: {len(state.get('sub_queries', []))} 个子查询，"
+                  f"{len(state.get('summaries', []))} 个来源，耗时 {time.perf_counter() - start:.1f}秒")
+        else:
+            print(f"✅ {preset_type} 流程完成，耗时 {time.perf_counter() - start:.1f}秒")
+
+        if memory_agent is not None:
+            try:
+                await memory_agent.aupdate_state(
+                    config,
+                    {"messages": [HumanMessage(content=prompt), AIMessage(content=report)]},
+                    as_node="agent"
+                )
+            except Exception as e:
+                print(f"⚠️ 写入对话记忆失败: {e}")
+        result = {"success": True, "response": report}
+        if state.get("data") is not None:
+            result["data"] = state["data"]
+        return result
+
+    except Exception as e:
+        print(f"❌ {preset_type} 流程失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        current_preset.reset(preset_token)
+        current_thread.reset(thread_token)
+
+async def structure_preset_result(preset_type: str, model_type: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """把Agent的回复校验为预设结构，格式不符时用结构化输出转换一次
+
+    返回的 response 为规范的JSON文本，data 为解析后的对象；无法转换时原样返回。
+    """
+    text = message_text(result.get('response'))
+    data = validate_preset_data(preset_type, parse_json_block(text))
+    if data is None and model_type in models:
+        print(f"🔧 {preset_type} 回复格式不符，转换为结构化结果")
+        try:
+            data, _ = await ainvoke_preset_output(
+                models[model_type], preset_type,
+                f"请把下面的回答整理为结构化结果，不要编造回答中没有的信息：\n\n{text}"
+            )
+        except Exception as e:
+            print(f"❌ {preset_type} 结果转换失败: {e}")
+    if data is None:
+        return result
+    return {**result, "response": json.dumps(data, ensure_ascii=False), "data": data}
 
 def get_current_user():
     """获取当前登录用户信息"""
@@ -394,11 +869,41 @@ def auth_page():
     """用户认证页面"""
     return render_template('auth.html')
 
+def _accepts_encoding(encoding: str) -> bool:
+    """客户端是否接受指定的内容编码"""
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() == encoding and params.replace(' ', '') not in ('q=0', 'q=0.0'):
+            return True
+    return False
+
 @app.route('/generated/<filename>')
 def serve_generated_page(filename):
     """提供生成的网页文件"""
     try:
-        generated_path = os.path.join(os.path.dirname(__file__), 'generated_pages', filename)
+        blob_store = get_blob_store()
+        blob_info = blob_store.resolve(filename)
+        if blob_info:
+            content_hash = blob_info['content_hash']
+            if request.if_none_match.contains(content_hash):
+                return Response(status=304)
+            
+            # 客户端支持存储所用的压缩格式时直接发送压缩文件，否则边解压边发送
+            if _accepts_encoding(blob_store.encoding):
+                response = send_file(blob_store.blob_path(content_hash), mimetype='text/html')
+                response.headers['Content-Encoding'] = blob_store.encoding
+            else:
+                response = Response(
+                    blob_store.iter_decompressed(content_hash),
+                    mimetype='text/html',
+                    headers={'Content-Length': str(blob_info['content_size'])}
+                )
+            response.set_etag(content_hash)
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+        
+        # 兼容内容存储启用前直接保存在目录中的网页文件
+        generated_path = os.path.join(os.path.dirname(__file__), 'generated_pages', os.path.basename(filename))
         if os.path.exists(generated_path):
             with open(generated_path, 'r', encoding='utf-8') as f:
                 return f.read()
@@ -473,7 +978,7 @@ def logout():
     """用户登出"""
     try:
         auth_manager = get_auth_manager()
-        result = auth_manager.logout()
+        result = auth_manager.logout(session.get('access_token'))
         
         # 清除会话信息
         session.clear()
@@ -492,6 +997,25 @@ def get_user_info():
     else:
         return jsonify({"success": False, "message": "未登录"})
 
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """首页汇总数据：用户信息、统计信息和最近的提示词、网页记录（只验证一次令牌）"""
+    user = get_current_user()
+    if not user:
+        return jsonify({"success": False, "message": "请先登录"})
+    
+    try:
+        dashboard = get_history_manager().get_dashboard(user['id'], session.get('access_token'))
+        
+        return jsonify({
+            "success": True,
+            "user": user,
+            **dashboard
+        })
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"获取首页数据失败: {str(e)}"})
+
 # 用户历史记录路由
 @app.route('/api/history/prompts', methods=['GET'])
 def get_prompt_history():
@@ -501,8 +1025,9 @@ def get_prompt_history():
         return jsonify({"success": False, "message": "请先登录"})
     
     try:
-        limit = request.args.get('limit', 50, type=int)
+        limit = min(max(1, request.args.get('limit', 50, type=int)), MAX_PAGE_SIZE)
         prompt_type = request.args.get('type')
+        cursor = request.args.get('cursor')
         
         history_manager = get_history_manager()
         access_token = session.get('access_token')
@@ -515,7 +1040,7 @@ def get_prompt_history():
             })
         
         history = history_manager.get_user_prompt_history(
-            user['id'], limit, prompt_type, access_token
+            user['id'], limit, prompt_type, access_token, cursor
         )
         
         print(f"📊 获取用户 {user['id']} 的提示词历史: {len(history)} 条记录")
@@ -523,9 +1048,12 @@ def get_prompt_history():
         return jsonify({
             "success": True,
             "history": history,
-            "total": len(history)
+            "total": len(history),
+            "next_cursor": encode_history_cursor(history[-1]) if len(history) == limit else None
         })
         
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "message": f"获取历史记录失败: {str(e)}"})
 
@@ -537,7 +1065,8 @@ def get_webpage_history():
         return jsonify({"success": False, "message": "请先登录"})
     
     try:
-        limit = request.args.get('limit', 20, type=int)
+        limit = min(max(1, request.args.get('limit', 20, type=int)), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
         
         history_manager = get_history_manager()
         access_token = session.get('access_token')
@@ -549,19 +1078,144 @@ def get_webpage_history():
                 "error": "未找到用户访问令牌"
             })
         
-        history = history_manager.get_user_webpage_generations(user['id'], limit, access_token)
+        history = history_manager.get_user_webpage_generations(user['id'], limit, access_token, cursor)
         
         print(f"🌐 获取用户 {user['id']} 的网页生成历史: {len(history)} 条记录")
         
         return jsonify({
             "success": True,
             "history": history,
-            "total": len(history)
+            "total": len(history),
+            "next_cursor": encode_history_cursor(history[-1]) if len(history) == limit else None
         })
         
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "message": f"获取网页生成记录失败: {str(e)}"})
 
+@app.route('/api/history/prompts/<int:record_id>', methods=['GET'])
+def get_prompt_history_detail(record_id):
+    """获取单条提示词历史记录的完整回复"""
+    user = get_current_user()
+    if not user:
+        return jsonify({"success": False, "message": "请先登录"})
+    
+    try:
+        history_manager = get_history_manager()
+        record = history_manager.get_prompt_history_record(
+            user['id'], record_id, session.get('access_token')
+        )
+        
+        if record is None:
+            return jsonify({"success": False, "message": "记录不存在"}), 404
+        
+        return jsonify({"success": True, "record": record})
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"获取历史记录失败: {str(e)}"}), 500
+
+@app.route('/api/history/webpages/<int:record_id>', methods=['GET'])
+def get_webpage_history_detail(record_id):
+    """获取单条网页生成记录的完整HTML"""
+    user = get_current_user()
+    if not user:
+        return jsonify({"success": False, "message": "请先登录"})
+    
+    try:
+        history_manager = get_history_manager()
+        record = history_manager.get_webpage_generation_record(
+            user['id'], record_id, session.get('access_token')
+        )
+        
+        if record is None:
+            return jsonify({"success": False, "message": "记录不存在"}), 404
+        
+        return jsonify({"success": True, "record": record})
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"获取网页生成记录失败: {str(e)}"}), 500
+
+@app.route('/api/history/search', methods=['GET'])
+def search_history():
+    """全文搜索用户的提示词和网页生成记录"""
+    user = get_current_user()
+    if not user:
+        return jsonify({"success": False, "message": "请先登录"})
+    
+    try:
+        query = request.args.get('q', '').strip()
+        limit = min(max(1, request.args.get('limit', 20, type=int)), 50)
+        
+        if not query:
+            return jsonify({"success": False, "message": "请输入搜索关键词"})
+        
+        history_manager = get_history_manager()
+        results = history_manager.search_history(
+            user['id'], query, limit, session.get('access_token')
+        )
+        
+        return jsonify({
+            "success": True,
+            "results": results,
+            "total": len(results)
+        })
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"搜索历史记录失败: {str(e)}"})
+
+def _iter_ndjson(records, use_gzip: bool = False, chunk_size: int = 64 * 1024):
+    """把记录逐条序列化为NDJSON，攒够chunk_size后输出一块（可选gzip压缩）"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+    buffer = []
+    buffered = 0
+    
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+    
+    try:
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= chunk_size:
+                chunk = emit(b''.join(buffer))
+                buffer, buffered = [], 0
+                if chunk:
+                    yield chunk
+    except Exception as e:
+        # 响应头已经发出，只能在流末尾写入一行错误信息
+        print(f"❌ 导出历史记录中断: {e}")
+        buffer.append(json.dumps({"error": f"导出中断: {str(e)}"}, ensure_ascii=False).encode('utf-8') + b'\n')
+    
+    tail = emit(b''.join(buffer))
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+@app.route('/api/history/export', methods=['GET'])
+def export_history():
+    """以NDJSON流式导出用户的全部历史记录（gzip=1时输出gzip压缩文件）"""
+    user = get_current_user()
+    if not user:
+        return jsonify({"success": False, "message": "请先登录"})
+    
+    use_gzip = request.args.get('gzip') in ('1', 'true')
+    records = get_history_manager().iter_export_records(user['id'], session.get('access_token'))
+    filename = 'history-export.ndjson' + ('.gz' if use_gzip else '')
+    
+    print(f"📦 导出用户 {user['id']} 的历史记录")
+    
+    return Response(
+        stream_with_context(_iter_ndjson(records, use_gzip)),
+        mimetype='application/gzip' if use_gzip else 'application/x-ndjson',
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store'
+        }
+    )
+
 @app.route('/api/history/stats', methods=['GET'])
 def get_user_stats():
     """获取用户统计信息"""
@@ -571,7 +1225,7 @@ def get_user_stats():
     
     try:
         history_manager = get_history_manager()
-        stats = history_manager.get_user_statistics(user['id'])
+        stats = history_manager.get_user_statistics(user['id'], session.get('access_token'))
         
         return jsonify({
             "success": True,
@@ -581,8 +1235,176 @@ def get_user_stats():
     except Exception as e:
         return jsonify({"success": False, "message": f"获取统计信息失败: {str(e)}"})
 
+@app.route('/api/history/analytics', methods=['GET'])
+def get_user_analytics():
+    """获取用户使用分析（按小时或天的活跃度、模型类型占比、回复长度分布）"""
+    user = get_current_user()
+    if not user:
+        return jsonify({"success": False, "message": "请先登录"})
+    
+    try:
+        analytics = get_history_analytics().get_user_analytics(
+            user['id'],
+            days=request.args.get('days', 30, type=int),
+            granularity=request.args.get('granularity', 'day'),
+            tz_offset_minutes=request.args.get('tz_offset', 0, type=int),
+            access_token=session.get('access_token')
+        )
+        
+        return jsonify({
+            "success": True,
+            "analytics": analytics
+        })
+        
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "message": f"获取使用分析失败: {str(e)}"})
+
+@app.route('/api/tools/cache/stats', methods=['GET'])
+def get_tool_cache_stats():
+    """获取工具结果缓存、内容精简、搜索档位、Tavily调度、研究文档库和意图路由的统计"""
+    user = get_current_user()
+    if not user:
+        return jsonify({"success": False, "message": "请先登录"})
+    
+    return jsonify({
+        "success": True,
+        "stats": get_tool_cache().get_stats(),
+        "condensation": get_content_condenser().get_stats(),
+        "search_profiles": get_search_profile_stats().get_stats(),
+        "tavily": get_tavily_governor().get_stats(),
+        "local_search": get_local_search_index().get_stats() if SEARCH_BACKEND == "local" else None,
+        "research_store": get_research_store().get_stats(),
+        "intent_router": get_intent_router().get_stats() if INTENT_ROUTER_ENABLED else None
+    })
+
 # 删除未使用的 /api/chat 路由
 
+# 能以服务端身份写入时历史记录放入写后队列（不阻塞响应），否则在请求中用用户令牌直接写入
+HISTORY_QUEUE_ENABLED = history_queue_supported()
+if not HISTORY_QUEUE_ENABLED:
+    print("⚠️ 未配置SUPABASE_SERVICE_ROLE_KEY，历史记录写后队列未启用，改为使用用户令牌直接写入")
+
+def save_design_history(user_id: str, user_input: str, response_text: str,
+                        preset_type: str, model_type: str):
+    """保存AI设计的提示词历史和网页生成记录（user_id 为已认证的当前用户）"""
+    try:
+        if HISTORY_QUEUE_ENABLED:
+            history_queue = get_history_queue()
+            save_prompt = history_queue.enqueue_prompt_history
+            save_webpage = history_queue.enqueue_webpage_generation
+        else:
+            access_token = session.get('access_token')
+            # 确保access_token存在
+            if not access_token:
+                print("❌ 未找到用户访问令牌，无法保存历史记录")
+                return
+            history_manager = get_history_manager()
+            save_prompt = functools.partial(history_manager.save_prompt_history, access_token=access_token)
+            save_webpage = functools.partial(history_manager.save_webpage_generation, access_token=access_token)
+        
+        # 保存AI设计的提示词历史
+        save_prompt(user_id, user_input, response_text, preset_type, model_type)
+        print("💾 AI设计提示词历史记录已保存" + ("（写后队列）" if HISTORY_QUEUE_ENABLED else ""))
+        
+        # 尝试从响应中提取文件名
+        filename_match = re.search(r'ai_designed_webpage_(\d+)\.html', response_text)
+        if not filename_match:
+            return
+        filename = filename_match.group(0)
+        try:
+            # 优先使用设计师刚生成的内存结果，找不到时才查询内容存储
+            blob_info = pop_generated_blob(filename) or get_blob_store().resolve(filename)
+            if blob_info:
+                save_webpage(
+                    user_id, user_input, filename,
+                    blob_info['content_hash'], blob_info['content_size'], preset_type
+                )
+                print(f"🌐 网页生成记录已保存: {filename}")
+            else:
+                print(f"⚠️ 未找到生成的网页内容: {filename}")
+        except Exception as e:
+            print(f"❌ 保存网页生成记录失败: {e}")
+    except Exception as e:
+        print(f"❌ 保存用户历史记录失败: {e}")
+
+def thread_has_memory(preset_type: str, model_type: str, thread_id: str) -> bool:
+    """该预设在记忆模式的模型下是否已有本对话的记忆"""
+    if model_type not in checkpointers:
+        return False
+    try:
+        state = get_preset_agent(preset_type, model_type).get_state(
+            RunnableConfig(configurable={"thread_id": thread_id})
+        )
+        return bool(state.values.get("messages"))
+    except Exception as e:
+        print(f"⚠️ 读取对话记忆失败: {e}")
+        return False
+
+def execute_preset(preset_type: str, user_input: str, thread_id: str, declared: bool = True) -> Dict[str, Any]:
+    """按预设类型处理请求：客户端未指定预设时由意图路由选择预设和模型档位，有固定流程时走固定流程，否则走预设专用Agent
+
+    客户端指定的预设在查询足够简单时改用该预设最便宜的模型档位（见 DECLARED_PRESET_DOWNGRADE_MAX_COMPLEXITY），
+    对话已有该预设的记忆时继续使用配置的模型，避免追问丢失上下文。
+    """
+    decision = None
+    start = time.perf_counter()
+    declared_model = get_model_type_for_preset(preset_type) if declared else None
+    if INTENT_ROUTER_ENABLED:
+        decision = get_intent_router().route(
+            user_input, preset_type if declared else None, models.keys(), declared_model
+        )
+        preset_type, model_type = decision['preset_type'], decision['model_type']
+    else:
+        preset_type = preset_type or 'custom'
+        model_type = choose_declared_model_type(
+            preset_type, user_input, get_model_type_for_preset(preset_type), models.keys()
+        )
+    if declared and model_type != declared_model and thread_has_memory(preset_type, declared_model, thread_id):
+        model_type = declared_model
+        if decision:
+            decision['model_type'] = model_type
+
+    # 固定流程通过结构化输出传入结果结构，提示词不需要附带JSON格式说明
+    pipeline = get_preset_pipeline(preset_type, model_type)
+    prompt = build_preset_prompt(preset_type, user_input, with_format=pipeline is None)
+    if not prompt:
+        return {"success": False, "error": "无效的预设类型"}
+
+    # 使用全局事件循环运行异步函数
+    if pipeline is not None:
+        result = run_async_in_loop(run_preset_pipeline(preset_type, prompt, user_input, thread_id, model_type))
+    else:
+        result = run_async_in_loop(run_agent_query(prompt, thread_id, model_type, preset_type))
+        if result.get('success') and get_preset_schema(preset_type):
+            result = run_async_in_loop(structure_preset_result(preset_type, model_type, result))
+
+    if decision:
+        get_intent_router().record_outcome(decision['id'], bool(result.get('success')), time.perf_counter() - start)
+        result["route"] = {key: decision[key] for key in ('preset_type', 'model_type', 'source', 'confidence')}
+
+    # 如果用户已登录且是AI设计任务（客户端指定或由意图路由选择），保存历史记录
+    if result.get('success') and preset_type == 'ai_design':
+        user = get_current_user()
+        if user:
+            save_design_history(user['id'], user_input, result.get('response', ''), preset_type, model_type)
+    return result
+
+@app.route('/api/query', methods=['POST'])
+def auto_query():
+    """处理自由问题：由意图路由选择预设类型、模型档位和工具"""
+    try:
+        data = request.get_json()
+        user_input = data.get('input', '')
+        thread_id = data.get('thread_id', 'web_session')
+        if not user_input.strip():
+            return jsonify({"success": False, "error": "请输入问题"})
+        return jsonify(execute_preset(None, user_input, thread_id, declared=False))
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
 @app.route('/api/preset/<preset_type>', methods=['POST'])
 def preset_query(preset_type):
     """处理预设问题"""
@@ -591,185 +1413,10 @@ def preset_query(preset_type):
         user_input = data.get('input', '')
         thread_id = data.get('thread_id', 'web_session')
         
-        prompts = {
-            'weather': f"""请搜索 {user_input} 今天的天气情况，获取详细信息后，严格按照以下JSON格式返回，不要包含任何其他文字说明：
-
-{{
-    "type": "weather",
-    "city": "{user_input}",
-    "temperature": {{"current": "具体温度值", "high": "最高温度", "low": "最低温度"}},
-    "condition": "天气现象",
-    "humidity": "湿度值",
-    "wind": "风力风向", 
-    "airQuality": "空气质量状况",
-    "suggestions": ["生活建议1", "生活建议2", "生活建议3"],
-    "details": "天气详细描述"
-}}
-
-重要：只返回JSON数据，不要添加任何解释文字。""",
-            'news': f"""请搜索关于 '{user_input}' 的最新新闻，获取信息后严格按照以下JSON格式返回：
-
-{{
-    "type": "news",
-    "topic": "{user_input}",
-    "articles": [
-        {{
-            "title": "新闻标题",
-            "summary": "新闻摘要",
-            "source": "新闻来源",
-            "time": "发布时间"
-        }}
-    ],
-    "summary": "整体新闻概述",
-    "keyPoints": ["关键点1", "关键点2", "关键点3"]
-}}
-
-重要：只返回JSON数据，不要添加任何解释文字。""",
-            'extract': f"""请使用内容提取工具从URL：{user_input} 提取内容，分析后严格按照以下JSON格式返回：
-
-{{
-    "type": "extract",
-    "url": "{user_input}",
-    "title": "网页标题",
-    "description": "网页描述",
-    "mainContent": "主要内容摘要",
-    "keyFeatures": ["特色功能1", "特色功能2", "特色功能3"],
-    "technologies": ["技术栈1", "技术栈2"],
-    "summary": "整体分析总结"
-}}
-
-重要：只返回JSON数据，不要添加任何解释文字。""",
-            'research': f"""请对主题 '{user_input}' 进行研究：使用搜索工具获取信息，如有重要链接则提取内容，综合分析后严格按照以下JSON格式返回：
-
-{{
-    "type": "research",
-    "topic": "{user_input}",
-    "introduction": "研究背景介绍",
-    "keyFindings": ["核心发现1", "核心发现2", "核心发现3"],
-    "detailedAnalysis": "详细分析内容",
-    "trends": ["趋势1", "趋势2", "趋势3"],
-    "challenges": ["挑战1", "挑战2"],
-    "opportunities": ["机会1", "机会2"],
-    "conclusion": "研究结论",
-    "sources": ["资料来源1", "资料来源2"]
-}}
-
-重要：只返回JSON数据，不要添加任何解释文字。""",
-            'calculate': f"""请使用计算工具计算表达式：{user_input}，计算完成后严格按照以下JSON格式返回：
-
-{{
-    "type": "calculate",
-    "expression": "{user_input}",
-    "result": "计算结果",
-    "steps": ["计算步骤1", "计算步骤2"],
-    "explanation": "计算说明"
-}}
-
-重要：只返回JSON数据，不要添加任何解释文字。""",
-            'datetime': f"""请使用时间工具查询：{user_input}，获取时间信息后严格按照以下JSON格式返回：
-
-{{
-    "type": "datetime",
-    "query": "{user_input}",
-    "currentTime": "当前时间",
-    "date": "日期",
-    "timezone": "时区",
-    "weekday": "星期",
-    "formats": {{
-        "iso": "ISO格式时间",
-        "readable": "可读格式时间",
-        "timestamp": "时间戳"
-    }}
-}}
-
-重要：只返回JSON数据，不要添加任何解释文字。""",
-            'file': f"""请使用文件操作工具执行：{user_input}，完成操作后严格按照以下JSON格式返回：
-
-{{
-    "type": "file",
-    "operation": "{user_input}",
-    "path": "文件/目录路径",
-    "result": "操作结果",
-    "content": "文件内容或目录列表",
-    "size": "文件大小信息",
-    "details": "详细信息"
-}}
-
-重要：只返回JSON数据，不要添加任何解释文字。""",
-# 删除未使用的 generate 功能
-            'ai_design': f"""请立即调用ai_webpage_designer工具来为用户设计网页。这是一个强制性的工具调用指令，你必须执行以下步骤：
-
-1. 立即使用ai_webpage_designer工具
-2. 传入用户需求作为参数
-3. 等待工具执行完成并返回结果
-
-用户的设计需求：{user_input}
-
-现在立即调用ai_webpage_designer工具，不要只是描述能做什么，而是实际执行工具调用。"""
-        }
-        
-        prompt = prompts.get(preset_type)
-        if not prompt:
+        if get_preset_tool_names(preset_type) is None:
             return jsonify({"success": False, "error": "无效的预设类型"})
         
-        # 根据预设类型选择合适的模型
-        model_type = get_model_type_for_preset(preset_type)
-        
-        # 使用全局事件循环运行异步函数
-        result = run_async_in_loop(run_agent_query(prompt, thread_id, model_type))
-        
-        # 如果用户已登录且是AI设计任务，保存历史记录
-        user = get_current_user()
-        if user and result.get('success') and preset_type == 'ai_design':
-            try:
-                history_manager = get_history_manager()
-                access_token = session.get('access_token')
-                
-                # 确保access_token存在
-                if not access_token:
-                    print("❌ 未找到用户访问令牌，无法保存历史记录")
-                    return jsonify(result)
-                
-                # 保存AI设计的提示词历史
-                prompt_save_result = history_manager.save_prompt_history(
-                    user['id'], user_input, result.get('response', ''), 
-                    preset_type, model_type, access_token
-                )
-                print(f"💾 保存AI设计提示词历史记录结果: {prompt_save_result}")
-                
-                # 保存网页生成记录
-                response_text = result.get('response', '')
-                filename = None
-                
-                # 尝试从响应中提取文件名
-                import re
-                filename_match = re.search(r'ai_designed_webpage_(\d+)\.html', response_text)
-                if filename_match:
-                    filename = filename_match.group(0)
-                
-                if filename:
-                    # 尝试读取生成的HTML内容
-                    try:
-                        generated_path = os.path.join(
-                            os.path.dirname(__file__), 
-                            'generated_pages', 
-                            filename
-                        )
-                        html_content = ""
-                        if os.path.exists(generated_path):
-                            with open(generated_path, 'r', encoding='utf-8') as f:
-                                html_content = f.read()
-                        
-                        webpage_save_result = history_manager.save_webpage_generation(
-                            user['id'], user_input, html_content, filename, preset_type, access_token
-                        )
-                        print(f"🌐 保存网页生成记录结果: {webpage_save_result}")
-                    except Exception as e:
-                        print(f"❌ 保存网页生成记录失败: {e}")
-            except Exception as e:
-                print(f"❌ 保存用户历史记录失败: {e}")
-        
-        return jsonify(result)
+        return jsonify(execute_preset(preset_type, user_input, thread_id))
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
@@ -783,6 +1430,10 @@ def cleanup():
     
     if _executor:
         _executor.shutdown(wait=True)
+    
+    # 尽量把写后队列中的记录写完，未写完的保留在本地日志中
+    shutdown_history_queue()
+    shutdown_history_compactor()
 
 atexit.register(cleanup)
 
@@ -797,6 +1448,10 @@ if __name__ == '__main__':
     get_event_loop()
     print("✅ 事件循环初始化完成")
     
+    # 配置了HISTORY_HOT_DAYS时启动历史记录归档任务
+    if get_history_compactor():
+        print("🗜️ 历史记录归档任务已启动")
+    
     try:
         app.run(debug=True, host='0.0.0.0', port=8080)
     finally: